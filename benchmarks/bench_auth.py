@@ -0,0 +1,72 @@
+"""Login and registration latency with many registered users, comparing the AuthService lookups
+with the full-table reads Login and Register used before. Users get the fast legacy hash so the
+numbers show the database side; calibrate_password_cost measures the hashing itself.
+
+Usage: python -m benchmarks.bench_auth [users]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from modules.auth import AuthService, legacy_hash_password, check_password
+from modules.database import DatabaseManager
+
+
+def legacy_login(db_manager, email, password) -> bool:
+    users = {row[0]: row[1] for row in db_manager.load_data('users')}
+    return email in users and check_password(password, users[email])
+
+
+def legacy_register(db_manager, email, password) -> bool:
+    emails_in_db = [row[0] for row in db_manager.search('users', ['email'])]
+    if email in emails_in_db:
+        return False
+    db_manager.add_record('users', email, legacy_hash_password(password))
+    return True
+
+
+def service_login(auth, email, password) -> bool:
+    stored_password = auth.get_password_hash(email)
+    return stored_password is not None and check_password(password, stored_password)
+
+
+def timed(func, calls) -> float:
+    """Returns the mean latency in milliseconds"""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    password_hash = legacy_hash_password('secret')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = DatabaseManager(os.path.join(tmp, 'bench.db'))
+        db_manager.create_tables()
+        db_manager.add_records('users', ((f'user{i}@example.com', password_hash) for i in range(users)))
+        auth = AuthService(db_manager)
+        rng = random.Random(0)
+        emails = [f'user{rng.randrange(users)}@example.com' for _ in range(1000)]
+
+        legacy_calls = 3  # Each legacy call reads the whole table
+        results = {
+            'legacy login': timed(lambda i: legacy_login(db_manager, emails[i], 'secret'), legacy_calls),
+            'legacy register': timed(lambda i: legacy_register(db_manager, f'old{i}@example.com', 'secret'),
+                                     legacy_calls),
+            'login (cold cache)': timed(lambda i: service_login(auth, emails[i], 'secret'), len(emails)),
+            'login (warm cache)': timed(lambda i: service_login(auth, emails[i], 'secret'), len(emails)),
+            'register': timed(lambda i: auth.register(f'new{i}@example.com', password_hash), 1000),
+            'register (taken)': timed(lambda i: auth.register(emails[i], password_hash), 1000),
+        }
+
+        print(f"{users} users")
+        for name, latency in results.items():
+            print(f"{name:>20}: {latency:9.3f} ms")
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    main()
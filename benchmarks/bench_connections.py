@@ -0,0 +1,49 @@
+"""Compares the per-call connection path with the pooled one.
+
+Usage: python -m benchmarks.bench_connections [books] [calls]
+"""
+import os
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import build_catalog
+
+
+def per_call_lookup(db_manager, book_id):
+    """The pre-pool code path: a new connection for every call"""
+    with db_manager.create_connection() as conn:
+        curs = conn.cursor()
+        curs.execute("PRAGMA table_info(books)")
+        curs.fetchall()
+        curs.execute("SELECT * FROM books WHERE book_id = ?", (book_id,))
+        return curs.fetchall()
+
+
+def pooled_lookup(db_manager, book_id):
+    db_manager.get_columns('books')
+    return db_manager.search('books', conditions={'book_id': book_id})
+
+
+def measure(func, db_manager, calls) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        func(db_manager, i % 1000 + 1)
+    return time.perf_counter() - start
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    calls = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = build_catalog(os.path.join(tmp, 'bench.db'), books)
+
+        for name, func in (('per-call', per_call_lookup), ('pooled', pooled_lookup)):
+            elapsed = measure(func, db_manager, calls)
+            print(f"{name:>8}: {calls} calls in {elapsed:.3f}s ({elapsed / calls * 1e6:.1f} us/call)")
+
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Checks that exports stream: resident memory stays flat while a large books table is written out.
+
+Prints the resident set size (without the memory-mapped database file) sampled after every batch for
+each format, then the peak RSS of load_data (fetchall) on the same table for comparison. Exits with an
+error if an export grew the RSS by more than MAX_GROWTH_MB.
+
+Usage: python -m benchmarks.bench_export [books] [formats, e.g. csv,jsonl,parquet]
+"""
+import os
+import sys
+import resource
+import tempfile
+import time
+from benchmarks.synthetic import build_catalog
+from modules.export import export_table
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+MAX_GROWTH_MB = 128  # Peak RSS during an export over the RSS before it: a few batches, plus pyarrow once imported
+
+
+def rss_mb() -> float:
+    """Returns the current resident set size without file-backed pages, falling back to the peak RSS
+    where /proc isn't available. The database file is memory-mapped (mmap_size), so pages it reads
+    would otherwise count as if the export held them"""
+    try:
+        with open('/proc/self/statm') as file:
+            _, resident, shared = file.read().split()[:3]
+            return (int(resident) - int(shared)) * PAGE_SIZE / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 5000000
+    formats = sys.argv[2].split(',') if len(sys.argv) > 2 else ['csv', 'jsonl']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db_manager = build_catalog(os.path.join(tmp, 'bench.db'), books)
+        print(f"Built {books} books in {time.perf_counter() - start:.1f}s, RSS {rss_mb():.0f} MB")
+
+        print(f"{'format':<10}{'rows':>10}{'seconds':>10}{'before MB':>10}{'last MB':>10}{'max MB':>10}")
+        failed = []
+        for extension in formats:
+            before = rss_mb()
+            samples = []
+            start = time.perf_counter()
+            written = export_table(db_manager, 'books', os.path.join(tmp, f'books.{extension}'), batch_size=10000,
+                                   progress=lambda count: samples.append(rss_mb()))
+            growth = max(samples) - before
+            if growth > MAX_GROWTH_MB:
+                failed.append(extension)
+            print(f"{extension:<10}{written:>10}{time.perf_counter() - start:>10.1f}"
+                  f"{before:>10.0f}{samples[-1]:>10.0f}{max(samples):>10.0f}"
+                  f"  +{growth:.0f} MB {'FAIL' if growth > MAX_GROWTH_MB else 'PASS'}")
+
+        # Last, since the peak it leaves behind would hide the exports' own memory use
+        rows = db_manager.load_data('books')
+        print(f"{'fetchall':<10}{len(rows):>10}{'':>10}{'':>10}{rss_mb():>10.0f}"
+              f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10:>10.0f}")
+
+        db_manager.pool.close()
+
+    print(f"target: exports grow RSS by <= {MAX_GROWTH_MB} MB {'FAIL: ' + ', '.join(failed) if failed else 'PASS'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
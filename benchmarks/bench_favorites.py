@@ -0,0 +1,121 @@
+"""Favorites writes from concurrent writer processes: a commit per change against the FavoritesWriteQueue.
+
+Every writer process clicks "add to favorites" or "remove" for its own users as fast as it can, either
+committing every click (the app before the queue) or through a FavoritesWriteQueue, which is closed
+at the end so its last changes are written too. Reports changes per second (all writers start together,
+until the last one is done), click latency and the commits made, and checks that both ways leave the
+same favorites table. --synchronous FULL makes every commit wait for the disk, as it would on a
+durable setup; the app's NORMAL doesn't sync WAL commits.
+
+Usage: python -m benchmarks.bench_favorites [--writers 1,2,4] [--changes N] [--synchronous NORMAL|FULL]
+"""
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from benchmarks.synthetic import build_dataset, zipf_book_id
+from modules import metrics
+from modules.cache import CatalogCache
+from modules.database import DatabaseManager
+from modules.services import LibraryService
+from modules.writeback import FavoritesWriteQueue
+
+
+def clicks(writer: int, writers: int, changes: int, books: int, users: int):
+    """Yields the (add, email, book_ids) changes of one writer, to users no other writer changes"""
+    rng = random.Random(writer)
+    own_users = range(writer, users, writers)
+    for _ in range(changes):
+        email = f'user{rng.choice(own_users)}@example.com'
+        book_ids = [zipf_book_id(rng, books) for _ in range(rng.randint(1, 3))]
+        yield rng.random() < 0.6, email, book_ids
+
+
+def run_writer(db_path: str, synchronous: str, queued: bool, writer: int, writers: int, changes: int, books: int,
+               users: int, barrier, results) -> None:
+    metrics.enable()
+    db_manager = DatabaseManager(db_path, pool_size=1, synchronous=synchronous)
+    write_queue = FavoritesWriteQueue(db_manager) if queued else None
+    service = LibraryService(db_manager, CatalogCache(db_manager), write_queue)  # As the Library window does
+    latencies = []
+    changes = list(clicks(writer, writers, changes, books, users))
+    barrier.wait()
+    start = time.perf_counter()
+    for add, email, book_ids in changes:
+        clicked = time.perf_counter()
+        if add:
+            service.add_favorites(email, book_ids)
+        else:
+            service.remove_favorites(email, book_ids)
+        latencies.append((time.perf_counter() - clicked) * 1000)
+    if write_queue is not None:
+        write_queue.close()
+    end = time.perf_counter()
+    commits = metrics.REGISTRY.stats('favorites.flush').calls if queued else len(changes)
+    results.put((start, end, latencies, commits))
+    db_manager.pool.close()
+
+
+def run(db_path: str, synchronous: str, queued: bool, writers: int, changes: int, books: int, users: int) -> dict:
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    barrier = context.Barrier(writers)
+    processes = [context.Process(target=run_writer, args=(db_path, synchronous, queued, writer, writers, changes,
+                                                          books, users, barrier, results))
+                 for writer in range(writers)]
+    for process in processes:
+        process.start()
+    starts, ends, latencies, commits = [], [], [], 0
+    for _ in processes:
+        start, end, writer_latencies, writer_commits = results.get()
+        starts.append(start)
+        ends.append(end)
+        latencies.extend(writer_latencies)
+        commits += writer_commits
+    for process in processes:
+        process.join()
+    latencies.sort()
+    return {'rate': writers * changes / (max(ends) - min(starts)), 'p50': latencies[len(latencies) // 2],
+            'p99': latencies[int(len(latencies) * 0.99)], 'commits': commits}
+
+
+def favorites_of(db_path: str) -> list:
+    db_manager = DatabaseManager(db_path)
+    rows = sorted(db_manager.load_data('favorites'))
+    db_manager.pool.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark favorites writes with and without the write queue")
+    parser.add_argument('--writers', default='1,2,4', help="comma-separated writer process counts (default: 1,2,4)")
+    parser.add_argument('--changes', type=int, default=2000, help="changes per writer (default: 2000)")
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--synchronous', default='NORMAL', choices=['NORMAL', 'FULL'])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, 'template.db')
+        build_dataset(template, args.books, args.users).pool.close()
+
+        print(f"{args.changes} changes per writer, synchronous={args.synchronous}, {os.cpu_count()} CPUs\n")
+        print(f"{'writers':>8}{'mode':>10}{'changes/s':>12}{'p50 ms':>9}{'p99 ms':>9}{'commits':>9}")
+        for writers in map(int, args.writers.split(',')):
+            tables = []
+            for queued in (False, True):
+                db_path = os.path.join(tmp, f'{writers}-{queued}.db')
+                shutil.copy(template, db_path)
+                result = run(db_path, args.synchronous, queued, writers, args.changes, args.books, args.users)
+                tables.append(favorites_of(db_path))
+                print(f"{writers:>8}{'queued' if queued else 'per-row':>10}{result['rate']:>12.0f}"
+                      f"{result['p50']:>9.3f}{result['p99']:>9.3f}{result['commits']:>9}")
+            if tables[0] != tables[1]:
+                print("  The favorites tables differ!")
+
+
+if __name__ == '__main__':
+    main()
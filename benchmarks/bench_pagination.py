@@ -0,0 +1,77 @@
+"""Compares keyset pagination with OFFSET, and get_random_data with ORDER BY RANDOM().
+
+Usage: python -m benchmarks.bench_pagination [books]
+"""
+import os
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import build_catalog
+
+PAGE_SIZE = 50
+
+
+def time_query(func, repeats=5) -> float:
+    """Returns the best of several runs in milliseconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def offset_page(db_manager, offset, sort_by='book_id', filters=None):
+    where, params = db_manager.build_filters('books', filters)
+    with db_manager.connection() as conn:
+        return conn.execute(f"SELECT * FROM books{where} ORDER BY {sort_by}, book_id LIMIT ? OFFSET ?",
+                            (*params, PAGE_SIZE, offset)).fetchall()
+
+
+def order_by_random(db_manager, sample_size):
+    with db_manager.connection() as conn:
+        return conn.execute("SELECT * FROM books ORDER BY RANDOM() LIMIT ?", (sample_size,)).fetchall()
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db_manager = build_catalog(os.path.join(tmp, 'bench.db'), books)
+        print(f"Built {books} books in {time.perf_counter() - start:.1f}s")
+
+        cases = [
+            ('book_id', None),
+            ('author', None),
+            ('num_pages', {'category': 'fantasy', 'cover_type': ['Hardback', 'Paperback']}),
+        ]
+        print(f"{'sort / page':<28}{'keyset ms':>12}{'offset ms':>12}")
+        for sort_by, filters in cases:
+            matches = db_manager.count_rows('books', filters)
+            for fraction in (0.0, 0.5, 0.99):
+                offset = int(matches * fraction) // PAGE_SIZE * PAGE_SIZE
+                # The keyset cursor of the same page is the last row of the page before it
+                previous = offset_page(db_manager, offset - 1, sort_by, filters)[:1] if offset else []
+                after = None
+                if previous:
+                    row = previous[0]
+                    column = db_manager.get_columns('books').index(sort_by)
+                    after = row[0] if sort_by == 'book_id' else (row[column], row[0])
+
+                keyset_ms = time_query(lambda: db_manager.paginate('books', filters, sort_by, after=after,
+                                                                   limit=PAGE_SIZE))
+                offset_ms = time_query(lambda: offset_page(db_manager, offset, sort_by, filters))
+                print(f"{f'{sort_by} @ {offset}':<28}{keyset_ms:>12.2f}{offset_ms:>12.2f}")
+
+        print(f"\n{'sample size':<28}{'sampler ms':>12}{'random() ms':>12}")
+        for sample_size in (1, 10, 100, 1000):
+            sampler_ms = time_query(lambda: db_manager.get_random_data('books', sample_size))
+            random_ms = time_query(lambda: order_by_random(db_manager, sample_size), repeats=3)
+            print(f"{sample_size:<28}{sampler_ms:>12.2f}{random_ms:>12.2f}")
+
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    main()
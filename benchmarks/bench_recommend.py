@@ -0,0 +1,118 @@
+"""Builds the recommendation model over synthetic favorites and measures it.
+
+Reports the time and peak memory of a full build, the time to refresh after a few users changed
+their favorites and to read a user's recommendations. For quality, one favorite of some users is
+held out before the build: the hit rate is the share of them recommended back among the top K,
+compared with recommending the most favored books to everyone.
+
+The favorites of benchmarks.synthetic are drawn independently of the user, leaving nothing to learn
+but popularity. Here users have tastes instead: most of their favorites come from one or two of
+TASTES clusters of books, the rest from the whole catalog.
+
+Usage: python -m benchmarks.bench_recommend [--books N] [--users N] [--holdout N]
+"""
+import os
+import time
+import random
+import argparse
+import resource
+import tempfile
+from benchmarks.synthetic import build_catalog, generate_users, zipf_book_id
+from modules.recommend import Recommender
+from modules.services import LibraryService
+
+TASTES = 2000
+OWN_TASTE = 0.7  # Share of favorites from the user's clusters
+
+
+def generate_taste_favorites(users: int, books: int, per_user: int = 10, seed: int = 0):
+    """Yields (email, book_id) favorites rows. Book b is in cluster (b - 1) % TASTES, within a cluster and
+    across the catalog popularity follows a Zipf-like law"""
+    rng = random.Random(seed)
+    cluster_size = books // TASTES
+    for user in range(users):
+        tastes = rng.sample(range(TASTES), rng.randint(1, 2))
+        book_ids = set()
+        for _ in range(rng.randint(1, 2 * per_user)):
+            if rng.random() < OWN_TASTE:
+                book_ids.add(rng.choice(tastes) + (zipf_book_id(rng, cluster_size) - 1) * TASTES + 1)
+            else:
+                book_ids.add(zipf_book_id(rng, books))
+        for book_id in sorted(book_ids):
+            yield f'user{user}@example.com', book_id
+
+
+def hold_out(db_manager, users: int, count: int, rng: random.Random) -> dict:
+    """Deletes one favorite of count random users with at least two and returns {email: book_id}"""
+    held_out = {}
+    for user in rng.sample(range(users), min(users, count * 3)):
+        email = f'user{user}@example.com'
+        book_ids = [row[0] for row in db_manager.search('favorites', ['book_id'], {'email': email})]
+        if len(book_ids) >= 2:
+            held_out[email] = rng.choice(book_ids)
+            if len(held_out) == count:
+                break
+    db_manager.delete_rows('favorites', ['email', 'book_id'], list(held_out.items()))
+    return held_out
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation model")
+    parser.add_argument('--books', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--holdout', type=int, default=2000, help="users with a held-out favorite (default: 2000)")
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db_manager = build_catalog(os.path.join(tmp, 'recommend.db'), args.books)
+        with db_manager.connection() as conn:
+            conn.executemany("INSERT INTO users VALUES (?, ?)", generate_users(args.users, 'x'))
+            conn.executemany("INSERT INTO favorites VALUES (?, ?)", generate_taste_favorites(args.users, args.books))
+        favorites = db_manager.count_rows('favorites')
+        print(f"Built {args.books} books, {args.users} users and {favorites} favorites "
+              f"in {time.perf_counter() - start:.1f}s")
+        held_out = hold_out(db_manager, args.users, args.holdout, rng)
+
+        recommender = Recommender(db_manager)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        users = recommender.build()
+        build_s = time.perf_counter() - start
+        peak_mb = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+        print(f"Full build: {build_s:.1f}s for {users} users, peak memory +{peak_mb:.0f} MB, "
+              f"{recommender.model['similarity'].nnz} similar book pairs kept")
+
+        service = LibraryService(db_manager)
+        hits = sum(book_id in {row[0] for row in service.recommended_books(email, recommender.top_k)}
+                   for email, book_id in held_out.items())
+        with db_manager.connection() as conn:
+            popular = [row[0] for row in conn.execute(
+                "SELECT book_id FROM favorites GROUP BY book_id ORDER BY COUNT(*) DESC LIMIT ?",
+                (recommender.top_k * 2,))]
+        popular_hits = 0
+        for email, book_id in held_out.items():
+            favored = set(service.favorite_ids(email))
+            popular_hits += book_id in [book for book in popular if book not in favored][:recommender.top_k]
+        print(f"Hit rate@{recommender.top_k} of {len(held_out)} held-out favorites: {hits / len(held_out):.1%} "
+              f"(most favored books: {popular_hits / len(held_out):.1%})")
+
+        for changed in (10, 100, 1000):
+            for user in rng.sample(range(args.users), changed):
+                service.add_favorites(f'user{user}@example.com', [rng.randint(1, args.books)])
+            start = time.perf_counter()
+            recomputed = recommender.refresh()
+            print(f"Refresh after {changed} users changed favorites: {(time.perf_counter() - start) * 1000:.0f} ms "
+                  f"({recomputed} users recomputed)")
+
+        emails = [f'user{user}@example.com' for user in rng.sample(range(args.users), 1000)]
+        start = time.perf_counter()
+        for email in emails:
+            service.recommended_books(email, recommender.top_k)
+        print(f"Reading a user's recommendations: {(time.perf_counter() - start) / len(emails) * 1000:.3f} ms")
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Compares FTS5 search_books with a LIKE '%...%' scan over the same catalog.
+
+Usage: python -m benchmarks.bench_search [books]
+"""
+import os
+import sys
+import tempfile
+import time
+from benchmarks.synthetic import build_catalog
+
+QUERIES = ['kalomi', 'drasil vortha', 'renul', 'mortalson', 'horror', 'tha']
+
+
+def like_scan(db_manager, query, limit=50):
+    """Case-insensitive substring match of every word in any of the searchable columns.
+    Like search_books it counts all matches first, which is what the status label needs"""
+    words = query.split()
+    condition = ' AND '.join(['(name LIKE ? OR author LIKE ? OR category LIKE ?)'] * len(words))
+    params = [f'%{word}%' for word in words for _ in range(3)]
+    with db_manager.connection() as conn:
+        conn.execute(f"SELECT COUNT(*) FROM books WHERE {condition}", params).fetchone()
+        return conn.execute(f"SELECT * FROM books WHERE {condition} LIMIT ?", (*params, limit)).fetchall()
+
+
+def time_query(func, repeats=5) -> float:
+    """Returns the best of several runs in milliseconds"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        db_manager = build_catalog(os.path.join(tmp, 'bench.db'), books)
+        print(f"Built {books} books with the search index in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'query':<20}{'matches':>10}{'fts5 ms':>10}{'like ms':>10}")
+        for query in QUERIES:
+            matches = db_manager.count_search_results(query)
+            fts_ms = time_query(lambda: (db_manager.count_search_results(query), db_manager.search_books(query, 50)))
+            like_ms = time_query(lambda: like_scan(db_manager, query))
+            print(f"{query:<20}{matches:>10}{fts_ms:>10.2f}{like_ms:>10.2f}")
+
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    main()
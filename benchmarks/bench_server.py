@@ -0,0 +1,137 @@
+"""Load test of the HTTP API: requests per second and latency percentiles as server workers are added.
+
+Builds a synthetic library, then for every worker count starts the server and drives it from several
+client processes, each keeping a set of keep-alive connections busy for a fixed time. The request mix
+is mostly reads (book pages, filtered pages, search, favorites) with some favorites changes.
+
+Usage: python -m benchmarks.bench_server [--books N] [--users N] [--workers 1,2,4] [--seconds S]
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import statistics
+import multiprocessing
+from benchmarks.synthetic import build_dataset
+from modules.server import Server
+
+QUERIES = ['kalomi', 'drasil vortha', 'renul', 'mortalson', 'horror', 'tha']
+MIX = [('books', 30), ('filtered', 20), ('search', 20), ('favorites', 25), ('change', 5)]
+
+
+def make_request(rng: random.Random, books: int, users: int) -> tuple:
+    """Returns a (kind, method, path, body) request drawn from MIX"""
+    kind = rng.choices([name for name, _ in MIX], [weight for _, weight in MIX])[0]
+    email = f'user{rng.randrange(users)}@example.com'
+    if kind == 'books':
+        return kind, 'GET', '/books?limit=50', None
+    if kind == 'filtered':
+        return kind, 'GET', '/books?category=fantasy,horror&min_pages=500&sort=author&limit=50', None
+    if kind == 'search':
+        return kind, 'GET', f'/search?q={rng.choice(QUERIES).replace(" ", "+")}&limit=50', None
+    if kind == 'favorites':
+        return kind, 'GET', f'/users/{email}/favorites?limit=50', None
+    body = json.dumps({'book_ids': [rng.randint(1, books)]})
+    return kind, rng.choice(['POST', 'DELETE']), f'/users/{email}/favorites', body
+
+
+async def send(reader, writer, method: str, path: str, body) -> int:
+    payload = (body or '').encode()
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n\r\n".encode()
+                 + payload)
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    length = next(int(line.split(b':')[1]) for line in head.split(b'\r\n')
+                  if line.lower().startswith(b'content-length'))
+    await reader.readexactly(length)
+    return status
+
+
+async def drive(port: int, connections: int, seconds: float, books: int, users: int, seed: int) -> dict:
+    """Keeps connections busy until the deadline, returning latencies (ms) per request kind and error count"""
+    latencies = {name: [] for name, _ in MIX}
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def connection(index):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + index)
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while time.perf_counter() < deadline:
+            kind, method, path, body = make_request(rng, books, users)
+            start = time.perf_counter()
+            status = await send(reader, writer, method, path, body)
+            latencies[kind].append((time.perf_counter() - start) * 1000)
+            errors += status != 200
+        writer.close()
+
+    await asyncio.gather(*(connection(index) for index in range(connections)))
+    return {'latencies': latencies, 'errors': errors}
+
+
+def run_client(port, connections, seconds, books, users, seed, results) -> None:
+    results.put(asyncio.run(drive(port, connections, seconds, books, users, seed)))
+
+
+def load_test(port: int, clients: int, connections: int, seconds: float, books: int, users: int) -> dict:
+    """Runs the client processes and merges their latencies"""
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    processes = [context.Process(target=run_client, args=(port, connections, seconds, books, users, seed, results))
+                 for seed in range(clients)]
+    for process in processes:
+        process.start()
+    merged = {'latencies': {name: [] for name, _ in MIX}, 'errors': 0}
+    for _ in processes:
+        result = results.get()
+        merged['errors'] += result['errors']
+        for kind, samples in result['latencies'].items():
+            merged['latencies'][kind].extend(samples)
+    for process in processes:
+        process.join()
+    return merged
+
+
+def percentile(samples: list, fraction: float) -> float:
+    return samples[min(len(samples) - 1, int(fraction * len(samples)))] if samples else float('nan')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test the HTTP API")
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--workers', default='1,2,4', help="comma-separated server worker counts (default: 1,2,4)")
+    parser.add_argument('--threads', type=int, default=4, help="database threads per worker (default: 4)")
+    parser.add_argument('--clients', type=int, default=4, help="client processes (default: 4)")
+    parser.add_argument('--connections', type=int, default=16, help="connections per client (default: 16)")
+    parser.add_argument('--seconds', type=float, default=10.0, help="duration of every run (default: 10)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'server.db')
+        start = time.perf_counter()
+        build_dataset(db_path, args.books, args.users).pool.close()
+        print(f"Built {args.books} books and {args.users} users in {time.perf_counter() - start:.1f}s "
+              f"({os.cpu_count()} CPUs, {args.clients}x{args.connections} client connections)\n")
+
+        print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'write p99':>11}{'errors':>8}")
+        for workers in map(int, args.workers.split(',')):
+            server = Server(db_path, port=0, workers=workers, threads=args.threads)
+            server.start()
+            try:
+                load_test(server.port, args.clients, 1, 1.0, args.books, args.users)  # Warms up every worker
+                result = load_test(server.port, args.clients, args.connections, args.seconds, args.books, args.users)
+            finally:
+                server.stop()
+
+            everything = sorted(ms for samples in result['latencies'].values() for ms in samples)
+            writes = sorted(result['latencies']['change'])
+            print(f"{workers:>8}{len(everything) / args.seconds:>10.0f}{statistics.median(everything):>10.2f}"
+                  f"{percentile(everything, 0.99):>10.2f}{percentile(writes, 0.99):>11.2f}{result['errors']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""Compares the in-memory CatalogSnapshot with the books table as a list of tuples and with SQLite.
+
+Reports the memory each representation keeps allocated (traced with tracemalloc), the time to build
+the snapshot and to refresh it after small writes, and how long filters and sorts take to count their
+matches and return the first two pages, on the snapshot and as SQL queries. Snapshot cases should fit
+in FRAME_BUDGET_MS. Queries with a word of up to SHORT_PREFIX letters are exempt, their masks are built
+from a large part of the index (see CatalogSnapshot); they're reported but don't fail the run.
+
+Usage: python -m benchmarks.bench_snapshot [books]
+"""
+import os
+import gc
+import sys
+import time
+import tempfile
+import tracemalloc
+from benchmarks.synthetic import build_catalog
+from modules.snapshot import CatalogSnapshot
+
+PAGE_SIZE = 256
+FRAME_BUDGET_MS = 16  # A listing drawn within one frame at 60 Hz
+SHORT_PREFIX = 2
+CASES = [
+    {},
+    {'sort_by': 'name'},
+    {'category': 'fantasy'},
+    {'category': ['fantasy', 'horror'], 'sort_by': 'name'},
+    {'min_pages': 500, 'max_pages': 600, 'sort_by': 'num_pages', 'descending': True},
+    {'cover_type': 'Hardback', 'min_pages': 850, 'sort_by': 'category'},
+    {'query': 'kalomi'},
+    {'query': 'drasil vortha', 'sort_by': 'author'},
+    {'query': 'ka', 'sort_by': 'author'},
+]
+
+
+def is_short_prefix(criteria: dict) -> bool:
+    return any(len(word) <= SHORT_PREFIX for word in (criteria.get('query') or '').split())
+
+
+def traced(func):
+    """Returns func's result and the bytes it left allocated"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = func()
+        gc.collect()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def best_of(func, repeats: int = 5) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def snapshot_case(snapshot, criteria):
+    selection = snapshot.select(**criteria)
+    selection.count()
+    selection.page(0, PAGE_SIZE)
+    selection.page(PAGE_SIZE, PAGE_SIZE)
+
+
+def sql_case(db_manager, criteria):
+    """The same listing through SQLite: OFFSET paging, the FTS index for queries"""
+    criteria = dict(criteria)
+    query = criteria.pop('query', None)
+    sort_by = criteria.pop('sort_by', 'book_id')
+    descending = criteria.pop('descending', False)
+    filters = {column: value for column, value in criteria.items() if column in ('category', 'cover_type')}
+    if 'min_pages' in criteria or 'max_pages' in criteria:
+        filters['num_pages'] = (criteria.get('min_pages'), criteria.get('max_pages'))
+    where, params = db_manager.build_filters('books', filters)
+    if query:
+        where += (' AND ' if where else ' WHERE ') + "book_id IN (SELECT rowid FROM books_fts WHERE books_fts MATCH ?)"
+        params += (' '.join(f'"{word}"*' for word in query.split()),)
+    direction = 'DESC' if descending else 'ASC'
+    with db_manager.connection() as conn:
+        conn.execute(f"SELECT COUNT(*) FROM books{where}", params).fetchone()
+        for offset in (0, PAGE_SIZE):
+            conn.execute(f"SELECT * FROM books{where} ORDER BY {sort_by} {direction}, book_id {direction} "
+                         f"LIMIT ? OFFSET ?", params + (PAGE_SIZE, offset)).fetchall()
+
+
+def main():
+    books = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager = build_catalog(os.path.join(tmp, 'snapshot.db'), books)
+
+        rows, rows_bytes = traced(lambda: db_manager.load_data('books'))
+        del rows
+        snapshot = CatalogSnapshot(db_manager)
+        _, snapshot_bytes = traced(snapshot.build)
+        build_ms = best_of(snapshot.build, 1)
+
+        print(f"{books} books")
+        print(f"List of tuples: {rows_bytes / 2 ** 20:8.1f} MB")
+        print(f"Snapshot:       {snapshot_bytes / 2 ** 20:8.1f} MB ({snapshot_bytes / rows_bytes:.0%}), "
+              f"built in {build_ms / 1000:.1f}s with {len(snapshot.postings)} indexed tokens")
+
+        def update_books():
+            for book_id in range(1, books, books // 100):
+                db_manager.update('books', {'num_pages': 321}, {'book_id': book_id})
+            snapshot.refresh()
+
+        def insert_books():
+            db_manager.add_records('books', [(None, f'Fresh Arrival {i}', 'New Author', 400, 'Paperback', 'fantasy')
+                                             for i in range(1000)])
+            snapshot.refresh()
+
+        print(f"Refresh after 100 updates: {best_of(update_books, 1):.1f} ms, "
+              f"after inserting 1000 books: {best_of(insert_books, 1):.1f} ms\n")
+
+        print(f"{'snapshot ms':>12}{'SQLite ms':>12}{'matches':>10}{'budget':>8}  criteria")
+        failed = []
+        for criteria in CASES:
+            matches = snapshot.select(**criteria).count()
+            snapshot_ms = best_of(lambda: snapshot_case(snapshot, criteria))
+            sql_ms = best_of(lambda: sql_case(db_manager, criteria))
+            if snapshot_ms <= FRAME_BUDGET_MS:
+                budget = 'PASS'
+            elif is_short_prefix(criteria):
+                budget = 'EXEMPT'
+            else:
+                budget = 'FAIL'
+                failed.append(criteria)
+            print(f"{snapshot_ms:>12.2f}{sql_ms:>12.2f}{matches:>10}{budget:>8}  {criteria or 'all books'}")
+        db_manager.pool.close()
+
+    print(f"target: snapshot cases <= {FRAME_BUDGET_MS} ms, except query words of up to {SHORT_PREFIX} letters "
+          f"{'FAIL: ' + ', '.join(map(str, failed)) if failed else 'PASS'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
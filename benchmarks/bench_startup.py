@@ -0,0 +1,74 @@
+"""Measures app startup: time to first window and the slowest imports reported by -X importtime.
+
+Runs main.py with --quit-after-startup on the offscreen Qt platform, from a copy of the app's
+ui/ and assets/ directories and with LIBRARY_CONFIG_DIR pointing there too, so the runs don't touch
+the working copy's database or the user's session file.
+
+Usage: python -m benchmarks.bench_startup [runs] [top imports]
+"""
+import os
+import re
+import sys
+import shutil
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$')
+LAZY_MODULES = ['pandas', 'numpy', 'modules.library', 'modules.importer']
+
+
+def run_once(app_dir: str):
+    """Returns the time to first window (ms) and the {module: cumulative import us} of one start"""
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen', PYTHONPATH=ROOT, LIBRARY_CONFIG_DIR=app_dir)
+    process = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT, 'main.py'),
+                              '--quit-after-startup'], cwd=app_dir, env=env, capture_output=True, text=True,
+                             timeout=120)
+    if process.returncode != 0:
+        raise RuntimeError(f"main.py failed:\n{process.stderr[-2000:]}")
+
+    first_window = float(re.search(r'time to first window: ([\d.]+) ms', process.stdout).group(1))
+    imports = {}
+    for line in process.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            imports[match.group(3)] = int(match.group(2))
+    return first_window, imports
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    top = int(sys.argv[2]) if len(sys.argv) > 2 else 15
+
+    with tempfile.TemporaryDirectory() as app_dir:
+        for directory in ('ui', 'assets'):
+            shutil.copytree(os.path.join(ROOT, directory), os.path.join(app_dir, directory))
+        compiled = any(name.endswith('_ui.py') for name in os.listdir(os.path.join(app_dir, 'ui')))
+
+        first_run_ms, _ = run_once(app_dir)  # Creates the database and warms the file cache
+        results = [run_once(app_dir) for _ in range(runs)]
+
+    first_window = [ms for ms, _ in results]
+    imports = results[-1][1]
+    top_level = sum(us for module, us in imports.items() if '.' not in module)
+
+    print(f"Forms: {'compiled' if compiled else 'loaded from .ui at runtime'} (compile with python -m modules.forms)")
+    print(f"Time to first window: first run {first_run_ms:.0f} ms, "
+          f"then median {statistics.median(first_window):.0f} ms "
+          f"(min {min(first_window):.0f}, max {max(first_window):.0f}) over {runs} runs")
+    print(f"Imports: {len(imports)} modules, {top_level / 1000:.0f} ms cumulative for top-level packages\n")
+
+    print(f"{'cumulative ms':>14}  module")
+    for module, us in sorted(imports.items(), key=lambda item: -item[1])[:top]:
+        print(f"{us / 1000:>14.1f}  {module}")
+
+    lazy_modules = LAZY_MODULES + ['PyQt5.uic'] if compiled else LAZY_MODULES  # uic parses .ui files
+    loaded = [module for module in lazy_modules if module in imports]
+    print(f"\nDeferred until needed: {', '.join(m for m in lazy_modules if m not in loaded) or 'none'}")
+    if loaded:
+        print(f"Imported at startup although they should be lazy: {', '.join(loaded)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Transforms a synthetic Goodreads-style listing with transform_listing and,
+for reference, with the per-row code scrape_books used before.
+
+Exits with an error if transform_listing misses TARGET_ROWS_PER_SECOND or TARGET_PEAK_MB. Its string
+operations run as pyarrow kernels, without pyarrow they fall back to per-row Python and miss the target.
+The peak is traced by tracemalloc, which doesn't see the buffers pyarrow allocates.
+
+Usage: python -m benchmarks.bench_transform [rows]
+"""
+import sys
+import importlib.util
+import time
+import random
+import tracemalloc
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic import WORDS
+from modules.importer import COVERS, transform_listing
+
+TARGET_ROWS_PER_SECOND = 250000
+TARGET_PEAK_MB = 1024
+
+
+def synthetic_listing(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Titles like 'Name (Series, #2) by Author 4.12 avg rating — 12,345 ratings', about 5% duplicated"""
+    rng = random.Random(seed)
+    titles = []
+    for i in range(rows):
+        if titles and rng.random() < 0.05:
+            titles.append(rng.choice(titles))
+            continue
+        name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        if rng.random() < 0.1:
+            name += ' by the Sea'  # Names containing 'by' must stay whole
+        series = f" ({rng.choice(WORDS).title()}, #{rng.randint(1, 9)})" if rng.random() < 0.3 else ''
+        author = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}"
+        titles.append(f"{name}{series} by {author} {rng.uniform(3, 5):.2f} avg rating — "
+                      f"{rng.randint(10, 99999):,} ratings")
+    return pd.DataFrame({'title': titles})
+
+
+def legacy_transform(df: pd.DataFrame, category: str) -> pd.DataFrame:
+    """The per-row transformation scrape_books used to do"""
+    df = df.rename(columns={'title': 2})
+    df['name'] = df[2].apply(lambda x: x.split('by')[0])
+    df['author'] = df[2].apply(lambda x: x.split('by')[1])
+    df['author'] = df['author'].str.split(r'\(|\d', expand=True)[0]
+    df['num_pages'] = [random.randint(300, 900) for _ in range(len(df))]
+    df['cover_type'] = [random.choice(COVERS) for _ in range(len(df))]
+    df['category'] = [category for _ in range(len(df))]
+    df = df[['name', 'author', 'num_pages', 'cover_type', 'category']]
+    df.insert(0, 'book_id', range(1, len(df) + 1))
+    df.drop_duplicates(subset=['name', 'author'], keep='first', inplace=True)
+    return df
+
+
+def measure(transform, listing):
+    """Returns (seconds, peak traced MB, result rows). The time comes from a run without tracemalloc,
+    which slows allocation-heavy code several times over, and the peak from a second, traced run"""
+    start = time.perf_counter()
+    result = transform(listing.copy(), 'fantasy')
+    elapsed = time.perf_counter() - start
+    del result
+
+    tracemalloc.start()
+    result = transform(listing.copy(), 'fantasy')
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return elapsed, peak, len(result)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    listing = synthetic_listing(rows)
+
+    results = {}
+    for name, transform in (('column-wise', lambda df, c: transform_listing(df, c, np.random.default_rng(0))),
+                            ('legacy', legacy_transform)):
+        elapsed, peak, kept = results[name] = measure(transform, listing)
+        print(f"{name:>11}: {rows} rows in {elapsed:.2f}s ({rows / elapsed:,.0f} rows/s), "
+              f"peak {peak:.0f} MB, {kept} books kept")
+
+    elapsed, peak, _ = results['column-wise']
+    print(f"string backend: {'pyarrow' if importlib.util.find_spec('pyarrow') else 'python (pyarrow not installed)'}")
+    print(f"speedup over legacy: {results['legacy'][0] / elapsed:.2f}x")
+    throughput_ok = rows / elapsed >= TARGET_ROWS_PER_SECOND
+    memory_ok = peak <= TARGET_PEAK_MB
+    print(f"targets: >= {TARGET_ROWS_PER_SECOND:,} rows/s {'PASS' if throughput_ok else 'FAIL'}, "
+          f"<= {TARGET_PEAK_MB} MB peak {'PASS' if memory_ok else 'FAIL'}")
+    if not (throughput_ok and memory_ok):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
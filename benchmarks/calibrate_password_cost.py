@@ -0,0 +1,48 @@
+"""Measures password hashing time for a range of scrypt costs and recommends the highest one
+that keeps a login within the target latency, also with several logins hashing at once.
+
+Usage: python -m benchmarks.calibrate_password_cost [target_ms] [concurrent_logins]
+Set the result as LIBRARY_PASSWORD_COST.
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from modules.auth import hash_password, check_password
+
+COSTS = range(10, 19)
+
+
+def login_latency(cost: int, concurrent_logins: int, repeats: int = 3) -> float:
+    """Returns the best wall time in ms of concurrent_logins password checks run in parallel"""
+    stored_password = hash_password('calibration', cost)
+    best = float('inf')
+    with ThreadPoolExecutor(max_workers=concurrent_logins) as executor:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            list(executor.map(lambda _: check_password('calibration', stored_password), range(concurrent_logins)))
+            best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    target_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 250
+    concurrent_logins = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+
+    recommended = None
+    for cost in COSTS:
+        latency = login_latency(cost, concurrent_logins)
+        fits = latency <= target_ms
+        print(f"cost {cost:>2} (N=2^{cost}, {128 * 8 * 2 ** cost / 2 ** 20:.0f} MB): {latency:8.1f} ms "
+              f"{'ok' if fits else 'too slow'}")
+        if not fits:
+            break
+        recommended = cost
+
+    if recommended is None:
+        print(f"No cost fits in {target_ms} ms")
+    else:
+        print(f"Recommended: LIBRARY_PASSWORD_COST={recommended}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,290 @@
+"""Headless benchmark suite of the database, favorites, login and import paths.
+
+Builds a synthetic library (or reuses one with --db), times every case several times and saves the
+results as JSON. With --compare, the median of every case is checked against an earlier results
+file and the run fails if any case got slower than --threshold.
+
+Usage:
+    python -m benchmarks.suite --books 100000 --users 100000 --output results.json
+    python -m benchmarks.suite --books 100000 --users 100000 --compare results.json
+
+Cases that need Qt run with QT_QPA_PLATFORM=offscreen and are skipped when PyQt5 isn't installed.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timezone
+from benchmarks.synthetic import build_dataset, generate_books
+from modules.auth import AuthService, hash_password, check_password
+from modules.cache import CatalogCache
+from modules.database import DatabaseManager
+from modules.importer import CatalogImporter, CsvReader
+
+PASSWORD = 'secret'
+QUERIES = ['kalomi', 'drasil vortha', 'renul', 'mortalson', 'horror', 'tha']
+CASES = {}
+
+
+def case(group: str):
+    """Registers a benchmark case. Cases are called as case(context, rng) and timed per call"""
+    def decorator(func):
+        CASES[f"{group}.{func.__name__}"] = func
+        return func
+    return decorator
+
+
+class Context:
+    """The database and services shared by the cases"""
+
+    def __init__(self, db_path: str, tmp: str) -> None:
+        self.db_manager = DatabaseManager(db_path)
+        self.books = self.db_manager.count_rows('books')
+        self.users = self.db_manager.count_rows('users')
+        self.tmp = tmp
+        self.auth = AuthService(self.db_manager, workers=1)
+        self.catalog_cache = CatalogCache(self.db_manager)
+        self.deep_key = self.books * 9 // 10
+
+    def email(self, rng: random.Random) -> str:
+        return f'user{rng.randrange(self.users)}@example.com'
+
+    def close(self) -> None:
+        self.catalog_cache.close()
+        self.auth.shutdown()
+        self.db_manager.pool.close()
+
+
+@case('load')
+def first_page(ctx, rng):
+    ctx.db_manager.load_page('books', 'book_id', None, 256)
+
+
+@case('load')
+def deep_page(ctx, rng):
+    ctx.db_manager.load_page('books', 'book_id', ctx.deep_key, 256)
+
+
+@case('load')
+def filtered_page(ctx, rng):
+    ctx.db_manager.paginate('books', {'category': 'fantasy', 'num_pages': (500, None)}, sort_by='author', limit=256)
+
+
+@case('load')
+def count_books(ctx, rng):
+    ctx.db_manager.count_rows('books')
+
+
+@case('load')
+def random_sample(ctx, rng):
+    ctx.db_manager.get_random_data('books', 10, rng)
+
+
+@case('search')
+def search_books(ctx, rng):
+    query = rng.choice(QUERIES)
+    ctx.db_manager.count_search_results(query)
+    ctx.db_manager.search_books(query, 256)
+
+
+@case('favorites')
+def show_favorites(ctx, rng):
+    """The favorites view: ids from the database and the first page of books by primary key"""
+    ctx.catalog_cache.cache.clear()
+    ids = ctx.catalog_cache.favorite_ids(ctx.email(rng))
+    ctx.db_manager.paginate('books', {'book_id': list(ids[:256])}, limit=256)
+
+
+@case('favorites')
+def show_favorites_cached(ctx, rng):
+    ids = ctx.catalog_cache.favorite_ids(ctx.email(rng))
+    ctx.db_manager.paginate('books', {'book_id': list(ids[:256])}, limit=256)
+
+
+@case('favorites')
+def add_and_remove(ctx, rng):
+    """Adds ten books to a user's favorites and removes them again, leaving the data unchanged"""
+    email = ctx.email(rng)
+    book_ids = {rng.randint(1, ctx.books) for _ in range(10)} - set(ctx.catalog_cache.favorite_ids(email))
+    rows = [(email, book_id) for book_id in book_ids]
+    ctx.db_manager.add_records('favorites', rows)
+    ctx.db_manager.delete_rows('favorites', ['email', 'book_id'], rows)
+
+
+@case('login')
+def login(ctx, rng):
+    ctx.auth.cache.clear()
+    stored_password = ctx.auth.get_password_hash(ctx.email(rng))
+    assert stored_password is not None and check_password(PASSWORD, stored_password)
+
+
+@case('login')
+def login_cached(ctx, rng):
+    stored_password = ctx.auth.get_password_hash(ctx.email(rng))
+    assert stored_password is not None and check_password(PASSWORD, stored_password)
+
+
+@case('import')
+def import_catalog(ctx, rng):
+    """Bulk imports a CSV catalog of 10^4 books into an empty database"""
+    source = os.path.join(ctx.tmp, 'catalog.csv')
+    if not os.path.exists(source):
+        with open(source, 'w', newline='', encoding='utf-8') as file:
+            writer = csv.writer(file)
+            writer.writerow(['name', 'author', 'num_pages', 'cover_type', 'category'])
+            writer.writerows(row[1:] for row in generate_books(10000, seed=1))
+
+    db_path = os.path.join(ctx.tmp, 'import.db')
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    db_manager = DatabaseManager(db_path)
+    try:
+        stats = CatalogImporter(db_manager, seed=0).run(CsvReader(source))
+        assert stats.imported > 0
+    finally:
+        db_manager.pool.close()
+
+
+@case('ui')
+def populate_table(ctx, rng):
+    """Shows the first page in a QTableView and scrolls through four more"""
+    from PyQt5.QtCore import QModelIndex
+    from PyQt5.QtWidgets import QTableView
+    from modules.library import populate_book_table
+
+    view = QTableView()
+    populate_book_table(lambda after, offset, limit: ctx.db_manager.load_page('books', 'book_id', after, limit),
+                        ctx.db_manager.count_rows('books'), view)
+    model = view.model()
+    for _ in range(4):
+        if model.canFetchMore(QModelIndex()):
+            model.fetchMore(QModelIndex())
+    view.deleteLater()
+
+
+def qt_available() -> bool:
+    """Creates the offscreen QApplication the ui cases need, if PyQt5 is installed"""
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    try:
+        from PyQt5.QtWidgets import QApplication
+    except ImportError:
+        return False
+    global _app
+    _app = QApplication.instance() or QApplication([])
+    return True
+
+
+def run_case(func, ctx, repeat: int, seed: int) -> dict:
+    """Calls a case once to warm up, then repeat times, and summarizes the latencies in milliseconds"""
+    rng = random.Random(seed)
+    func(ctx, rng)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(ctx, rng)
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min_ms': samples[0],
+        'median_ms': statistics.median(samples),
+        'mean_ms': statistics.fmean(samples),
+        'p95_ms': samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        'max_ms': samples[-1],
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    """Prints median changes against a baseline run and returns True if no case regressed"""
+    passed = True
+    print(f"\n{'case':<36}{'baseline ms':>14}{'now ms':>12}{'change':>10}")
+    for name, result in results['results'].items():
+        before = baseline['results'].get(name)
+        if before is None or 'median_ms' not in before or 'median_ms' not in result:
+            continue
+        change = result['median_ms'] / before['median_ms'] - 1 if before['median_ms'] else 0.0
+        regressed = change > threshold
+        passed = passed and not regressed
+        print(f"{name:<36}{before['median_ms']:>14.3f}{result['median_ms']:>12.3f}{change:>+10.1%}"
+              f"{'  REGRESSION' if regressed else ''}")
+
+    if baseline['meta'].get('books') != results['meta']['books'] or \
+            baseline['meta'].get('users') != results['meta']['users']:
+        print("Note: the baseline was run on a dataset of a different size")
+    return passed
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Run the headless benchmark suite")
+    parser.add_argument('--books', type=int, default=100000, help="books in the synthetic catalog (default: 10^5)")
+    parser.add_argument('--users', type=int, default=100000, help="registered users (default: 10^5)")
+    parser.add_argument('--favorites', type=int, default=10, help="mean favorites per user (default: 10)")
+    parser.add_argument('--db', help="build the dataset in this file, or reuse it if it exists")
+    parser.add_argument('--repeat', type=int, default=50, help="timed calls per case (default: 50)")
+    parser.add_argument('--only', help="comma-separated case groups or names, e.g. load,favorites")
+    parser.add_argument('--output', help="save the results to this JSON file")
+    parser.add_argument('--compare', help="results file of an earlier run to compare medians with")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative median slowdown counted as a regression (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    selected = {name: func for name, func in CASES.items()
+                if not args.only or any(name == item or name.startswith(item + '.') for item in args.only.split(','))}
+    with_qt = any(name.startswith('ui.') for name in selected) and qt_available()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db or os.path.join(tmp, 'bench.db')
+        if not os.path.exists(db_path):
+            start = time.perf_counter()
+            build_dataset(db_path, args.books, args.users, args.favorites,
+                          hash_password(PASSWORD)).pool.close()
+            print(f"Built {args.books} books and {args.users} users in {time.perf_counter() - start:.1f}s")
+
+        ctx = Context(db_path, tmp)
+        results = {
+            'meta': {
+                'books': ctx.books,
+                'users': ctx.users,
+                'favorites': ctx.db_manager.count_rows('favorites'),
+                'repeat': args.repeat,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            },
+            'results': {},
+        }
+
+        print(f"{'case':<36}{'median ms':>12}{'p95 ms':>12}{'min ms':>12}")
+        for seed, (name, func) in enumerate(selected.items()):
+            if name.startswith('ui.') and not with_qt:
+                results['results'][name] = {'skipped': 'PyQt5 is not installed'}
+                print(f"{name:<36}{'skipped':>12}")
+                continue
+            repeat = max(1, args.repeat // 10) if name.startswith('import.') else args.repeat
+            result = run_case(func, ctx, repeat, seed)
+            results['results'][name] = result
+            print(f"{name:<36}{result['median_ms']:>12.3f}{result['p95_ms']:>12.3f}{result['min_ms']:>12.3f}")
+        ctx.close()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    if args.compare:
+        with open(args.compare) as file:
+            if not compare(results, json.load(file), args.threshold):
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
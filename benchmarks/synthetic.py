@@ -0,0 +1,70 @@
+import math
+import random
+from modules.database import DatabaseManager
+
+CATEGORIES = ['fantasy', 'sci-fi', 'horror', 'thriller', 'romance', 'history', 'poetry', 'biography']
+COVERS = ['Hardback', 'Paperback', 'Softcover']
+SYLLABLES = ['ka', 'lo', 'mi', 'ren', 'dra', 'sil', 'vor', 'tha', 'nel', 'gor', 'ish', 'ul', 'bre', 'zan',
+             'fen', 'qui', 'mor', 'es', 'tal', 'wyn']
+# A vocabulary of 8000 pseudo-words keeps term frequencies closer to real titles than a short word list
+WORDS = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+SCATTER = 2654435761  # Prime multiplier (Knuth's multiplicative hash) mapping popularity ranks to book ids
+
+
+def generate_books(count: int, seed: int = 0):
+    """Yields synthetic (book_id, name, author, num_pages, cover_type, category) rows"""
+    rng = random.Random(seed)
+    for book_id in range(1, count + 1):
+        name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        author = f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}son"
+        yield book_id, name, author, rng.randint(300, 900), rng.choice(COVERS), rng.choice(CATEGORIES)
+
+
+def build_catalog(db_path: str, books: int, seed: int = 0) -> DatabaseManager:
+    """Creates a database with the app schema and the given number of synthetic books"""
+    db_manager = DatabaseManager(db_path)
+    db_manager.create_tables()
+    with db_manager.connection() as conn:
+        conn.executemany("INSERT INTO books VALUES (?, ?, ?, ?, ?, ?)", generate_books(books, seed))
+    return db_manager
+
+
+def generate_users(count: int, password_hash: str):
+    """Yields (email, password) users rows, all with the same precomputed hash"""
+    for user in range(count):
+        yield f'user{user}@example.com', password_hash
+
+
+def zipf_book_id(rng: random.Random, books: int, exponent: float = 1.1) -> int:
+    """Draws a book id whose popularity rank follows a Zipf-like power law.
+
+    Samples the rank from the inverse CDF of the continuous power law on [1, books + 1), which needs
+    no table of weights even for 10^7 books. Ranks are scattered over the ids with a multiplicative
+    hash, so the most popular books aren't simply the oldest ones.
+    """
+    low, high = 1.0, books + 1.0
+    power = 1.0 - exponent
+    rank = int((low ** power + rng.random() * (high ** power - low ** power)) ** (1.0 / power)) - 1
+    rank = min(rank, books - 1)
+    return (rank * SCATTER) % books + 1 if math.gcd(SCATTER, books) == 1 else rank + 1
+
+
+def generate_favorites(users: int, books: int, per_user: int = 10, exponent: float = 1.1, seed: int = 0):
+    """Yields (email, book_id) favorites rows. Users have 0 to 2 * per_user favorites
+    drawn from Zipf-distributed book popularity"""
+    rng = random.Random(seed)
+    for user in range(users):
+        book_ids = {zipf_book_id(rng, books, exponent) for _ in range(rng.randint(0, 2 * per_user))}
+        for book_id in sorted(book_ids):
+            yield f'user{user}@example.com', book_id
+
+
+def build_dataset(db_path: str, books: int, users: int, favorites_per_user: int = 10, password_hash: str = 'x',
+                  seed: int = 0) -> DatabaseManager:
+    """Creates a database with synthetic books, users and their favorites"""
+    db_manager = build_catalog(db_path, books, seed)
+    with db_manager.connection() as conn:
+        conn.executemany("INSERT INTO users VALUES (?, ?)", generate_users(users, password_hash))
+        conn.executemany("INSERT INTO favorites VALUES (?, ?)",
+                         generate_favorites(users, books, favorites_per_user, seed=seed))
+    return db_manager
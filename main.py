@@ -1,34 +1,120 @@
+import time
+
+STARTED = time.perf_counter()  # Before the imports below, which are most of the startup time
+
+import os
 import sys
-import json
+import logging
+import argparse
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QApplication, QStackedWidget
 from PyQt5.QtGui import QIcon
 from modules.users import Register, Login
-from modules.library import Library
+from modules.connection import close_pools
+from modules.session import Session
+from modules.auth import AuthService
+from modules.database import DatabaseManager
+from modules import metrics
+
+
+def parse_args():
+    """Parses the app's own options, leaving the rest of the command line to Qt"""
+    parser = argparse.ArgumentParser(description="A virtual book library")
+    parser.add_argument('--metrics', metavar='FILE', default=os.environ.get('LIBRARY_METRICS'),
+                        help="collect call counts and latencies, written to FILE on exit "
+                             "(Prometheus text for .prom/.txt, else JSON)")
+    parser.add_argument('--profile', metavar='FILE', nargs='?', const='profile.txt',
+                        help="run under cProfile and write a report sorted by cumulative time (default: profile.txt)")
+    parser.add_argument('--quit-after-startup', action='store_true',
+                        help="quit once the first window is shown, for startup benchmarks")
+    return parser.parse_known_args()
+
+
+def write_profile(profiler, path: str) -> None:
+    import pstats
+
+    with open(path, 'w') as file:
+        stats = pstats.Stats(profiler, stream=file)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(100)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(30)
+
 
+class LazyLibrary:
+    """Builds the Library window on first login, so its modules and form aren't loaded at startup"""
 
-def reset_current_events() -> None:
-    with open("utils/current_user.json", "w") as json_file:
-        json.dump({"email": ""}, json_file, indent=4)
+    def __init__(self, widget, session) -> None:
+        self.widget = widget
+        self.session = session
+        self.window = None
 
-    with open("utils/current_table.json", "w") as json_file:
-        json.dump({"current_table": ""}, json_file, indent=4)
+    def show(self) -> None:
+        if self.window is None:
+            from modules.library import Library
+
+            self.window = Library(self.widget, self.session)
+            self.widget.addWidget(self.window)
+        self.widget.setCurrentWidget(self.window)
+
+    def shutdown(self) -> None:
+        if self.window is not None:
+            self.window.stop_import()
+            self.window.executor.shutdown()
+            self.window.favorites_queue.close()  # After the executor, whose tasks may still queue changes
+            logging.info("Catalog cache: %s", self.window.catalog_cache.stats())
+
+
+def first_window_shown(quit_app: bool) -> None:
+    """Records the time from process start until the event loop runs with the first window shown"""
+    startup_ms = (time.perf_counter() - STARTED) * 1000
+    if metrics.REGISTRY.enabled:
+        metrics.REGISTRY.stats('startup.time_to_first_window').add(startup_ms)
+    logging.info("First window shown after %.0f ms", startup_ms)
+    if quit_app:
+        print(f"time to first window: {startup_ms:.1f} ms")
+        QApplication.quit()
 
 
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    # LIBRARY_DEBUG=1 logs the query plan of every query the app issues
+    if os.environ.get('LIBRARY_DEBUG'):
+        logging.basicConfig(level=logging.DEBUG)
+
+    args, qt_args = parse_args()
+    if args.metrics:
+        metrics.enable(args.metrics)
+    profiler = None
+    if args.profile:  # Profiles the GUI thread, from startup until the app quits
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    app = QApplication(sys.argv[:1] + qt_args)
     widget = QStackedWidget()
 
-    regWindow = Register(widget)
-    logWindow = Login(widget)
-    libWindow = Library(widget)
+    session = Session()
+    session.restore()  # Fills in the login form with the last user's email
+    auth = AuthService(DatabaseManager('LIBRARY.db'))
+    auth.prepare_async()
+    library = LazyLibrary(widget, session)
+    regWindow = Register(widget, auth)
+    logWindow = Login(widget, session, auth, library.show)
     widget.addWidget(logWindow)
     widget.addWidget(regWindow)
-    widget.addWidget(libWindow)
 
     widget.setWindowTitle("Library")
     widget.setWindowIcon(QIcon("assets/book.png"))
     widget.show()
+    # Runs once the event loop has started, after the window's first paint was queued
+    QTimer.singleShot(0, lambda: first_window_shown(args.quit_after_startup))
 
-    app.aboutToQuit.connect(reset_current_events)
+    app.aboutToQuit.connect(session.flush)
+    app.aboutToQuit.connect(library.shutdown)
+    app.aboutToQuit.connect(auth.shutdown)
+    app.aboutToQuit.connect(close_pools)
 
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    if profiler is not None:
+        profiler.disable()
+        write_profile(profiler, args.profile)
+    sys.exit(exit_code)
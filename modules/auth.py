@@ -0,0 +1,150 @@
+import os
+import hmac
+import sqlite3
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from modules.cache import LRUCache
+from modules.connection import run_with_retry
+from modules.database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+# scrypt work factor as log2(N). Each step doubles hashing time and memory, see
+# benchmarks/calibrate_password_cost.py to pick one for a target login latency
+DEFAULT_COST = int(os.environ.get('LIBRARY_PASSWORD_COST', 14))
+BLOCK_SIZE = 8
+PARALLELISM = 1
+
+
+def legacy_hash_password(password) -> str:
+    """Returns the unsalted SHA-256 hash older versions stored"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def is_legacy_hash(stored_password: str) -> bool:
+    return '$' not in stored_password
+
+
+def _scrypt(password: str, salt: bytes, cost: int, block_size: int, parallelism: int) -> bytes:
+    n = 2 ** cost
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=block_size, p=parallelism,
+                          maxmem=129 * block_size * (n + parallelism + 2), dklen=32)
+
+
+def hash_password(password, cost: int = None) -> str:
+    """Returns a salted scrypt hash as 'scrypt$cost$r$p$salt$hash', keeping the parameters with the hash"""
+    cost = DEFAULT_COST if cost is None else cost
+    salt = os.urandom(16)
+    derived_key = _scrypt(password, salt, cost, BLOCK_SIZE, PARALLELISM)
+    return f"scrypt${cost}${BLOCK_SIZE}${PARALLELISM}${salt.hex()}${derived_key.hex()}"
+
+
+def check_password(entered_password, stored_password) -> bool:
+    """Returns Boolean value of password validity, for both scrypt and legacy hashes.
+    A malformed stored hash matches no password"""
+    try:
+        if is_legacy_hash(stored_password):
+            return hmac.compare_digest(legacy_hash_password(entered_password), stored_password)
+
+        _, cost, block_size, parallelism, salt, derived_key = stored_password.split('$')
+        entered_key = _scrypt(entered_password, bytes.fromhex(salt), int(cost), int(block_size), int(parallelism))
+        return hmac.compare_digest(entered_key.hex(), derived_key)
+    except (ValueError, TypeError) as e:  # TypeError: compare_digest of a hash with non-ASCII characters
+        logger.error("Malformed stored password hash: %s", e)
+        return False
+
+
+def needs_rehash(stored_password: str, cost: int = None) -> bool:
+    """Returns True for legacy hashes and hashes made with a different cost"""
+    cost = DEFAULT_COST if cost is None else cost
+    return is_legacy_hash(stored_password) or stored_password.split('$')[1] != str(cost)
+
+
+class AuthService:
+    """Reads and writes user credentials one row at a time.
+
+    Lookups go through the users primary key and found credentials are kept in a small LRU cache,
+    which every write through the service invalidates. Passwords are hashed on a worker pool,
+    the *_async methods return concurrent.futures.Future objects.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, cache_size: int = 1024, workers: int = 2,
+                 cost: int = None) -> None:
+        self.db_manager = db_manager
+        self.cache = LRUCache(cache_size)
+        self.cost = DEFAULT_COST if cost is None else cost
+        # Slow hashing runs here, off the GUI thread. hashlib releases the GIL while hashing
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._schema_ready = None
+
+    def prepare_async(self):
+        """Creates or migrates the schema on the worker pool and returns its Future, so a fresh database
+        doesn't delay the first window. Lookups and registrations wait for it"""
+        self._schema_ready = self._executor.submit(self.db_manager.create_tables)
+        return self._schema_ready
+
+    def _wait_for_schema(self) -> None:
+        if self._schema_ready is not None:
+            self._schema_ready.result()
+
+    def check_async(self, entered_password: str, stored_password: str):
+        """Returns a Future of check_password's result"""
+        return self._executor.submit(check_password, entered_password, stored_password)
+
+    def login_async(self, email: str, entered_password: str):
+        """Returns a Future of (stored password hash, whether entered_password matches it), with a None hash
+        if the email isn't registered. Both the lookup and the check run on the pool"""
+        def login():
+            stored_password = run_with_retry(self.get_password_hash, email)
+            return stored_password, stored_password is not None and check_password(entered_password, stored_password)
+
+        return self._executor.submit(login)
+
+    def register_async(self, email: str, password: str):
+        """Returns a Future of register's result for a plain password, hashed and stored on the pool.
+        Writes to a locked database are retried with backoff before the Future fails"""
+        return self._executor.submit(lambda: run_with_retry(self.register, email, hash_password(password, self.cost)))
+
+    def update_password_async(self, email: str, password: str):
+        """Returns a Future of rehashing and storing a plain password"""
+        return self._executor.submit(
+            lambda: run_with_retry(self.update_password, email, hash_password(password, self.cost)))
+
+    def needs_rehash(self, stored_password: str) -> bool:
+        return needs_rehash(stored_password, self.cost)
+
+    def shutdown(self) -> None:
+        """Stops the hashing workers after queued jobs are done"""
+        self._executor.shutdown(wait=True)
+
+    def get_password_hash(self, email: str):
+        """Returns the stored password hash of a user, or None if the email isn't registered"""
+        password_hash = self.cache.get(email)
+        if password_hash is not None:
+            return password_hash
+
+        self._wait_for_schema()
+        rows = self.db_manager.search('users', ['password'], {'email': email})
+        if not rows:  # Unknown emails aren't cached, they may be registered by another instance
+            return None
+        self.cache.put(email, rows[0][0])
+        return rows[0][0]
+
+    def register(self, email: str, password_hash: str) -> bool:
+        """Stores a new user. Returns False if the email is already registered"""
+        self._wait_for_schema()
+        try:
+            self.db_manager.add_record('users', email, password_hash)
+        except sqlite3.IntegrityError:
+            return False
+        finally:
+            self.cache.invalidate(email)
+        return True
+
+    def update_password(self, email: str, password_hash: str) -> None:
+        """Replaces the stored password hash of a user"""
+        try:
+            self.db_manager.update('users', {'password': password_hash}, {'email': email})
+        finally:
+            self.cache.invalidate(email)
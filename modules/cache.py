@@ -0,0 +1,155 @@
+import sys
+import threading
+from collections import OrderedDict
+
+
+def approximate_size(value) -> int:
+    """Returns the size of a value in bytes, including the items of a flat container"""
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(sys.getsizeof(key) + sys.getsizeof(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class LRUCache:
+    """A thread-safe mapping that keeps at most max_entries items, dropping the least recently used.
+
+    With max_bytes, items are also dropped while their total size (measured by sizeof) is over it.
+    Hits, misses and evictions are counted, see stats().
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = None, sizeof=approximate_size) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.total_bytes = 0
+        self._items = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value) -> None:
+        size = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            self._items[key] = value
+            self._sizes[key] = size
+            self.total_bytes += size
+            while len(self._items) > self.max_entries or (self.max_bytes is not None and
+                                                          self.total_bytes > self.max_bytes and len(self._items) > 1):
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def _remove(self, key) -> None:
+        if key in self._items:
+            del self._items[key]
+            self.total_bytes -= self._sizes.pop(key)
+
+    def invalidate(self, key) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def invalidate_matching(self, predicate) -> int:
+        """Drops every item whose key satisfies predicate(key) and returns how many were dropped"""
+        with self._lock:
+            keys = [key for key in self._items if predicate(key)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._sizes.clear()
+            self.total_bytes = 0
+
+    def stats(self) -> dict:
+        """Returns the counters and current size, for sizing max_entries and max_bytes"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._items),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+            }
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._items
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+class CatalogCache:
+    """Per-user favorite book ids and row counts (e.g. books of a category or author) kept in an LRUCache.
+
+    Entries are keyed by (kind, table, column, value). A write listener on the DatabaseManager drops
+    exactly the entries whose column value appears in a committed change of their table, or all entries
+    of a column when a change doesn't say its value (e.g. an update by book_id).
+    """
+
+    def __init__(self, db_manager, max_entries: int = 4096, max_bytes: int = 32 * 2 ** 20) -> None:
+        self.db_manager = db_manager
+        self.cache = LRUCache(max_entries, max_bytes)
+        self._generation = 0  # Bumped by every invalidation
+        db_manager.add_write_listener(self.invalidate)
+
+    def _get(self, key, load):
+        value = self.cache.get(key)
+        if value is None:
+            generation = self._generation
+            value = load()
+            if generation == self._generation:  # Else a write committed meanwhile and value may be stale
+                self.cache.put(key, value)
+        return value
+
+    def favorite_ids(self, email: str) -> tuple:
+        """Returns the sorted ids of a user's favorite books"""
+        return self._get(('ids', 'favorites', 'email', email), lambda: tuple(sorted(
+            row[0] for row in self.db_manager.search('favorites', ['book_id'], {'email': email}))))
+
+    def count(self, table_name: str, column: str, value) -> int:
+        """Returns the number of rows of a table where column = value, like get_count_of_relations"""
+        return self._get(('count', table_name, column, value),
+                         lambda: self.db_manager.count_rows(table_name, {column: value}))
+
+    def invalidate(self, table_name: str, changes: list) -> None:
+        self._generation += 1
+        touched = {}  # Column -> (whether some change doesn't know its value, values in changes)
+
+        def affected(key) -> bool:
+            _, table, column, value = key
+            if table != table_name:
+                return False
+            if column not in touched:
+                touched[column] = (any(column not in change for change in changes),
+                                   {change[column] for change in changes if column in change})
+            unknown, values = touched[column]
+            return unknown or value in values
+
+        self.cache.invalidate_matching(affected)
+
+    def stats(self) -> dict:
+        return self.cache.stats()
+
+    def close(self) -> None:
+        """Stops listening to writes, e.g. when the window owning the cache is destroyed"""
+        self.db_manager.remove_write_listener(self.invalidate)
@@ -0,0 +1,210 @@
+import os
+import time
+import queue
+import random
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from modules import metrics
+
+
+class ChangeLog:
+    """Counts the committed writes to a database and remembers the changes of the latest max_entries"""
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.counter = 0
+        self._entries = deque(maxlen=max_entries)  # (counter, table_name, changes)
+        self._lock = threading.Lock()
+
+    def record(self, table_name: str, changes) -> None:
+        with self._lock:
+            self.counter += 1
+            self._entries.append((self.counter, table_name, changes))
+
+    def since(self, counter: int, table_name: str):
+        """Returns the changes of a table committed after counter, oldest first,
+        or None when some of them were already dropped from the log"""
+        with self._lock:
+            if counter < self.counter - len(self._entries):
+                return None
+            return [changes for number, table, changes in self._entries if number > counter and table == table_name]
+
+
+class ConnectionPool:
+    """A thread-aware pool of long-lived SQLite connections.
+
+    Connections are opened lazily up to pool_size, configured once with the given
+    PRAGMAs and then reused, so SQLite parses the schema and keeps its prepared
+    statements (cached_statements) across calls instead of on every query.
+    A thread that already holds a connection gets the same one back on nested use. The default
+    pool_size covers every thread of the app that can hold one at once (two query executor threads, the
+    write-behind writer, two auth workers, the import worker and the GUI thread). Beyond pool_size,
+    acquire waits up to timeout seconds for a connection to be released.
+
+    With read_only, connections open the file in SQLite's read-only mode and refuse writes
+    (query_only). Several processes can then read one WAL database side by side with its writer.
+    """
+
+    def __init__(self, db_path, pool_size=8, timeout=30.0, journal_mode='WAL', synchronous='NORMAL',
+                 cache_size=-16000, mmap_size=268435456, temp_store='MEMORY', cached_statements=256,
+                 read_only=False):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.read_only = read_only
+        self.pragmas = {
+            # The journal mode is stored in the file, a read-only connection can't change it
+            'journal_mode': None if read_only else journal_mode,
+            'synchronous': synchronous,
+            'cache_size': cache_size,
+            'mmap_size': mmap_size,
+            'temp_store': temp_store,
+            'query_only': 'ON' if read_only else None,
+        }
+
+        self._idle = queue.LifoQueue()  # Most recently used connection has the warmest cache
+        self._all = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.write_listeners = []  # Shared by every DatabaseManager of this file, see add_write_listener
+        self.change_log = ChangeLog()
+
+    def _open(self) -> sqlite3.Connection:
+        """Opens and configures a new connection"""
+        if self.read_only:
+            conn = sqlite3.connect(f'file:{os.path.abspath(self.db_path)}?mode=ro', uri=True, timeout=self.timeout,
+                                   check_same_thread=False, cached_statements=self.cached_statements)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+        metrics.increment('connections_opened')
+        for pragma, value in self.pragmas.items():
+            if value is not None:
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """Takes an idle connection from the pool, opening a new one while under pool_size"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = len(self._all) < self.pool_size
+            if can_open:
+                conn = self._open()
+                self._all.append(conn)
+                return conn
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"No free connection to {self.db_path} within {self.timeout}s")
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Returns a connection to the pool"""
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Yields a pooled connection, committing on success and rolling back on error"""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:  # Nested use on the same thread, the outermost block commits
+            yield held
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        self._local.after_commit = []
+        thread_id = threading.get_ident()
+        with _held_lock:
+            _held.setdefault(thread_id, set()).add(conn)
+        try:
+            with conn:
+                yield conn
+        finally:
+            with _held_lock:
+                _held[thread_id].discard(conn)
+                if not _held[thread_id]:
+                    del _held[thread_id]
+            callbacks = self._local.after_commit
+            self._local.conn = None
+            self._local.after_commit = []
+            self.release(conn)
+
+        for callback in callbacks:  # Only reached when the block committed
+            callback()
+
+    def after_commit(self, callback) -> None:
+        """Calls callback once the current thread's connection block commits, or right away outside of one"""
+        if getattr(self._local, 'conn', None) is None:
+            callback()
+        else:
+            self._local.after_commit.append(callback)
+
+    def close(self) -> None:
+        """Closes every connection opened by the pool"""
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
+
+
+_held = {}  # Thread id -> connections it holds in connection() blocks, of any pool
+_held_lock = threading.Lock()
+
+
+def interrupt_thread(thread_id: int) -> int:
+    """Interrupts the statements running on the connections a thread holds, which then raise
+    sqlite3.OperationalError and roll back. Returns the number of connections interrupted"""
+    with _held_lock:
+        connections = list(_held.get(thread_id, ()))
+        for conn in connections:
+            conn.interrupt()
+    return len(connections)
+
+
+def is_lock_error(error: Exception) -> bool:
+    """Returns True for errors SQLite raises when another connection holds the database"""
+    message = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in message or 'busy' in message)
+
+
+def run_with_retry(func, *args, retries: int = 5, base_delay: float = 0.05, max_delay: float = 2.0,
+                   is_cancelled=None):
+    """Calls func(*args), retrying with exponential backoff and jitter while the database is locked"""
+    for attempt in range(retries + 1):
+        try:
+            return func(*args)
+        except sqlite3.OperationalError as e:
+            if not is_lock_error(e) or attempt == retries or (is_cancelled is not None and is_cancelled()):
+                raise
+            delay = min(max_delay, base_delay * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path, **options) -> ConnectionPool:
+    """Returns the shared pool of a database file, creating it on first use"""
+    key = (os.path.abspath(db_path) if db_path != ':memory:' else db_path, options.get('read_only', False))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(db_path, **options)
+        return _pools[key]
+
+
+def close_pools() -> None:
+    """Closes all shared pools, meant to be called when the application quits"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
@@ -1,18 +1,154 @@
+import os
+import re
+import random
+import itertools
+import logging
 import sqlite3
+from modules.connection import get_pool
+from modules.metrics import measure, timed
+
+logger = logging.getLogger(__name__)
+
+# Schema changes applied in order by create_tables. The applied version is kept in PRAGMA user_version
+MIGRATIONS = [
+    (1, '''
+    CREATE INDEX IF NOT EXISTS "favorites_book_id" ON favorites(book_id);
+    CREATE INDEX IF NOT EXISTS "books_category" ON books(category);
+    CREATE INDEX IF NOT EXISTS "books_author" ON books(author);
+    '''),
+    (2, '''
+    CREATE TABLE IF NOT EXISTS "import_checkpoints" (
+        "source" TEXT PRIMARY KEY NOT NULL,
+        "position" INTEGER NOT NULL
+        );
+    '''),
+    (3, '''
+    CREATE TABLE IF NOT EXISTS "sessions" (
+        "email" TEXT PRIMARY KEY NOT NULL,
+        "current_view" TEXT NOT NULL DEFAULT '',
+        "active" INTEGER NOT NULL DEFAULT 0,
+        FOREIGN KEY (email) REFERENCES users(email)
+        );
+    '''),
+    (4, '''
+    CREATE INDEX IF NOT EXISTS "books_name" ON books(name);
+    CREATE INDEX IF NOT EXISTS "books_num_pages" ON books(num_pages);
+    '''),
+    (5, '''
+    CREATE TABLE IF NOT EXISTS "recommendations" (
+        "email" TEXT NOT NULL,
+        "rank" INTEGER NOT NULL,
+        "book_id" INTEGER NOT NULL,
+        "score" REAL NOT NULL,
+        PRIMARY KEY (email, rank),
+        FOREIGN KEY (email) REFERENCES users(email),
+        FOREIGN KEY (book_id) REFERENCES books(book_id)
+        );
+    '''),
+]
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')  # Plan detail of a table scan that uses no index
+# A query without WHERE clause, whose scan in rowid order stops after LIMIT rows (e.g. paginate's first page)
+LIMITED_QUERY = re.compile(r'^\s*SELECT\b(?!.*\bWHERE\b).*\bLIMIT\b', re.IGNORECASE | re.DOTALL)
+
+
+def build_match_expression(query: str) -> str:
+    """Turns free text into an FTS5 query where every word is matched as a prefix"""
+    tokens = re.findall(r'\w+', query)
+    return ' '.join([f'"{token}"*' for token in tokens])
 
 
 class DatabaseManager:
     """A class to manage common database operations"""
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, debug=None, **pool_options):
         self.db_path = db_path
+        # Managers of the same file share one pool, see modules/connection.py for the options
+        self.pool = get_pool(db_path, **pool_options)
+        self._columns = {}  # Cached table_info results
+
+        # In debug mode every query's plan is logged and full table scans are collected
+        self.debug = bool(os.environ.get('LIBRARY_DEBUG')) if debug is None else debug
+        self.full_scans = []  # (query, plan detail) pairs
 
     def create_connection(self):
+        """Opens a new unpooled connection. Kept for one-off scripts and benchmarks"""
         return sqlite3.connect(self.db_path)
 
+    def connection(self):
+        """Returns a context manager yielding a pooled connection.
+        Writes made by methods called inside the block are committed together when it exits"""
+        return self.pool.connection()
+
+    def add_write_listener(self, callback) -> None:
+        """Registers callback(table_name, changes), called after a write through add_record(s), update,
+        delete_row_by_key or delete_rows commits. changes is a list of dicts with the column values known
+        for the affected rows: the inserted rows, the keys of deleted rows, and both the conditions and
+        the new values of updates. Listeners are shared by all DatabaseManagers of the same file"""
+        self.pool.write_listeners.append(callback)
+
+    def remove_write_listener(self, callback) -> None:
+        self.pool.write_listeners.remove(callback)
+
+    @property
+    def change_counter(self) -> int:
+        """Number of writes committed through the DatabaseManagers of this file in this process"""
+        return self.pool.change_log.counter
+
+    def changes_since(self, counter: int, table_name: str):
+        """Returns the changes (as passed to write listeners) of a table committed after change_counter
+        was counter, or None if they're no longer all known. Inserts are listed as None, their rows
+        have to be read from the table"""
+        return self.pool.change_log.since(counter, table_name)
+
+    def _notify(self, table_name: str, changes: list, inserted: bool = False) -> None:
+        """Records changes in the change log and passes them to the write listeners once the current
+        transaction commits"""
+        listeners = list(self.pool.write_listeners)
+
+        def committed():
+            self.pool.change_log.record(table_name, None if inserted else changes)
+            for listener in listeners:
+                listener(table_name, changes)
+
+        self.pool.after_commit(committed)
+
+    def explain(self, query: str, params=()) -> list:
+        """Logs and returns EXPLAIN QUERY PLAN details of a query. Full table scans are added to full_scans,
+        except a scan in rowid order cut short by LIMIT"""
+        with self.connection() as conn:
+            curs = conn.cursor()
+            curs.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            details = [row[3] for row in curs.fetchall()]
+
+        limited = LIMITED_QUERY.match(query) and not any('TEMP B-TREE' in detail for detail in details)
+        for detail in details:
+            logger.debug("%s -> %s", ' '.join(query.split()), detail)
+            if FULL_SCAN.match(detail) and not limited:
+                self.full_scans.append((query, detail))
+        return details
+
+    def _execute(self, curs, query: str, params=()):
+        """Executes a query on a cursor, explaining it first in debug mode"""
+        if self.debug:
+            self.explain(query, params)
+        return curs.execute(query, params)
+
+    def _executemany(self, curs, query: str, rows):
+        """Executes a query for every row on a cursor, explaining it first in debug mode"""
+        if self.debug:
+            rows = iter(rows)
+            first_row = next(rows, None)
+            if first_row is None:
+                return curs.executemany(query, [])
+            self.explain(query, first_row)
+            rows = itertools.chain([first_row], rows)
+        return curs.executemany(query, rows)
+
+    @timed()
     def create_tables(self):
-        """Creates tables in LIBRARY.db"""
-        with self.create_connection() as conn:
+        """Creates tables in LIBRARY.db and migrates them to the latest schema version"""
+        with self.connection() as conn:
             curs = conn.cursor()
             curs.executescript('''
             CREATE TABLE IF NOT EXISTS "users" (
@@ -38,10 +174,59 @@ class DatabaseManager:
                 )
                 ''')
             conn.commit()
+            self._create_search_index(conn)
+            self._migrate(conn)
+        self._columns.clear()
+
+    @staticmethod
+    def _migrate(conn) -> None:
+        """Applies migrations newer than the database's schema version, each in its own transaction"""
+        curs = conn.cursor()
+        current_version = curs.execute("PRAGMA user_version").fetchone()[0]
+        for version, script in MIGRATIONS:
+            if version > current_version:
+                curs.executescript(f"BEGIN; {script} PRAGMA user_version = {version}; COMMIT;")
+                logger.info("Migrated database schema to version %s", version)
+
+    @staticmethod
+    def _create_search_index(conn) -> None:
+        """Creates the full-text index over books, kept in sync by triggers, and fills it from existing rows"""
+        curs = conn.cursor()
+        curs.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='books_fts'")
+        if curs.fetchone() is not None:
+            return
+
+        curs.executescript('''
+        CREATE VIRTUAL TABLE "books_fts" USING fts5(
+            name, author, category,
+            content='books', content_rowid='book_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            );
 
+        CREATE TRIGGER IF NOT EXISTS "books_fts_insert" AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts(rowid, name, author, category)
+            VALUES (new.book_id, new.name, new.author, new.category);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS "books_fts_delete" AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, name, author, category)
+            VALUES ('delete', old.book_id, old.name, old.author, old.category);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS "books_fts_update" AFTER UPDATE ON books BEGIN
+            INSERT INTO books_fts(books_fts, rowid, name, author, category)
+            VALUES ('delete', old.book_id, old.name, old.author, old.category);
+            INSERT INTO books_fts(rowid, name, author, category)
+            VALUES (new.book_id, new.name, new.author, new.category);
+        END;
+
+        INSERT INTO books_fts(books_fts) VALUES ('rebuild');
+            ''')
+
+    @timed()
     def table_exists(self, table_name: str) -> bool:
         """Returns True if specified table exists. Otherwise, returns False"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
             curs.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
             result = curs.fetchone()
@@ -49,70 +234,381 @@ class DatabaseManager:
 
     def get_columns(self, table_name: str) -> list:
         """Returns list of columns in specified table"""
-        with self.create_connection() as conn:
+        if table_name in self._columns:
+            return list(self._columns[table_name])
+
+        with self.connection() as conn:
             curs = conn.cursor()
             curs.execute(f"PRAGMA table_info({table_name})")
             columns = [column[1] for column in curs.fetchall()]
-            return columns
+        if columns:  # Don't remember tables that don't exist yet
+            self._columns[table_name] = columns
+        return list(columns)
+
+    def get_column_types(self, table_name: str) -> dict:
+        """Returns {column: declared type} of a table, e.g. 'INTEGER' or 'TEXT', empty for untyped columns"""
+        with self.connection() as conn:
+            curs = conn.cursor()
+            curs.execute(f"PRAGMA table_info({table_name})")
+            return {column[1]: column[2].upper() for column in curs.fetchall()}
 
+    @timed()
     def is_table_empty(self, table_name: str) -> bool:
         """Returns True if specified table is empty. Otherwise, returns False"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
-            curs.execute(f"SELECT COUNT(*) FROM {table_name}")
+            self._execute(curs, f"SELECT COUNT(*) FROM {table_name}")
             row_count = curs.fetchone()[0]
             return row_count == 0
 
+    @timed()
     def add_record(self, table_name: str, *args):
         """Adds a record based on table name and row values (args).
         Args must match the order of columns"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
             args_placeholders = (len(args) - 1) * '?, ' + '?'  # Question marks needed for query
             query = f"INSERT INTO {table_name} VALUES ({args_placeholders})"
-            curs.execute(query, args)
-            conn.commit()
+            self._execute(curs, query, args)
+            self._notify(table_name, [dict(zip(self.get_columns(table_name), args))], inserted=True)
 
-    def get_random_data(self, table_name: str, sample_size: int):
-        """Returns a list of randomly selected non-repeating rows (tuples) of given size"""
-        with self.create_connection() as conn:
+    @timed()
+    def add_records(self, table_name: str, rows, on_conflict: str = 'IGNORE') -> int:
+        """Adds many records in a single transaction and returns the number of rows inserted.
+
+        Args:
+        - table_name: name of the table to insert into.
+        - rows: iterable of tuples, each matching the order of columns.
+        - on_conflict: 'IGNORE' skips rows violating a constraint, 'REPLACE' overwrites them (upsert),
+          'ABORT' fails the whole batch like add_record does.
+        """
+        on_conflict = on_conflict.upper()
+        if on_conflict not in ('IGNORE', 'REPLACE', 'ABORT'):
+            raise ValueError(f"Unsupported conflict resolution: {on_conflict}")
+
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is None:
+            return 0
+
+        args_placeholders = (len(first_row) - 1) * '?, ' + '?'
+        query = f"INSERT OR {on_conflict} INTO {table_name} VALUES ({args_placeholders})"
+        rows = itertools.chain([first_row], rows)
+        # Replaced rows are changes the change log has to list, like updates
+        listed = bool(self.pool.write_listeners) or on_conflict == 'REPLACE'
+        if listed:  # Listeners need the rows after executemany has consumed them
+            rows = list(rows)
+        with self.connection() as conn:
+            curs = self._executemany(conn.cursor(), query, rows)
+            changes = []
+            if listed:
+                columns = self.get_columns(table_name)
+                changes = [dict(zip(columns, row)) for row in rows]
+            self._notify(table_name, changes, inserted=on_conflict != 'REPLACE')
+            return curs.rowcount  # Unlike total_changes, doesn't count rows written by triggers
+
+    @timed()
+    def get_random_data(self, table_name: str, sample_size: int, rng=random):
+        """Returns a list of randomly selected non-repeating rows (tuples) of given size.
+
+        Picks random rowids between the smallest and largest one and takes the first row at or after
+        each, so the cost grows with sample_size rather than the table size. Rows right after gaps
+        in rowids are somewhat more likely to be picked.
+        """
+        with self.connection() as conn:
             curs = conn.cursor()
-            curs.execute(f"SELECT * FROM {table_name} ORDER BY RANDOM() LIMIT {sample_size}")
-            return curs.fetchall()
+            # Separate subqueries, so each is a single seek to one end of the rowid b-tree
+            self._execute(curs, f"SELECT (SELECT MIN(rowid) FROM {table_name}), (SELECT MAX(rowid) FROM {table_name})")
+            min_rowid, max_rowid = curs.fetchone()
+            if min_rowid is None or sample_size <= 0:
+                return []
 
+            if sample_size >= max_rowid - min_rowid + 1:  # The sample covers the whole table anyway
+                rows = self.load_data(table_name)
+                rng.shuffle(rows)
+                return rows[:sample_size]
+
+            sample = {}
+            query = f"SELECT rowid, * FROM {table_name} WHERE rowid >= ? ORDER BY rowid LIMIT 1"
+            for _ in range(sample_size * 4):
+                if len(sample) == sample_size:
+                    break
+                self._execute(curs, query, (rng.randint(min_rowid, max_rowid),))
+                row = curs.fetchone()
+                if row is not None:
+                    sample[row[0]] = row[1:]
+
+            if len(sample) < sample_size:  # Very sparse rowids, top the sample up the slow way
+                placeholders = ', '.join(['?'] * len(sample))
+                self._execute(curs, f"SELECT rowid, * FROM {table_name} WHERE rowid NOT IN ({placeholders}) "
+                                    f"ORDER BY RANDOM() LIMIT ?", (*sample, sample_size - len(sample)))
+                sample.update((row[0], row[1:]) for row in curs.fetchall())
+
+            rows = list(sample.values())
+            rng.shuffle(rows)
+            return rows
+
+    @timed()
     def get_count_of_relations(self, table_name: str, col_name: str, value_in_col):
         """Returns a count of relationship one entity has"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
-            curs.execute(f"SELECT COUNT ({col_name}) FROM {table_name} WHERE {col_name} = {value_in_col}")
+            self._execute(curs, f"SELECT COUNT ({col_name}) FROM {table_name} WHERE {col_name} = ?", (value_in_col,))
             return curs.fetchone()[0]
 
+    @timed()
     def delete_row_by_key(self, table_name: str, col_name: str, prim_key):
         """Deleter a record based on the primary key"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
-            curs.execute(f"DELETE FROM {table_name} WHERE {col_name} = ?", (prim_key,))
-            conn.commit()
+            self._execute(curs, f"DELETE FROM {table_name} WHERE {col_name} = ?", (prim_key,))
+            self._notify(table_name, [{col_name: prim_key}])
 
+    @timed()
+    def delete_rows(self, table_name: str, col_names: list, keys) -> int:
+        """Deletes many records in a single transaction and returns the number of rows deleted.
+
+        Args:
+        - table_name: name of the table to delete from.
+        - col_names: list of key columns, e.g. ['email', 'book_id'].
+        - keys: iterable of tuples with values for col_names.
+        """
+        condition_str = ' AND '.join([f"{col} = ?" for col in col_names])
+        query = f"DELETE FROM {table_name} WHERE {condition_str}"
+        keys = list(keys)  # The change log and listeners need them after executemany has consumed them
+        with self.connection() as conn:
+            curs = self._executemany(conn.cursor(), query, keys)
+            self._notify(table_name, [dict(zip(col_names, key)) for key in keys])
+            return curs.rowcount
+
+    @timed()
     def load_data(self, table_name: str):
         """Returns all data from a table"""
-        with self.create_connection() as conn:
+        with self.connection() as conn:
+            curs = conn.cursor()
+            self._execute(curs, f"SELECT * FROM {table_name}")
+            return curs.fetchall()
+
+    def iter_rows(self, table_name: str, columns=None, conditions=None, batch_size: int = 1000, order_by: str = None):
+        """Yields lists of up to batch_size rows of a table, so memory stays bounded by one batch.
+
+        columns and conditions work as in search (conditions may use any filter of build_filters),
+        order_by is an optional column to sort by.
+        The rows are read on a connection of their own, which the generator holds until it's exhausted
+        or closed, so other calls made between batches don't share its read transaction.
+        """
+        if columns:
+            self.check_columns(table_name, columns)
+        selected_columns = ', '.join(columns) if columns else '*'
+        where, params = self.build_filters(table_name, conditions)
+        order = ''
+        if order_by:
+            self.check_columns(table_name, [order_by])
+            order = f" ORDER BY {order_by}"
+
+        conn = self.pool.acquire()
+        curs = conn.cursor()
+        try:
+            # Timed from the first to the last batch, including the time the consumer spends between them
+            with measure('database.DatabaseManager.iter_rows') as measurement:
+                curs.arraysize = batch_size
+                self._execute(curs, f"SELECT {selected_columns} FROM {table_name}{where}{order}", params)
+                while True:
+                    rows = curs.fetchmany()
+                    if not rows:
+                        return
+                    measurement.add_rows(len(rows))
+                    yield rows
+        finally:
+            curs.close()  # Ends the read of a generator closed early, so WAL checkpoints aren't held back
+            self.pool.release(conn)
+
+    def check_columns(self, table_name: str, columns) -> None:
+        """Raises ValueError for names that aren't columns of the table, so they can go into SQL text"""
+        known_columns = self.get_columns(table_name)
+        for column in columns:
+            if column not in known_columns:
+                raise ValueError(f"Unknown column of {table_name}: {column}")
+
+    def build_filters(self, table_name: str, filters=None):
+        """Builds a WHERE clause (empty without filters) and its parameters from filter predicates.
+
+        filters maps column names to a value (column = value), a list or set (column IN values) or a
+        (low, high) tuple (low <= column <= high, None for an open end), e.g.
+        {'category': 'fantasy', 'cover_type': ['Hardback', 'Paperback'], 'num_pages': (300, None)}
+        """
+        if not filters:
+            return '', ()
+        self.check_columns(table_name, filters.keys())
+
+        predicates = []
+        params = []
+        for column, value in filters.items():
+            if isinstance(value, tuple):
+                low, high = value
+                if low is not None:
+                    predicates.append(f"{column} >= ?")
+                    params.append(low)
+                if high is not None:
+                    predicates.append(f"{column} <= ?")
+                    params.append(high)
+            elif isinstance(value, (list, set, frozenset)):
+                values = list(value)
+                predicates.append(f"{column} IN ({', '.join(['?'] * len(values))})" if values else "0")
+                params.extend(values)
+            else:
+                predicates.append(f"{column} = ?")
+                params.append(value)
+
+        return (' WHERE ' + ' AND '.join(predicates)) if predicates else '', tuple(params)
+
+    @timed()
+    def count_rows(self, table_name: str, conditions=None) -> int:
+        """Returns the number of rows in a table, optionally matching conditions (filters, see build_filters)"""
+        where, params = self.build_filters(table_name, conditions)
+        with self.connection() as conn:
+            curs = conn.cursor()
+            self._execute(curs, f"SELECT COUNT(*) FROM {table_name}{where}", params)
+            return curs.fetchone()[0]
+
+    @timed()
+    def paginate(self, table_name: str, filters=None, sort_by: str = None, descending: bool = False,
+                 after=None, limit: int = 50, key_col: str = 'book_id') -> list:
+        """Returns one page of rows using a keyset (seek) cursor instead of OFFSET.
+
+        Args:
+        - table_name: name of the table to read.
+        - filters: (Optional) predicates, see build_filters.
+        - sort_by: (Optional) column to sort by, key_col by default. Sorting by an indexed column
+          (see MIGRATIONS) keeps every page a short index range read.
+        - descending: sort order.
+        - after: None for the first page. Otherwise the last row's key_col value when sorting by key_col,
+          or a (sort_by value, key_col value) tuple of the last row when sorting by another column.
+          Rows with a NULL sort_by value come first in ascending order and last in descending order.
+        - limit: maximum number of rows.
+        - key_col: unique column breaking ties between equal sort values.
+        """
+        sort_by = sort_by or key_col
+        self.check_columns(table_name, {sort_by, key_col})
+        where, params = self.build_filters(table_name, filters)
+        direction = 'DESC' if descending else 'ASC'
+        order = f"{sort_by} {direction}" if sort_by == key_col else f"{sort_by} {direction}, {key_col} {direction}"
+
+        rows = []
+        with self.connection() as conn:
+            curs = conn.cursor()
+            for seek, seek_params in self._seek(sort_by, key_col, after, descending):
+                condition = (where + ' AND ' if where else ' WHERE ') + seek if seek else where
+                self._execute(curs, f"SELECT * FROM {table_name}{condition} ORDER BY {order} LIMIT ?",
+                              params + seek_params + (limit - len(rows),))
+                rows.extend(curs.fetchall())
+                if len(rows) == limit:
+                    break
+        return rows
+
+    @staticmethod
+    def _seek(sort_by: str, key_col: str, after, descending: bool) -> list:
+        """Returns the (condition, params) ranges of the rows after the cursor of paginate, in page order.
+
+        A row value comparison never matches NULL, so a cursor on either side of the NULL sort values
+        is split in two index range reads: SQLite sorts NULLs first ascending and last descending.
+        """
+        comparison = '<' if descending else '>'
+        if after is None:
+            return [('', ())]
+        if sort_by == key_col:
+            return [(f"{key_col} {comparison} ?", (after,))]
+
+        value, key = after
+        if value is None:
+            ranges = [(f"{sort_by} IS NULL AND {key_col} {comparison} ?", (key,))]
+            return ranges if descending else ranges + [(f"{sort_by} IS NOT NULL", ())]
+        ranges = [(f"({sort_by}, {key_col}) {comparison} (?, ?)", (value, key))]
+        return ranges + [(f"{sort_by} IS NULL", ())] if descending else ranges
+
+    @timed()
+    def load_page(self, table_name: str, key_col: str, after, limit: int):
+        """Returns up to limit rows ordered by key_col, starting after the given key (None for the first page)"""
+        return self.paginate(table_name, after=after, limit=limit, key_col=key_col)
+
+    @timed()
+    def load_favorites_page(self, email: str, after, limit: int):
+        """Returns up to limit of user's favorite books ordered by book_id, starting after the given book_id"""
+        query = """
+            SELECT b.book_id, b.name, b.author, b.num_pages, b.cover_type, b.category
+            FROM favorites f JOIN books b ON b.book_id = f.book_id
+            WHERE f.email = ? AND f.book_id > ?
+            ORDER BY f.book_id
+            LIMIT ?
+            """
+        with self.connection() as conn:
+            curs = conn.cursor()
+            self._execute(curs, query, (email, -1 if after is None else after, limit))
+            return curs.fetchall()
+
+    @timed()
+    def load_recommendations(self, email: str, limit: int, offset: int = 0) -> list:
+        """Returns up to limit of the books recommended to a user (see modules/recommend.py), best first"""
+        query = """
+            SELECT b.book_id, b.name, b.author, b.num_pages, b.cover_type, b.category
+            FROM recommendations r JOIN books b ON b.book_id = r.book_id
+            WHERE r.email = ?
+            ORDER BY r.rank
+            LIMIT ? OFFSET ?
+            """
+        with self.connection() as conn:
             curs = conn.cursor()
-            curs.execute(f"SELECT * FROM {table_name}")
+            self._execute(curs, query, (email, limit, offset))
             return curs.fetchall()
 
+    @timed()
+    def search_books(self, query: str, limit: int = 50, offset: int = 0) -> list:
+        """Full-text search over book names, authors and categories.
+
+        Every word of the query is matched as a prefix and all words must match.
+        Returns book rows ranked by bm25, with matches in the name weighted highest.
+        """
+        match_expression = build_match_expression(query)
+        if not match_expression:
+            return []
+
+        with self.connection() as conn:
+            curs = conn.cursor()
+            self._execute(curs, """
+                SELECT b.book_id, b.name, b.author, b.num_pages, b.cover_type, b.category
+                FROM books_fts JOIN books b ON b.book_id = books_fts.rowid
+                WHERE books_fts MATCH ?
+                ORDER BY bm25(books_fts, 10.0, 5.0, 1.0)
+                LIMIT ? OFFSET ?
+                """, (match_expression, limit, offset))
+            return curs.fetchall()
+
+    @timed()
+    def count_search_results(self, query: str) -> int:
+        """Returns the number of books search_books would find for a query"""
+        match_expression = build_match_expression(query)
+        if not match_expression:
+            return 0
+
+        with self.connection() as conn:
+            curs = conn.cursor()
+            self._execute(curs, "SELECT COUNT(*) FROM books_fts WHERE books_fts MATCH ?", (match_expression,))
+            return curs.fetchone()[0]
+
+    @timed()
     def search(self, table_name: str, columns=None, conditions=None):
         """Selects specific columns from a table based on multiple conditions.
 
         Args:
         - table_name: The name of the table to select from.
         - columns: (Optional) A list of column names to select. If None, selects all columns.
-        - conditions: (Optional) A dictionary where keys are column names and values are the corresponding condition values.
+        - conditions: (Optional) A dictionary where keys are column names and values are the corresponding
+          condition values.
 
         Returns:
         - A list of tuples, where each tuple represents a row selected from the table.
         """
-        with self.create_connection() as conn:
+        with self.connection() as conn:
             curs = conn.cursor()
             # Building a query
             if columns:
@@ -127,18 +623,21 @@ class DatabaseManager:
                 query += f" WHERE {condition_str}"
                 condition_values = tuple(conditions.values())
 
-            curs.execute(query, condition_values)
+            self._execute(curs, query, condition_values)
             return curs.fetchall()
 
+    @timed()
     def update(self, table_name: str, update_values: dict, conditions: dict):
         """Updates values in table based on multiple parameters
 
         Args:
         - table_name: name of the table to update values.
-        - update_values: dictionary where keys are columns that should be updated and values are values that should be set
+        - update_values: dictionary where keys are columns that should be updated and values are values
+          that should be set
         - conditions: dictionary where keys are condition columns and values are current values
         """
-        with self.create_connection() as conn:
+        changes = [dict(conditions), {**conditions, **update_values}]  # Rows before and after the update
+        with self.connection() as conn:
             curs = conn.cursor()
             query = f'UPDATE {table_name} SET '
             update_cols = ' '.join([f'{val} = ?,' for val in update_values.keys()])[:-1]
@@ -150,5 +649,5 @@ class DatabaseManager:
 
             update_values.extend(condition_values)
 
-            curs.execute(query, update_values)
-            conn.commit()
+            self._execute(curs, query, update_values)
+            self._notify(table_name, changes)
@@ -0,0 +1,133 @@
+import time
+import logging
+import threading
+from modules.connection import interrupt_thread, run_with_retry
+from modules.metrics import LatencyHistogram
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class QueryTask(QRunnable):
+    """A database call run by QueryExecutor on its thread pool"""
+
+    def __init__(self, executor, operation: str, func, args, on_result, on_error, interruptible: bool = False) -> None:
+        super().__init__()
+        self.setAutoDelete(False)  # The executor keeps the task until its result is delivered
+        self.executor = executor
+        self.operation = operation
+        self.func = func
+        self.args = args
+        self.on_result = on_result
+        self.on_error = on_error
+        self.interruptible = interruptible
+        self.cancelled = False
+        self._thread_id = None  # Of the pool thread while the task runs
+        self._lock = threading.Lock()
+
+    def cancel(self) -> None:
+        """Drops the result. A task that hasn't started yet won't run at all, and the statement
+        an interruptible task is running is interrupted so that it stops using its connection"""
+        with self._lock:
+            self.cancelled = True
+            if self.interruptible and self._thread_id is not None:
+                interrupt_thread(self._thread_id)
+
+    def run(self) -> None:
+        with self._lock:
+            if not self.cancelled:
+                self._thread_id = threading.get_ident()
+        if self._thread_id is None:
+            self.executor.task_done.emit(self, None, None)
+            return
+
+        start = time.perf_counter()
+        result = error = None
+        try:
+            result = run_with_retry(self.func, *self.args, is_cancelled=lambda: self.cancelled)
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                self._thread_id = None
+        self.executor.histogram(self.operation).record((time.perf_counter() - start) * 1000)
+        self.executor.task_done.emit(self, result, error)
+
+
+class QueryExecutor(QObject):
+    """Runs database calls off the GUI thread and delivers their results to callbacks on it.
+
+    A call submitted on a channel cancels the call still pending on the same channel, so clicking
+    another button replaces a stale listing instead of showing it late. Cancelling only drops the result,
+    unless the call was submitted as interruptible (reads only, an interrupted write is rolled back).
+    Calls that hit a locked database are retried with backoff, and the latency of each operation is
+    kept in a histogram.
+    """
+
+    task_done = pyqtSignal(object, object, object)  # Task, result, error
+
+    def __init__(self, max_threads: int = 2, parent=None) -> None:
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.histograms = {}
+        self._histograms_lock = threading.Lock()
+        self._channels = {}  # Channel -> its latest task
+        self._tasks = set()
+        self.task_done.connect(self._deliver)  # Queued, since tasks emit it from pool threads
+
+    def histogram(self, operation: str) -> LatencyHistogram:
+        with self._histograms_lock:
+            if operation not in self.histograms:
+                self.histograms[operation] = LatencyHistogram()
+            return self.histograms[operation]
+
+    def submit(self, operation: str, func, *args, on_result=None, on_error=None, channel=None,
+               interruptible: bool = False) -> QueryTask:
+        """Runs func(*args) on the pool. on_result(result) or on_error(exception) is called on the GUI thread.
+        An interruptible call only reads, its statement is interrupted when it's cancelled"""
+        task = QueryTask(self, operation, func, args, on_result, on_error, interruptible)
+        if channel is not None:
+            previous_task = self._channels.get(channel)
+            if previous_task is not None:
+                previous_task.cancel()
+            self._channels[channel] = task
+
+        self._tasks.add(task)
+        self.pool.start(task)
+        return task
+
+    def cancel(self, channel) -> None:
+        """Cancels the pending call of a channel, if any"""
+        task = self._channels.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    def _deliver(self, task: QueryTask, result, error) -> None:
+        self._tasks.discard(task)
+        for channel, latest_task in list(self._channels.items()):
+            if latest_task is task:
+                del self._channels[channel]
+
+        if task.cancelled:
+            return
+        if error is not None:
+            if task.on_error is not None:
+                task.on_error(error)
+            else:
+                logger.error("%s failed: %s", task.operation, error)
+        elif task.on_result is not None:
+            task.on_result(result)
+
+    def report(self) -> str:
+        """Returns a latency summary line per operation"""
+        return '\n'.join(f"{operation}: {histogram.summary()}"
+                         for operation, histogram in sorted(self.histograms.items()))
+
+    def shutdown(self) -> None:
+        """Cancels pending calls, waits for running ones and logs the latency report"""
+        for task in list(self._tasks):
+            task.cancel()
+        self.pool.waitForDone()
+        if self.histograms:
+            logger.info("Query latencies:\n%s", self.report())
@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+import argparse
+import importlib.util
+from modules.database import DatabaseManager
+
+EXPORT_TABLES = ['books', 'favorites']  # Users and sessions aren't exported, they hold password hashes and emails
+
+
+class RowWriter:
+    """Base class of export formats.
+
+    open() is called once with the output path, column names and their declared SQLite types, write()
+    with every batch of rows and close() at the end, so a writer never needs more than one batch in memory.
+    A format that needs an optional package names it in requires.
+    """
+
+    requires = None
+
+    def open(self, path: str, columns: list, types: list = None) -> None:
+        raise NotImplementedError
+
+    def write(self, rows: list) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class CsvWriter(RowWriter):
+    """Writes a CSV file with a header row"""
+
+    def open(self, path: str, columns: list, types: list = None) -> None:
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(columns)
+
+    def write(self, rows: list) -> None:
+        self.writer.writerows(rows)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JsonLinesWriter(RowWriter):
+    """Writes one JSON object per row and line, the format JsonLinesReader imports"""
+
+    def open(self, path: str, columns: list, types: list = None) -> None:
+        self.file = open(path, 'w', encoding='utf-8')
+        self.columns = columns
+
+    def write(self, rows: list) -> None:
+        self.file.writelines(json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def arrow_type(declared_type: str):
+    """Returns the pyarrow type of a column with the given declared SQLite type, by SQLite's affinity rules"""
+    import pyarrow as pa
+
+    declared_type = (declared_type or '').upper()
+    if 'INT' in declared_type:
+        return pa.int64()
+    if any(name in declared_type for name in ('CHAR', 'CLOB', 'TEXT')):
+        return pa.string()
+    if not declared_type or 'BLOB' in declared_type:
+        return pa.binary()
+    return pa.float64()  # REAL and NUMERIC affinity
+
+
+class ParquetWriter(RowWriter):
+    """Writes every batch as a row group of a Parquet file. Needs pyarrow.
+
+    The schema comes from the declared column types, so a column that is NULL throughout the first
+    batch doesn't get pyarrow's null type. Without types it's inferred from the first batch.
+    """
+
+    requires = 'pyarrow'
+
+    def open(self, path: str, columns: list, types: list = None) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq  # Optional dependency, only needed for this format
+
+        self.path = path
+        self.columns = columns
+        self.pq = pq
+        self.schema = None if types is None else pa.schema(
+            [(column, arrow_type(declared_type)) for column, declared_type in zip(columns, types)])
+        self.writer = None  # Opened with the first batch
+
+    def write(self, rows: list) -> None:
+        import pyarrow as pa
+
+        table = pa.table({column: list(values) for column, values in zip(self.columns, zip(*rows))},
+                         schema=self.schema)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table.cast(self.writer.schema))
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+
+
+WRITERS = {
+    '.csv': CsvWriter,
+    '.jsonl': JsonLinesWriter,
+    '.ndjson': JsonLinesWriter,
+    '.parquet': ParquetWriter,
+}
+
+
+def open_writer(path: str) -> RowWriter:
+    """Returns a writer for a file based on its extension. Raises ValueError for unknown formats and
+    formats whose optional package isn't installed, before anything is read or written"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in WRITERS:
+        raise ValueError(f"Unsupported export format: {path}")
+    writer_class = WRITERS[extension]
+    if writer_class.requires and importlib.util.find_spec(writer_class.requires) is None:
+        raise ValueError(f"Exporting {extension} files needs {writer_class.requires}, "
+                         f"install it with: pip install {writer_class.requires}")
+    return writer_class()
+
+
+def export_table(db_manager: DatabaseManager, table_name: str, path: str, columns=None, conditions=None,
+                 batch_size: int = 10000, writer: RowWriter = None, progress=None) -> int:
+    """Streams a table (or the rows matching conditions) to a file and returns the number of rows written.
+
+    The format follows the file extension unless a writer is given. progress is called with the
+    running row count after every batch.
+    """
+    columns = list(columns) if columns else db_manager.get_columns(table_name)
+    column_types = db_manager.get_column_types(table_name)
+    writer = open_writer(path) if writer is None else writer
+    written = 0
+
+    writer.open(path, columns, [column_types.get(column, '') for column in columns])
+    try:
+        for rows in db_manager.iter_rows(table_name, columns, conditions, batch_size):
+            writer.write(rows)
+            written += len(rows)
+            if progress is not None:
+                progress(written)
+    finally:
+        writer.close()
+    return written
+
+
+def iter_frames(db_manager: DatabaseManager, table_name: str, columns=None, conditions=None,
+                chunksize: int = 10000):
+    """Yields pandas DataFrames of up to chunksize rows of a table, read with read_sql on a pooled connection"""
+    import pandas as pd
+
+    if columns:
+        db_manager.check_columns(table_name, columns)
+    selected_columns = ', '.join(columns) if columns else '*'
+    where, params = db_manager.build_filters(table_name, conditions)
+
+    conn = db_manager.pool.acquire()
+    try:
+        yield from pd.read_sql(f"SELECT {selected_columns} FROM {table_name}{where}", conn,
+                               params=params, chunksize=chunksize)
+    finally:
+        db_manager.pool.release(conn)
+
+
+def main(argv=None) -> None:
+    """Command line entry point for nightly exports"""
+    parser = argparse.ArgumentParser(description="Export library tables to CSV, JSON lines or Parquet files",
+                                     epilog="Parquet files need pyarrow (pip install pyarrow).")
+    parser.add_argument('exports', nargs='+', metavar='TABLE=PATH',
+                        help="table and output file, e.g. books=books.parquet favorites=favorites.csv")
+    parser.add_argument('--db', default='LIBRARY.db', help="database file (default: LIBRARY.db)")
+    parser.add_argument('--batch-size', type=int, default=10000, help="rows held in memory at a time (default: 10000)")
+    args = parser.parse_args(argv)
+
+    exports = []
+    for export in args.exports:  # All checked first, so a missing package doesn't stop a nightly run halfway
+        table_name, _, path = export.partition('=')
+        if not path:
+            parser.error(f"Expected TABLE=PATH, got {export}")
+        if table_name not in EXPORT_TABLES:
+            parser.error(f"Can't export {table_name}, choose from {', '.join(EXPORT_TABLES)}")
+        try:
+            open_writer(path)
+        except ValueError as e:
+            parser.error(str(e))
+        exports.append((table_name, path))
+
+    db_manager = DatabaseManager(args.db)
+    for table_name, path in exports:
+        written = export_table(db_manager, table_name, path, batch_size=args.batch_size,
+                               progress=lambda count: print(f"\r{table_name}: {count} rows", end='', flush=True))
+        print(f"\r{table_name}: {written} rows written to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import importlib
+
+UI_DIR = 'ui'
+
+
+def compiled_form_path(name: str, ui_dir: str = UI_DIR) -> str:
+    return os.path.join(ui_dir, f'{name}_ui.py')
+
+
+def load_form(name: str, window):
+    """Sets up a window from the Designer form ui/<name>.ui and returns the object holding its widgets.
+
+    Uses the Python module compiled by `python -m modules.forms` when it's at least as new as the .ui
+    file, which skips parsing the XML at startup. Otherwise falls back to uic.loadUi, so an edited form
+    shows up even before it's compiled again.
+    """
+    ui_path = os.path.join(UI_DIR, f'{name}.ui')
+    compiled_path = compiled_form_path(name)
+    if os.path.exists(compiled_path) and os.path.getmtime(compiled_path) >= os.path.getmtime(ui_path):
+        module = importlib.import_module(f'{UI_DIR}.{name}_ui')
+        form_class = next(getattr(module, attr) for attr in dir(module) if attr.startswith('Ui_'))
+        form = form_class()
+        form.setupUi(window)
+        return form
+
+    from PyQt5.uic import loadUi  # Only needed without compiled forms
+    return loadUi(ui_path, window)
+
+
+def compile_forms(ui_dir: str = UI_DIR) -> list:
+    """Compiles every .ui file of a directory to a <name>_ui.py module next to it, like pyuic5 does"""
+    from PyQt5.uic import compileUi
+
+    compiled = []
+    for file_name in sorted(os.listdir(ui_dir)):
+        name, extension = os.path.splitext(file_name)
+        if extension != '.ui':
+            continue
+        with open(os.path.join(ui_dir, file_name), encoding='utf-8') as ui_file, \
+                open(compiled_form_path(name, ui_dir), 'w', encoding='utf-8') as py_file:
+            compileUi(ui_file, py_file)
+        compiled.append(compiled_form_path(name, ui_dir))
+    return compiled
+
+
+def main() -> None:
+    """Build step: python -m modules.forms [ui directory]"""
+    for path in compile_forms(sys.argv[1] if len(sys.argv) > 1 else UI_DIR):
+        print(f"Compiled {path}")
+
+
+if __name__ == '__main__':
+    main()
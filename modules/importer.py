@@ -0,0 +1,334 @@
+import os
+import re
+import csv
+import json
+import random
+import hashlib
+import argparse
+import itertools
+import threading
+from collections import namedtuple
+from modules.database import DatabaseManager
+from modules.metrics import timed
+
+GOODREADS_LISTS = {
+    'fantasy': 'https://www.goodreads.com/list/show/50.The_Best_Epic_Fantasy_fiction_',
+    'sci-fi': 'https://www.goodreads.com/list/show/4893.Best_Science_Fiction_of_the_21st_Century',
+    'horror': 'https://www.goodreads.com/list/show/135.Best_Horror_Novels',
+    'thriller': 'https://www.goodreads.com/list/show/73283'
+                '.100_Mysteries_and_Thrillers_to_Read_in_a_Lifetime_Readers_Picks'
+}
+
+COVERS = ['Hardback', 'Paperback', 'Softcover']
+AUTHOR_END = re.compile(r'\(|\d')  # The author of a listing title ends where the series info or rating starts
+
+ImportStats = namedtuple('ImportStats', ['source', 'read', 'imported', 'skipped'])
+
+
+class SourceReader:
+    """Base class of catalog sources.
+
+    Subclasses yield raw records from records(): dicts with 'name', 'author', 'num_pages',
+    'cover_type' and 'category' keys, or a 'title' key in the 'Name by Author' listing format.
+    Missing keys are filled in by the normalize stage.
+    """
+
+    def __init__(self, path: str, category: str = None) -> None:
+        self.path = path
+        self.category = category
+
+    @property
+    def source_id(self) -> str:
+        """Identifies the source in import_checkpoints"""
+        if re.match(r'^https?://', self.path):
+            return self.path
+        return os.path.abspath(self.path)
+
+    def records(self):
+        raise NotImplementedError
+
+    def chunks(self, start: int = 0, chunk_size: int = 5000):
+        """Yields lists of up to chunk_size raw records, skipping the first start records"""
+        records = itertools.islice(self.records(), start, None)
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def rows(self, start: int, chunk_size: int, rng: random.Random):
+        """Parse and normalize stages. Yields (records consumed, books rows without book_id) per chunk"""
+        for chunk in self.chunks(start, chunk_size):
+            rows = [normalize_record(parse_record(record), self.category, rng) for record in chunk]
+            yield len(chunk), [row for row in rows if row is not None]
+
+
+class CsvReader(SourceReader):
+    """Reads a CSV file with a header row naming the book columns"""
+
+    def records(self):
+        with open(self.path, newline='', encoding='utf-8') as file:
+            yield from csv.DictReader(file)
+
+
+class JsonLinesReader(SourceReader):
+    """Reads a file with one JSON object per line"""
+
+    def records(self):
+        with open(self.path, encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+
+
+class HtmlListReader(SourceReader):
+    """Reads a book list page saved from Goodreads (or its URL), where the third column is 'Name by Author'"""
+
+    def _listing(self):
+        import pandas as pd  # Only listings need pandas, keep it out of the import path of other sources
+
+        df = pd.read_html(self.path)[0]
+        return pd.DataFrame({'title': df[2]})
+
+    def records(self):
+        for title in self._listing()['title'].astype(str):
+            yield {'title': title}
+
+    def rows(self, start: int, chunk_size: int, rng: random.Random):
+        """Parses and normalizes whole chunks of the listing at once with transform_listing"""
+        import numpy as np
+
+        listing = self._listing().iloc[start:]
+        np_rng = np.random.default_rng(rng.getrandbits(64))
+        for offset in range(0, len(listing), chunk_size):
+            chunk = listing.iloc[offset:offset + chunk_size]
+            books = transform_listing(chunk, self.category, np_rng)
+            yield len(chunk), list(books.itertuples(index=False, name=None))
+
+
+READERS = {
+    '.csv': CsvReader,
+    '.jsonl': JsonLinesReader,
+    '.ndjson': JsonLinesReader,
+    '.html': HtmlListReader,
+    '.htm': HtmlListReader,
+}
+
+
+def open_reader(path: str, category: str = None) -> SourceReader:
+    """Returns a reader for a file or URL based on its extension"""
+    if re.match(r'^https?://', path):
+        return HtmlListReader(path, category)
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported catalog format: {path}")
+    return READERS[extension](path, category)
+
+
+def default_readers() -> list:
+    """Returns readers of catalog dumps listed in LIBRARY_CATALOG (separated by os.pathsep),
+    falling back to the Goodreads lists the app started with"""
+    paths = os.environ.get('LIBRARY_CATALOG')
+    if paths:
+        return [open_reader(path) for path in paths.split(os.pathsep) if path]
+    return [HtmlListReader(url, category) for category, url in GOODREADS_LISTS.items()]
+
+
+def parse_record(record: dict) -> dict:
+    """Splits a listing 'title' into name and author at the last ' by ', so names containing 'by' stay whole"""
+    if record.get('name') or not record.get('title'):
+        return record
+
+    name, _, author = record['title'].rpartition(' by ')
+    if not name:  # No author in the title
+        name, author = author, ''
+    author = AUTHOR_END.split(author, 1)[0]
+    return dict(record, name=name, author=author)
+
+
+def collapse_whitespace(values):
+    """Strips a Series of strings and collapses runs of whitespace inside them to single spaces"""
+    values = values.str.strip()
+    spaced = values.str.contains(r'\s\s|[^\S ]', regex=True, na=False)
+    if spaced.any():  # Rare in listings, so only those rows go through the replace
+        values = values.mask(spaced, values[spaced].str.replace(r'\s+', ' ', regex=True))
+    return values
+
+
+def transform_listing(listing, category: str = None, rng=None):
+    """Column-wise parse, normalize and dedupe stages for a listing DataFrame.
+
+    listing has a 'title' column in the 'Name by Author ...' format. Returns a DataFrame with the books
+    columns except book_id, where books with the same normalized name and author appear once.
+    The string operations run as pyarrow compute kernels if pyarrow is installed.
+    """
+    import numpy as np
+    import pandas as pd
+
+    try:
+        import pyarrow as pa
+
+        string_dtype = pd.ArrowDtype(pa.string())
+    except ImportError:
+        string_dtype = object
+    rng = np.random.default_rng() if rng is None else rng
+
+    # Split at the last ' by ' like parse_record, so names containing 'by' stay whole. The ' by ' put in
+    # front gives every title two parts, a title without an author gets an empty name
+    parts = (' by ' + listing['title'].astype(str).astype(string_dtype)).str.rsplit(' by ', n=1)
+    split = parts.list if isinstance(parts.dtype, pd.ArrowDtype) else parts.str
+    names, authors = split[0].str.slice(4), split[1]
+    untitled = names.str.strip() == ''
+    if untitled.any():  # The title is the name
+        names = names.mask(untitled, authors)
+        authors = authors.mask(untitled)
+    names = collapse_whitespace(names)
+    authors = collapse_whitespace(authors.str.replace(r'[(\d].*$', '', regex=True))  # Like AUTHOR_END
+    authors = authors.mask(authors == '')
+
+    # Dedupe on a 64-bit hash of the normalized name and author like dedupe_key, before SQLite assigns book ids.
+    # lower() runs in pyarrow where casefold() doesn't, CatalogImporter still checks dedupe_key on insert.
+    # pandas hashes strings up to the first NUL, hence the unit separator instead of dedupe_key's '\0'
+    normalized = (names + '\x1f' + authors.fillna('')).str.lower()
+    keys = pd.util.hash_pandas_object(normalized, index=False, categorize=False)
+    keep = (names != '').to_numpy() & ~keys.duplicated().to_numpy()
+    names, authors = names[keep].astype(object), authors[keep].astype(object)
+
+    size = len(names)
+    category_codes = np.full(size, 0 if category else -1, dtype=np.int8)
+    return pd.DataFrame({
+        'name': names,
+        'author': authors.where(authors.notna(), None),
+        'num_pages': rng.integers(300, 901, size=size),
+        'cover_type': pd.Categorical.from_codes(rng.integers(0, len(COVERS), size=size, dtype=np.int8),
+                                                categories=COVERS),
+        'category': pd.Categorical.from_codes(category_codes, categories=[category] if category else []),
+    }, index=names.index)
+
+
+def normalize_record(record: dict, category: str, rng: random.Random):
+    """Returns a books row (without book_id) from a parsed record, or None if it has no name"""
+    name = ' '.join(str(record.get('name') or '').split())
+    if not name:
+        return None
+    author = ' '.join(str(record.get('author') or '').split()) or None
+
+    try:
+        num_pages = int(record.get('num_pages'))
+    except (TypeError, ValueError):
+        num_pages = rng.randint(300, 900)
+
+    cover_type = record.get('cover_type') or rng.choice(COVERS)
+    category = record.get('category') or category
+    return name, author, num_pages, cover_type, category
+
+
+def dedupe_key(name: str, author) -> int:
+    """Returns a 64-bit hash of a book's case- and whitespace-insensitive name and author"""
+    normalized = ' '.join(name.casefold().split()) + '\0' + ' '.join((author or '').casefold().split())
+    return int.from_bytes(hashlib.blake2b(normalized.encode(), digest_size=8).digest(), 'little')
+
+
+class CatalogImporter:
+    """Streams catalog sources into the books table.
+
+    Each chunk of records goes through parse, normalize and dedupe stages and is inserted with one
+    executemany, in the same transaction that advances the source's checkpoint. An interrupted import
+    therefore resumes after the last committed chunk when run again.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, batch_size: int = 5000, progress=None, seed=None) -> None:
+        self.db_manager = db_manager
+        self.db_manager.create_tables()  # Makes sure books and import_checkpoints exist
+        self.batch_size = batch_size
+        self.progress = progress  # Called with ImportStats after every committed chunk
+        self.rng = random.Random(seed)
+        self._seen = None  # Dedupe keys of books in the database, loaded on first run
+        self._stop = threading.Event()
+
+    def stop(self) -> None:
+        """Asks a running import to stop after the current chunk"""
+        self._stop.set()
+
+    def _load_seen(self) -> set:
+        if self._seen is None:
+            self._seen = set()
+            with self.db_manager.connection() as conn:
+                for name, author in conn.execute("SELECT name, author FROM books"):
+                    self._seen.add(dedupe_key(name, author))
+        return self._seen
+
+    def checkpoint(self, reader: SourceReader) -> int:
+        """Returns the number of records of a source already imported"""
+        rows = self.db_manager.search('import_checkpoints', ['position'], {'source': reader.source_id})
+        return rows[0][0] if rows else 0
+
+    def reset(self, reader: SourceReader) -> None:
+        """Forgets a source's checkpoint, so it's read from the start again"""
+        self.db_manager.delete_row_by_key('import_checkpoints', 'source', reader.source_id)
+
+    @timed()
+    def run(self, reader: SourceReader) -> ImportStats:
+        """Imports a source from its checkpoint and returns the counts of this run"""
+        seen = self._load_seen()
+        position = self.checkpoint(reader)
+        read = imported = 0
+
+        for consumed, chunk_rows in reader.rows(position, self.batch_size, self.rng):
+            if self._stop.is_set():
+                break
+
+            # Dedupe stage, against books already in the database and earlier chunks
+            rows = []
+            for row in chunk_rows:
+                key = dedupe_key(row[0], row[1])
+                if key in seen:
+                    continue
+                seen.add(key)
+                rows.append((None, *row))  # book_id is assigned by SQLite
+
+            position += consumed
+            with self.db_manager.connection():
+                imported += self.db_manager.add_records('books', rows)
+                self.db_manager.add_records('import_checkpoints', [(reader.source_id, position)], 'REPLACE')
+            read += consumed
+
+            if self.progress is not None:
+                self.progress(ImportStats(reader.source_id, read, imported, read - imported))
+
+        return ImportStats(reader.source_id, read, imported, read - imported)
+
+
+@timed()
+def scrape_books() -> None:
+    """ Scrapes books from 'goodreads.com' and stores them to database"""
+    importer = CatalogImporter(DatabaseManager('LIBRARY.db'))
+    for category, url in GOODREADS_LISTS.items():
+        importer.run(HtmlListReader(url, category))
+
+
+def main(argv=None) -> None:
+    """Command line entry point for headless bulk loads"""
+    parser = argparse.ArgumentParser(description="Import book catalogs (CSV, JSON lines, HTML lists) into the library")
+    parser.add_argument('sources', nargs='+', help="catalog files or list URLs")
+    parser.add_argument('--db', default='LIBRARY.db', help="database file (default: LIBRARY.db)")
+    parser.add_argument('--category', help="category for records that don't have one")
+    parser.add_argument('--batch-size', type=int, default=5000, help="records per transaction (default: 5000)")
+    parser.add_argument('--restart', action='store_true', help="ignore checkpoints and read sources from the start")
+    args = parser.parse_args(argv)
+
+    def report(stats: ImportStats) -> None:
+        print(f"\r{stats.source}: read {stats.read}, imported {stats.imported}", end='', flush=True)
+
+    importer = CatalogImporter(DatabaseManager(args.db), args.batch_size, report)
+    for source in args.sources:
+        reader = open_reader(source, args.category)
+        if args.restart:
+            importer.reset(reader)
+        stats = importer.run(reader)
+        print(f"\r{stats.source}: read {stats.read}, imported {stats.imported}, skipped {stats.skipped}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,54 +1,18 @@
-import sqlite3
-import json
-import random
-import pandas as pd
+import os
+from modules.cache import CatalogCache
+from modules.connection import is_lock_error
 from modules.database import DatabaseManager
-from PyQt5.QtWidgets import QMainWindow, QTableWidgetItem
-from PyQt5.uic import loadUi
-
-
-def scrape_books() -> None:
-    """ Scrapes books from 'goodreads.com' and stores them to database"""
-
-    urls = {
-        'fantasy': 'https://www.goodreads.com/list/show/50.The_Best_Epic_Fantasy_fiction_',
-        'sci-fi': 'https://www.goodreads.com/list/show/4893.Best_Science_Fiction_of_the_21st_Century',
-        'horror': 'https://www.goodreads.com/list/show/135.Best_Horror_Novels',
-        'thriller': 'https://www.goodreads.com/list/show/73283'
-                    '.100_Mysteries_and_Thrillers_to_Read_in_a_Lifetime_Readers_Picks'
-    }
-
-    covers = ['Hardback', 'Paperback', 'Softcover']
-    dfs = []  # Stores pandas dataframes from different webpages
-    # Iterate over URLs and get books from them using pandas
-    for category, url in urls.items():
-        df = pd.read_html(url)[0]
-        df['name'] = df[2].apply(lambda x: x.split('by')[0])
-        df['author'] = df[2].apply(lambda x: x.split('by')[1])
-        df['author'] = df['author'].str.split(r'\(|\d', expand=True)[0]
-        df['num_pages'] = [random.randint(300, 900) for _ in range(len(df))]
-        df['cover_type'] = [random.choice(covers) for _ in range(len(df))]
-        df['category'] = [category for _ in range(len(df))]
-
-        df = df[['name', 'author', 'num_pages', 'cover_type', 'category']]
-        dfs.append(df)
-
-    # Concatenate dataframes into single dataframe and save to database
-    full_df = pd.concat(dfs, axis=0)
-    book_ids = [book_id for book_id in range(1, len(full_df) + 1)]
-    full_df.insert(0, 'book_id', book_ids)
-    full_df.drop_duplicates(subset=['name', 'author'], keep='first', inplace=True)
-
-    # Save to database
-    db_manager = DatabaseManager('LIBRARY.db')
-    with db_manager.create_connection() as conn:
-        full_df.to_sql('books', conn, if_exists='append', index=False)
-
-
-def get_current_item(file_name: str, item_name: str) -> str:
-    """Returns current user email"""
-    with open(file_name, 'r') as file:
-        return json.load(file)[item_name]
+from modules.executor import QueryExecutor
+from modules.forms import load_form
+from modules.importer import CatalogImporter, default_readers
+from modules.metrics import measure, timed
+from modules.models import BookTableModel, PAGE_SIZE
+from modules.recommend import Recommender
+from modules.services import LibraryService
+from modules.snapshot import CatalogSnapshot, COLUMNS
+from modules.writeback import FavoritesWriteQueue
+from PyQt5.QtCore import QTimer, QThread, pyqtSignal, pyqtSlot
+from PyQt5.QtWidgets import QMainWindow, QAbstractItemView
 
 
 def clear_label(labels: list) -> None:
@@ -58,148 +22,339 @@ def clear_label(labels: list) -> None:
         label.setText("")
 
 
-def populate_book_table(data, widget) -> None:
-    """Populates table with books"""
-    column_names = ['Book ID', 'Name', 'Author', 'Page count', 'Cover type', 'Category']
-    widget.setRowCount(len(data))
-    widget.setColumnCount(len(data[0]))
-
-    # Populate the table with the fetched data
-    for row_num, row_data in enumerate(data):
-        for col_num, cell_data in enumerate(row_data):
-            item = QTableWidgetItem(str(cell_data))
-            widget.setItem(row_num, col_num, item)
-
-
-def get_selected_rows_from_table(widget, columns) -> list:
-    """Returns list of selected rows from table"""
-    column_count = len(columns)
-    selected_rows = []
-    for current in widget.selectionModel().selectedRows():
-        row = []
-        for column in range(column_count):
-            item = widget.item(current.row(), column)
-            if item is not None:
-                row.append(item.text())
-            else:
-                row.append('')  # Append empty string if item is None
-        selected_rows.append(tuple(row))
-    return selected_rows
+@timed()
+def populate_book_table(fetch_page, total_rows: int, widget, first_page=None, executor=None,
+                        on_error=None) -> BookTableModel:
+    """Populates table with a model that loads books page by page while scrolling,
+    on the executor's threads if one is given"""
+    model = BookTableModel(fetch_page, total_rows, parent=widget, first_page=first_page, executor=executor,
+                           on_error=on_error)
+    previous_model = widget.model()
+    widget.setModel(model)
+    if previous_model is not None:  # Release pages cached by the previous listing
+        previous_model.cancel_fetches()
+        previous_model.deleteLater()
+    return model
+
+
+def get_selected_keys(widget):
+    """Returns a function returning the keys (book ids) of the rows selected in a table, or None if no
+    rows are selected. Call it off the GUI thread, it may have to fetch pages that aren't cached"""
+    model = widget.model()
+    if model is None:
+        return None
+
+    rows = sorted(index.row() for index in widget.selectionModel().selectedRows())
+    return model.row_keys(rows) if rows else None
+
+
+class ImportWorker(QThread):
+    """Imports catalog sources into the database in a background thread"""
+
+    progress = pyqtSignal(int)  # Number of books imported so far
+    failed = pyqtSignal(str)
+
+    def __init__(self, db_manager, readers, parent=None) -> None:
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.readers = readers
+        self.importer = None  # Created in run(), its schema check mustn't block the GUI thread
+        self.stopped = False
+        self.imported = 0  # Books imported by finished sources
+
+    def report(self, stats) -> None:
+        self.progress.emit(self.imported + stats.imported)
+
+    def run(self) -> None:
+        try:
+            self.importer = CatalogImporter(self.db_manager, progress=self.report)
+            if self.stopped:  # stop() came before the importer existed
+                return
+            for reader in self.readers:
+                self.imported += self.importer.run(reader).imported
+        except Exception as e:  # Network and parsing errors of any source end the import
+            self.failed.emit(str(e))
+
+    def stop(self) -> None:
+        """Stops the import after the current chunk and waits for the thread to finish"""
+        self.stopped = True
+        if self.importer is not None:
+            self.importer.stop()
+        self.wait()
 
 
 class Library(QMainWindow):
     """A class to manage a virtual library of books"""
 
-    def __init__(self, widget) -> None:
+    def __init__(self, widget, session) -> None:
         super().__init__()
 
+        self.session = session
         self.db_manager = DatabaseManager('LIBRARY.db')
-        self.db_manager.create_tables()
-        if self.db_manager.is_table_empty('books'):
-            scrape_books()
+        # Favorite ids and counts, invalidated by the database's write listener when favorites change
+        self.catalog_cache = CatalogCache(self.db_manager)
+        # Favorites changes show up right away and are written in batches, see FavoritesWriteQueue
+        self.favorites_queue = FavoritesWriteQueue(self.db_manager)
+        self.service = LibraryService(self.db_manager, self.catalog_cache, self.favorites_queue)
+        # Built on the first "Recommended for you" click, then kept up to date with the favorites changes
+        self.recommender = Recommender(self.db_manager)
+        # LIBRARY_SNAPSHOT=1 loads the catalog into memory after it was first shown, then searches
+        # and sorting by a column header run on the in-memory copy instead of SQLite
+        self.snapshot = CatalogSnapshot(self.db_manager) if os.environ.get('LIBRARY_SNAPSHOT') else None
+        self.snapshot_requested = False
+        self.sort_column = 'book_id'
+        self.sort_descending = False
+        # Slots hand their database work to the executor, so the window never waits on SQLite
+        self.executor = QueryExecutor(parent=self)
 
         # Set up the user interface from Designer
-        self.lib_ui = loadUi("ui/library.ui", self)
+        self.lib_ui = load_form("library", self)
         self.widget = widget
 
+        # The schema check and, on the first run, the catalog import happen in the background
+        # instead of delaying the window
+        self.import_worker = None
+        self.executor.submit('prepare_database', self.prepare_database, on_result=self.database_ready,
+                             on_error=self.show_error)
+
         self.lib_ui.pushButton.clicked.connect(self.logout)
         self.lib_ui.pushButton_3.clicked.connect(self.show_all_books)
         self.lib_ui.pushButton_2.clicked.connect(self.add_to_favorites)
         self.lib_ui.pushButton_4.clicked.connect(self.show_favorites)
         self.lib_ui.pushButton_5.clicked.connect(self.delete_from_favorites)
+        self.lib_ui.pushButton_6.clicked.connect(self.show_recommendations)
+
+        # Search runs once the user pauses typing, or right away on Enter
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(300)
+        self.search_timer.timeout.connect(self.search_books)
+        self.lib_ui.lineEdit.textChanged.connect(self.search_timer.start)
+        self.lib_ui.lineEdit.returnPressed.connect(self.search_books)
 
         # Set the background color of the header row and column to transparent
         header_style = """QHeaderView::section { background-color: lightblue; }"""
-        self.lib_ui.tableWidget.horizontalHeader().setStyleSheet(header_style)
-        self.lib_ui.tableWidget.verticalHeader().setStyleSheet(header_style)
+        self.lib_ui.tableView.horizontalHeader().setStyleSheet(header_style)
+        self.lib_ui.tableView.verticalHeader().setStyleSheet(header_style)
+        self.lib_ui.tableView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.lib_ui.tableView.horizontalHeader().sectionClicked.connect(self.sort_books)
+
+    def prepare_database(self) -> bool:
+        """Creates or migrates the schema and returns True if the library has no books yet"""
+        self.db_manager.create_tables()
+        return self.db_manager.is_table_empty('books')
+
+    def database_ready(self, is_empty: bool) -> None:
+        if is_empty:
+            self.start_import(default_readers())
+
+    def start_import(self, readers) -> None:
+        """Starts importing catalog sources, reporting progress in the info label"""
+        self.import_worker = ImportWorker(self.db_manager, readers, self)
+        self.import_worker.progress.connect(
+            lambda imported: self.lib_ui.label_3.setText(f"Importing books... {imported} imported so far"))
+        self.import_worker.failed.connect(
+            lambda error: self.lib_ui.label_3.setText(f"Could not import books: {error}"))
+        self.import_worker.finished.connect(self.import_finished)
+        self.lib_ui.label_3.setText("Importing books...")
+        self.import_worker.start()
+
+    def import_finished(self) -> None:
+        """Shows the result of a finished import"""
+        if self.import_worker.imported:
+            self.lib_ui.label_3.setText(f"Import finished. {self.import_worker.imported} books added to the library")
+
+    def stop_import(self) -> None:
+        """Stops a running import, it resumes from its checkpoint on the next start"""
+        if self.import_worker is not None and self.import_worker.isRunning():
+            self.import_worker.stop()
 
     def showEvent(self, event) -> None:
         """Shows currently active user's email label on library page"""
         super().showEvent(event)
         if self.widget.currentIndex() == 2:
-            self.lib_ui.label_5.setText(f"Logged in as: {get_current_item('utils/current_user.json', 'email')}")
+            self.lib_ui.label_5.setText(f"Logged in as: {self.session.email}")
 
+    @pyqtSlot()
+    @timed()
     def logout(self) -> None:
         """Allows a user to log out and return to login screen"""
         self.widget.setCurrentIndex(0)
 
-        with open('utils/current_user.json', 'w') as file:
-            json.dump({'email': ""}, file, indent=4)
+        self.session.logout()
+        self.executor.cancel('listing')  # A listing still loading mustn't show up after logout
 
-        # Clears the info label when switching window
+        # Clears the info label and search box when switching window
+        self.lib_ui.lineEdit.blockSignals(True)
+        self.lib_ui.lineEdit.clear()
+        self.lib_ui.lineEdit.blockSignals(False)
         clear_label([self.lib_ui.label_3, self.lib_ui.label_5, self.lib_ui.label_6, self.lib_ui.label_7])
         # Clears the table of all books
-        self.lib_ui.tableWidget.clearContents()
-        self.lib_ui.tableWidget.setRowCount(0)
-
+        model = self.lib_ui.tableView.model()
+        self.lib_ui.tableView.setModel(None)
+        if model is not None:
+            model.cancel_fetches()
+            model.deleteLater()
+
+    def show_error(self, error: Exception) -> None:
+        """Shows a failed database call in the info label"""
+        self.lib_ui.label_4.setStyleSheet("color: red; background-color: transparent")
+        if is_lock_error(error):
+            self.lib_ui.label_4.setText("The database is busy. Close other programs using it and try again")
+        elif isinstance(error, ImportError):
+            self.lib_ui.label_4.setText(f"This feature needs the {error.name} package, install it with pip")
+        else:
+            self.lib_ui.label_4.setText(f"Database error: {error}")
+
+    def show_listing(self, view: str, fetch_page, count, describe) -> None:
+        """Counts and fetches the first page of a listing in the background, then displays it.
+        A listing requested later replaces this one if it hasn't been displayed yet, and interrupts
+        its queries. count and fetch_page must only read"""
+        def load():
+            return count(), fetch_page(None, 0, PAGE_SIZE)
+
+        def show(result):
+            total_rows, first_page = result
+            with measure(f'library.show.{view}') as measurement:
+                populate_book_table(fetch_page, total_rows, self.lib_ui.tableView, first_page, self.executor,
+                                    self.show_error)
+                self.lib_ui.label_3.setText(describe(total_rows))
+                self.session.current_view = view
+                measurement.add_rows(len(first_page))
+
+        self.executor.submit(view, load, on_result=show, on_error=self.show_error, channel='listing',
+                             interruptible=True)
+
+    @pyqtSlot()
+    @timed()
     def show_all_books(self) -> None:
         """Reads DB and displays all books from it"""
-        data = self.db_manager.load_data('books')
-
-        populate_book_table(data, self.lib_ui.tableWidget)
-
-        self.lib_ui.label_3.setText(f"Showing all books. Total books: {len(data)}")
-
-        with open('utils/current_table.json', 'w') as file:
-            json.dump({'current_table': 'all_books'}, file, indent=4)
-
+        def describe(total_books):
+            return f"Showing all books. Total books: {total_books}"
+
+        if self.snapshot is not None and self.snapshot.ready:
+            self.show_snapshot_listing('all_books', describe)
+            return
+
+        self.show_listing('all_books',
+                          lambda after, offset, limit: self.service.list_books(after, limit),
+                          self.service.count_books, describe)
+        if self.snapshot is not None and not self.snapshot_requested:
+            self.snapshot_requested = True
+            self.executor.submit('build_snapshot', self.snapshot.build, on_error=self.show_error)
+
+    def show_snapshot_listing(self, view: str, describe, query: str = None) -> None:
+        """Shows the books of the in-memory snapshot matching query, in the current sort order"""
+        selection = self.snapshot.select(query, sort_by=self.sort_column, descending=self.sort_descending)
+        self.show_listing(view, lambda after, offset, limit: selection.page(offset, limit), selection.count, describe)
+
+    @pyqtSlot(int)
+    @timed()
+    def sort_books(self, section: int) -> None:
+        """Sorts the listed books by the clicked column, in reverse when it's clicked again"""
+        if self.session.current_view not in ('all_books', 'search_results'):
+            return
+        if self.snapshot is None or not self.snapshot.ready:
+            self.lib_ui.label_4.setStyleSheet("color: red; background-color: transparent")
+            self.lib_ui.label_4.setText("Sorting is available once the catalog is loaded into memory")
+            return
+
+        column = COLUMNS[section]
+        self.sort_descending = not self.sort_descending if column == self.sort_column else False
+        self.sort_column = column
+        if self.session.current_view == 'search_results':
+            self.search_books()
+        else:
+            self.show_all_books()
+
+    @pyqtSlot()
+    @timed()
+    def search_books(self) -> None:
+        """Displays books matching the text in the search box, best matches first"""
+        self.search_timer.stop()
+        query = self.lib_ui.lineEdit.text().strip()
+        if not query:
+            self.show_all_books()
+            return
+
+        def describe(total_found):
+            return f"Showing search results for '{query}'. Books found: {total_found}"
+
+        if self.snapshot is not None and self.snapshot.ready:  # Sorted by column rather than by relevance
+            self.show_snapshot_listing('search_results', describe, query)
+            return
+        self.show_listing('search_results',
+                          lambda after, offset, limit: self.service.search(query, limit, offset),
+                          lambda: self.service.count_search_results(query), describe)
+
+    @pyqtSlot()
+    @timed()
     def add_to_favorites(self) -> None:
         """Adds selected books to user's favorites"""
-        # Getting selected rows from the tableWidget
-        selected_rows = get_selected_rows_from_table(self.lib_ui.tableWidget, self.db_manager.get_columns('books'))
+        selected_keys = get_selected_keys(self.lib_ui.tableView)
+        if selected_keys is None:
+            self.lib_ui.label_4.setStyleSheet("color: red; background-color: transparent")
+            self.lib_ui.label_4.setText("No books selected to be added")
+            return
 
-        # Read currently logged-in user
-        email = get_current_item('utils/current_user.json', 'email')
+        def show_added(added):
+            self.lib_ui.label_4.setStyleSheet("color: green; background-color: transparent")
+            self.lib_ui.label_4.setText(f"Added {added} books to favorites")
 
-        # Add selected rows to user's favorites
-        for row in selected_rows:
-            try:
-                self.db_manager.add_record('favorites', email, int(row[0]))
-            except sqlite3.IntegrityError:
-                pass
+        # Add selected rows to user's favorites, books already there are skipped
+        email = self.session.email
+        self.executor.submit('add_to_favorites', lambda: self.service.add_favorites(email, selected_keys()),
+                             on_result=show_added, on_error=self.show_error)
 
+    @pyqtSlot()
+    @timed()
     def show_favorites(self) -> None:
         """Shows list of user's favorite books"""
-        query = """
-            SELECT b.book_id, b.name, b.author, b.num_pages, b.cover_type, b.category
-            FROM books b JOIN favorites f ON b.book_id = f.book_id
-            WHERE f.email = ?
-            """
-
-        email = get_current_item('utils/current_user.json', 'email')
-        with self.db_manager.create_connection() as conn:
-            curs = conn.cursor()
-            curs.execute(query, (email,))
-            data = curs.fetchall()
-
-        populate_book_table(data, self.lib_ui.tableWidget)
-
-        with open('utils/current_table.json', 'w') as file:
-            json.dump({'current_table': 'favorite_books'}, file, indent=4)
-
-        self.lib_ui.label_3.setText(f"Showing favorites. You have {len(data)} favorite books")
-
+        email = self.session.email
+        self.show_listing('favorite_books',
+                          lambda after, offset, limit: self.service.favorites_page(email, after, limit),
+                          lambda: self.service.count_favorites(email),
+                          lambda total_favorites: f"Showing favorites. You have {total_favorites} favorite books")
+
+    @pyqtSlot()
+    @timed()
+    def show_recommendations(self) -> None:
+        """Shows books recommended to the user from the favorites of everyone"""
+        email = self.session.email
+
+        def refresh():  # Writes, so it isn't part of the interruptible listing
+            self.favorites_queue.flush()
+            self.recommender.refresh()
+
+        def show(_):  # The recommendations take the latest favorites changes into account
+            self.show_listing('recommended_books',
+                              lambda after, offset, limit: self.service.recommended_books(email, limit, offset),
+                              lambda: self.service.count_recommendations(email),
+                              lambda total: f"Showing {total} books recommended for you" if total else
+                              "No recommendations yet. Add some books to your favorites first")
+
+        # On the listing channel, so that another listing requested meanwhile is shown instead
+        self.executor.submit('refresh_recommendations', refresh, on_result=show, on_error=self.show_error,
+                             channel='listing')
+
+    @pyqtSlot()
+    @timed()
     def delete_from_favorites(self) -> None:
         """Deletes selected books from user's favorites"""
-        # Read currently displayed table
-        current_table = get_current_item('utils/current_table.json', 'current_table')
-
-        if current_table == 'favorite_books':
-            # Removing selected books from user's favorites
-            selected_rows = get_selected_rows_from_table(self.lib_ui.tableWidget, self.db_manager.get_columns('books'))
-            for row in selected_rows:
-                self.db_manager.delete_row_by_key('favorites', 'book_id', int(row[0]))
+        selected_keys = get_selected_keys(self.lib_ui.tableView)
 
-            self.lib_ui.label_4.setStyleSheet("color: green; background-color: transparent")
-            self.lib_ui.label_4.setText("Removed selected books from favorites")
-
-            # Refresh the table of favorite books
-            if selected_rows:
+        if self.session.current_view == 'favorite_books' and selected_keys is not None:
+            def show_removed(removed):
+                self.lib_ui.label_4.setStyleSheet("color: green; background-color: transparent")
+                self.lib_ui.label_4.setText(f"Removed {removed} books from favorites")
+                # Refresh the table of favorite books
                 self.show_favorites()
 
-            else:
-                self.lib_ui.label_4.setStyleSheet("color: red; background-color: transparent")
-                self.lib_ui.label_4.setText("No books selected to be removed")
+            # Removing selected books from user's favorites
+            email = self.session.email
+            self.executor.submit('delete_from_favorites',
+                                 lambda: self.service.remove_favorites(email, selected_keys()),
+                                 on_result=show_removed, on_error=self.show_error)
 
         else:
             self.lib_ui.label_4.setStyleSheet("color: red; background-color: transparent")
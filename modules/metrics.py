@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import bisect
+import atexit
+import threading
+import functools
+from contextlib import contextmanager
+
+
+class LatencyHistogram:
+    """Counts latencies into fixed buckets (milliseconds) and estimates percentiles from them"""
+
+    BOUNDS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+
+    def __init__(self, bounds=None) -> None:
+        self.bounds = list(bounds or self.BOUNDS)
+        self.counts = [0] * len(self.bounds)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency_ms: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.bounds, latency_ms)] += 1
+            self.total += 1
+            self.sum_ms += latency_ms
+            self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, fraction: float) -> float:
+        """Returns the upper bound of the bucket holding the given fraction (0-1) of samples"""
+        with self._lock:
+            if not self.total:
+                return 0.0
+            threshold = fraction * self.total
+            seen = 0
+            for bound, count in zip(self.bounds, self.counts):
+                seen += count
+                if seen >= threshold:
+                    return min(bound, self.max_ms)
+            return self.max_ms
+
+    def summary(self) -> str:
+        mean = self.sum_ms / self.total if self.total else 0.0
+        return (f"n={self.total} mean={mean:.1f}ms p50<={self.percentile(0.5):.0f}ms "
+                f"p95<={self.percentile(0.95):.0f}ms p99<={self.percentile(0.99):.0f}ms max={self.max_ms:.1f}ms")
+
+
+# Database calls take microseconds, so the instrumented calls get finer buckets than query tasks
+CALL_BOUNDS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float('inf')]
+
+
+class CallStats:
+    """Calls, errors, rows returned and latencies of one instrumented function or block"""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.latency = LatencyHistogram(CALL_BOUNDS)
+        self._lock = threading.Lock()
+
+    def add(self, latency_ms: float, rows: int = 0, failed: bool = False) -> None:
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.rows += rows
+        self.latency.record(latency_ms)
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'mean_ms': self.latency.sum_ms / self.latency.total if self.latency.total else 0.0,
+            'p50_ms': self.latency.percentile(0.5),
+            'p95_ms': self.latency.percentile(0.95),
+            'p99_ms': self.latency.percentile(0.99),
+            'max_ms': self.latency.max_ms,
+        }
+
+
+class Measurement:
+    """Handed out by measure(), so a block can report the rows it produced"""
+
+    def __init__(self) -> None:
+        self.rows = 0
+
+    def add_rows(self, rows: int) -> None:
+        self.rows += rows
+
+
+class Registry:
+    """Collects CallStats by name and plain counters (e.g. connections opened).
+
+    Instrumentation is opt-in: until enable() is called, timed functions and measure() blocks
+    only check a flag, and counters aren't incremented.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.calls = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def stats(self, name: str) -> CallStats:
+        with self._lock:
+            if name not in self.calls:
+                self.calls[name] = CallStats()
+            return self.calls[name]
+
+    def increment(self, name: str, value: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            calls = dict(self.calls)
+            counters = dict(self.counters)
+        return {'calls': {name: stats.to_dict() for name, stats in sorted(calls.items())},
+                'counters': dict(sorted(counters.items()))}
+
+    def to_prometheus(self) -> str:
+        """Returns the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            calls = sorted(self.calls.items())
+            counters = sorted(self.counters.items())
+
+        lines = ['# TYPE library_calls_total counter']
+        lines += [f'library_calls_total{{name="{name}"}} {stats.calls}' for name, stats in calls]
+        lines.append('# TYPE library_call_errors_total counter')
+        lines += [f'library_call_errors_total{{name="{name}"}} {stats.errors}' for name, stats in calls]
+        lines.append('# TYPE library_rows_total counter')
+        lines += [f'library_rows_total{{name="{name}"}} {stats.rows}' for name, stats in calls]
+
+        lines.append('# TYPE library_call_duration_seconds histogram')
+        for name, stats in calls:
+            histogram = stats.latency
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound / 1000)
+                lines.append(f'library_call_duration_seconds_bucket{{name="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'library_call_duration_seconds_sum{{name="{name}"}} {histogram.sum_ms / 1000}')
+            lines.append(f'library_call_duration_seconds_count{{name="{name}"}} {histogram.total}')
+
+        for name, value in counters:
+            lines.append(f'# TYPE library_{name}_total counter')
+            lines.append(f'library_{name}_total {value}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str) -> None:
+        """Writes the metrics to a file, in Prometheus text format for .prom and .txt files, else as JSON"""
+        with open(path, 'w') as file:
+            if os.path.splitext(path)[1].lower() in ('.prom', '.txt'):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), file, indent=4)
+
+
+REGISTRY = Registry()
+
+
+def enable(path: str = None) -> None:
+    """Starts collecting metrics. With a path, they are written to it when the interpreter exits"""
+    REGISTRY.enabled = True
+    if path:
+        atexit.register(REGISTRY.dump, path)
+
+
+def increment(name: str, value: int = 1) -> None:
+    REGISTRY.increment(name, value)
+
+
+@contextmanager
+def measure(name: str):
+    """Times a block under the given name. The yielded Measurement takes the rows the block produced"""
+    if not REGISTRY.enabled:
+        yield Measurement()
+        return
+
+    measurement = Measurement()
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield measurement
+    except BaseException as e:
+        failed = not isinstance(e, GeneratorExit)  # A generator closed early didn't fail
+        raise
+    finally:
+        REGISTRY.stats(name).add((time.perf_counter() - start) * 1000, measurement.rows, failed)
+
+
+def timed(name: str = None):
+    """Decorator counting and timing calls of a function. A list result counts as the rows returned"""
+    def decorator(func):
+        metric_name = name or f"{func.__module__.rpartition('.')[2]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return func(*args, **kwargs)
+
+            start = time.perf_counter()
+            result = None
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                rows = len(result) if isinstance(result, list) else 0
+                REGISTRY.stats(metric_name).add((time.perf_counter() - start) * 1000, rows, failed)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,204 @@
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+from PyQt5.QtGui import QFont
+
+PAGE_SIZE = 256  # Rows fetched per query
+LOADING = 'Loading...'  # Shown in the name column of rows whose page is being fetched
+
+
+class BookTableModel(QAbstractTableModel):
+    """A table model that pages book rows in from the database as the view scrolls.
+
+    fetch_page(after, offset, limit) must return up to limit rows following the row whose
+    first column (the key) equals after, or following offset rows when the source can't seek.
+    Only max_cached_pages pages are kept in memory, evicted pages are fetched again on access.
+
+    With a QueryExecutor, pages are fetched on its thread pool instead of the calling (GUI) thread.
+    Rows of a page still on its way show a placeholder, and failed fetches are passed to on_error.
+    """
+
+    column_names = ['Book ID', 'Name', 'Author', 'Page count', 'Cover type', 'Category']
+
+    def __init__(self, fetch_page, total_rows: int, page_size: int = PAGE_SIZE, max_cached_pages: int = 16,
+                 parent=None, first_page=None, executor=None, on_error=None) -> None:
+        super().__init__(parent)
+        self._fetch_page = fetch_page
+        self._total_rows = total_rows
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self.executor = executor
+        self.on_error = on_error
+
+        self._loaded_rows = 0  # Rows exposed to the view so far
+        self._pages = OrderedDict()  # Page number -> rows, in least recently used order
+        self._anchors = [None]  # Key of the last row before each page
+        self._requests = {}  # Page number -> its fetch running on the executor
+        self._appending = None  # Page whose rows fetchMore added as placeholders, until it arrives
+        if first_page is not None:  # Already fetched by the caller, e.g. off the GUI thread
+            self._store_page(0, first_page)
+
+        self._header_font = QFont()
+        self._header_font.setPointSize(11)
+        self._header_font.setBold(True)
+
+    @property
+    def total_rows(self) -> int:
+        return self._total_rows
+
+    def _page(self, page_num: int):
+        """Returns rows of a page, fetching it if it isn't cached. With an executor,
+        an uncached page is requested and None returned until it arrives"""
+        if page_num in self._pages:
+            self._pages.move_to_end(page_num)
+            return self._pages[page_num]
+
+        if self.executor is not None:
+            self._request(page_num)
+            return None
+        rows = self._fetch_page(self._anchors[page_num], page_num * self.page_size, self.page_size)
+        self._store_page(page_num, rows)
+        return rows
+
+    def _store_page(self, page_num: int, rows: list) -> None:
+        if rows and page_num + 1 == len(self._anchors):
+            self._anchors.append(rows[-1][0])
+
+        self._pages[page_num] = rows
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+
+    def _request(self, page_num: int) -> None:
+        if page_num not in self._requests:
+            self._requests[page_num] = self.executor.submit(
+                'fetch_page', self._fetch_page, self._anchors[page_num], page_num * self.page_size, self.page_size,
+                on_result=lambda rows: self._page_arrived(page_num, rows),
+                on_error=lambda error: self._page_failed(page_num, error), interruptible=True)
+
+    def _page_arrived(self, page_num: int, rows: list) -> None:
+        del self._requests[page_num]
+        self._store_page(page_num, rows)
+        if page_num == self._appending:
+            self._appending = None
+            self._show_appended(page_num, rows)
+        elif rows:  # An evicted page is back
+            first = page_num * self.page_size
+            last = min(first + len(rows), self._loaded_rows) - 1
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.column_names) - 1))
+
+    def _page_failed(self, page_num: int, error: Exception) -> None:
+        del self._requests[page_num]
+        if page_num == self._appending:  # Drops the placeholders, scrolling down tries again
+            self._appending = None
+            self._resize(page_num * self.page_size)
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def _show_appended(self, page_num: int, rows: list) -> None:
+        """Replaces the placeholders fetchMore added with the rows of the page"""
+        first = page_num * self.page_size
+        self._resize(first + len(rows))
+        if len(rows) < self.page_size:  # Short page means there is nothing after it
+            self._total_rows = self._loaded_rows
+        if rows:
+            self.dataChanged.emit(self.index(first, 0), self.index(self._loaded_rows - 1, len(self.column_names) - 1))
+
+    def _resize(self, rows: int) -> None:
+        """Inserts or removes rows at the end so that the view shows the given number of rows"""
+        if rows > self._loaded_rows:
+            self.beginInsertRows(QModelIndex(), self._loaded_rows, rows - 1)
+            self._loaded_rows = rows
+            self.endInsertRows()
+        elif rows < self._loaded_rows:
+            self.beginRemoveRows(QModelIndex(), rows, self._loaded_rows - 1)
+            self._loaded_rows = rows
+            self.endRemoveRows()
+        self._total_rows = max(self._total_rows, self._loaded_rows)
+
+    def row_keys(self, rows: list):
+        """Returns a function that returns the keys (first column) of the given row numbers, in order.
+
+        Keys of cached pages are read right away. Pages evicted from the cache or still on their way
+        are fetched when the function is called, so that it can run on the executor's threads and the
+        rows of a selection wider than the cache aren't lost. Rows gone from the source are left out.
+        """
+        cached = {}
+        missing = {}  # Page number -> offsets of the rows on it
+        for row in rows:
+            page_num, offset = divmod(row, self.page_size)
+            page = self._pages.get(page_num)
+            if page is None:
+                missing.setdefault(page_num, []).append(offset)
+            elif offset < len(page):
+                cached[row] = page[offset][0]
+
+        fetch_page, page_size = self._fetch_page, self.page_size
+        fetches = [(page_num, self._anchors[page_num], offsets) for page_num, offsets in missing.items()]
+
+        def keys() -> list:
+            found = dict(cached)
+            for page_num, anchor, offsets in fetches:
+                page = fetch_page(anchor, page_num * page_size, page_size)
+                found.update((page_num * page_size + offset, page[offset][0])
+                             for offset in offsets if offset < len(page))
+            return [found[row] for row in rows if row in found]
+
+        return keys
+
+    def cancel_fetches(self) -> None:
+        """Drops the pages still being fetched and interrupts their queries, for a model about to be replaced"""
+        for task in self._requests.values():
+            task.cancel()
+        self._requests.clear()
+        self._appending = None
+
+    def row_data(self, row: int):
+        """Returns a database row (tuple) shown at given row number, or None if it is gone or still loading"""
+        page = self._page(row // self.page_size)
+        if page is None:
+            return None
+        offset = row % self.page_size
+        return page[offset] if offset < len(page) else None
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._loaded_rows
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.column_names)
+
+    def canFetchMore(self, parent=QModelIndex()) -> bool:
+        return not parent.isValid() and self._appending is None and self._loaded_rows < self._total_rows
+
+    def fetchMore(self, parent=QModelIndex()) -> None:
+        if parent.isValid() or self._appending is not None:
+            return
+
+        page_num = self._loaded_rows // self.page_size
+        if self.executor is not None and page_num not in self._pages:
+            # Placeholder rows until the page arrives, the view doesn't ask for more meanwhile
+            self._appending = page_num
+            self._resize(min(self._total_rows, self._loaded_rows + self.page_size))
+            self._request(page_num)
+            return
+
+        rows = self._page(page_num)
+        if not rows:  # The table shrank since it was counted
+            self._total_rows = self._loaded_rows
+            return
+        self._show_appended(page_num, rows)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+        row = self.row_data(index.row())
+        if row is None:
+            return LOADING if index.column() == 1 and index.row() // self.page_size in self._requests else None
+        return str(row[index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal:
+            if role == Qt.DisplayRole:
+                return self.column_names[section]
+            if role == Qt.FontRole:
+                return self._header_font
+            return None
+        return super().headerData(section, orientation, role)
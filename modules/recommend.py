@@ -0,0 +1,222 @@
+import logging
+import threading
+from modules.metrics import measure
+
+logger = logging.getLogger(__name__)
+
+TOP_K = 20  # Recommendations stored per user
+NEIGHBORS = 50  # Most similar books kept per book
+POPULAR_PER_CATEGORY = 50  # Most favorited books of every category, recommended to users who like the category
+AUTHOR_WEIGHT = 0.3
+CATEGORY_WEIGHT = 0.2
+POPULARITY_WEIGHT = 0.2
+CANDIDATE_WEIGHT = 1e-6  # Makes popular books candidates without noticeably changing their score
+USER_BATCH = 2000  # Users scored per sparse matrix product
+REBUILD_FRACTION = 0.05  # refresh rebuilds the model when more of the users changed their favorites
+READ_CHUNK = 500  # Users whose favorites are read per query during refresh
+
+
+def top_per_row(matrix, k: int):
+    """Returns a CSR matrix with the k largest entries of every row of matrix, the rest dropped,
+    and the kept entries of every row ordered by decreasing value"""
+    import numpy as np
+    from scipy import sparse
+
+    matrix = matrix.tocsr()
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))  # Rows stay in place, entries of a row by decreasing value
+    keep = order[np.arange(len(order)) - matrix.indptr[rows] < k]
+    indptr = np.zeros(matrix.shape[0] + 1, np.int64)
+    np.cumsum(np.bincount(rows[keep], minlength=matrix.shape[0]), out=indptr[1:])
+    return sparse.csr_matrix((matrix.data[keep], matrix.indices[keep], indptr), shape=matrix.shape)
+
+
+def codes_of(values) -> tuple:
+    """Returns a code per value and the number of distinct values"""
+    import numpy as np
+
+    codes = {}
+    return np.fromiter((codes.setdefault(value, len(codes)) for value in values), np.int32, len(values)), len(codes)
+
+
+class Recommender:
+    """Precomputed "Recommended for you" books of every user, stored in the recommendations table.
+
+    The favorites table is a users x books matrix. Books are similar when the same users favor them
+    (cosine similarity of their columns, keeping the NEIGHBORS most similar books of each). A user's
+    candidates are the neighbors of their favorites, the other books of authors they favor and the most
+    favorited books of categories they favor. Candidates are scored by similarity to the user's
+    favorites plus the share of them by the same author (AUTHOR_WEIGHT), in the same category
+    (CATEGORY_WEIGHT) and the book's popularity (POPULARITY_WEIGHT), and the TOP_K best are stored.
+
+    A write listener notes the users whose favorites change, refresh() then recomputes only them
+    against the current model, or rebuilds everything once more than REBUILD_FRACTION of the users
+    changed or books did. Needs numpy and scipy, imported on first use.
+    """
+
+    def __init__(self, db_manager, top_k: int = TOP_K, neighbors: int = NEIGHBORS) -> None:
+        self.db_manager = db_manager
+        self.top_k = top_k
+        self.neighbors = neighbors
+        self.model = None  # Book-side matrices of the last build, see build()
+        self._changed_users = set()
+        self._stale = False  # Set when a change doesn't say whose favorites changed, or books changed
+        self._lock = threading.Lock()
+        self._build_lock = threading.RLock()  # One build or refresh at a time
+        db_manager.add_write_listener(self._note_changes)
+
+    def _note_changes(self, table_name: str, changes: list) -> None:
+        if table_name not in ('favorites', 'books'):
+            return
+        with self._lock:
+            for change in changes:
+                if table_name == 'books' or change.get('email') is None:
+                    self._stale = True
+                    return
+                self._changed_users.add(change['email'])
+
+    def build(self) -> int:
+        """Builds the model from the favorites and books tables and stores the recommendations of
+        every user. Returns the number of users"""
+        import numpy as np
+        from scipy import sparse
+
+        with self._build_lock, measure('recommend.build'):
+            with self._lock:
+                self._changed_users.clear()
+                self._stale = False
+
+            book_ids, authors, categories = [], [], []
+            for rows in self.db_manager.iter_rows('books', ['book_id', 'author', 'category'], batch_size=50000,
+                                                  order_by='book_id'):
+                batch_ids, batch_authors, batch_categories = zip(*rows)
+                book_ids.extend(batch_ids)
+                authors.extend(batch_authors)
+                categories.extend(batch_categories)
+            book_ids = np.array(book_ids, np.int64)
+            authors, author_count = codes_of(authors)
+            categories, category_count = codes_of(categories)
+            books = len(book_ids)
+
+            emails, favorite_books = [], []
+            for rows in self.db_manager.iter_rows('favorites', ['email', 'book_id'], batch_size=50000):
+                batch_emails, batch_books = zip(*rows)
+                emails.extend(batch_emails)
+                favorite_books.extend(batch_books)
+            users, user_count = codes_of(emails)
+            user_emails = list(dict.fromkeys(emails))  # In code order
+            del emails
+            matrix = self._favorites_matrix(book_ids, users, favorite_books, user_count)
+
+            # Cosine similarity of books favored by the same users, only between books someone favors
+            popularity = np.asarray(matrix.sum(axis=0)).ravel()
+            peak = max(popularity.max(initial=0), 1)
+            active = np.flatnonzero(popularity)
+            normalized = matrix[:, active] @ sparse.diags(1 / np.sqrt(popularity[active]).astype(np.float32))
+            similarity = (normalized.T @ normalized).tocsr()
+            similarity.setdiag(0)
+            similarity.eliminate_zeros()
+            similarity = top_per_row(similarity, self.neighbors).tocoo()
+            similarity = sparse.csr_matrix((similarity.data, (active[similarity.row], active[similarity.col])),
+                                           shape=(books, books), dtype=np.float32)
+
+            # Book -> author and book -> category incidence, and the most favored books per category
+            book_authors = sparse.csr_matrix((np.ones(books, np.float32), (np.arange(books), authors)),
+                                             shape=(books, author_count))
+            book_categories = sparse.csr_matrix((np.ones(books, np.float32), (np.arange(books), categories)),
+                                                shape=(books, category_count))
+            popular = top_per_row(sparse.csr_matrix(book_categories.T.multiply(popularity)), POPULAR_PER_CATEGORY)
+            popular.data[:] = 1
+
+            self.model = {
+                'users': user_count,
+                'book_ids': book_ids,
+                'categories': categories,
+                'popularity': (popularity / peak).astype(np.float32),
+                'similarity': similarity,
+                'book_authors': book_authors,
+                'book_categories': book_categories,
+                'popular': popular,
+            }
+            logger.info("Recommendation model: %d users, %d books, %d favored, %d similar pairs",
+                        user_count, books, len(active), similarity.nnz)
+
+            with self.db_manager.connection() as conn:
+                conn.execute("DELETE FROM recommendations")
+                for start in range(0, user_count, USER_BATCH):
+                    batch = matrix[start:start + USER_BATCH]
+                    conn.executemany("INSERT INTO recommendations VALUES (?, ?, ?, ?)",
+                                     self._recommend(user_emails[start:start + USER_BATCH], batch))
+            return user_count
+
+    def _favorites_matrix(self, book_ids, users, favorite_books, user_count: int):
+        """Returns the users x books matrix with a 1 for every favorite of a book the model knows"""
+        import numpy as np
+        from scipy import sparse
+
+        favorite_books = np.array(favorite_books, np.int64)
+        positions = np.minimum(np.searchsorted(book_ids, favorite_books), len(book_ids) - 1)
+        known = book_ids[positions] == favorite_books if len(book_ids) else np.zeros(len(favorite_books), bool)
+        return sparse.csr_matrix((np.ones(known.sum(), np.float32), (users[known], positions[known])),
+                                 shape=(user_count, len(book_ids)))
+
+    def _recommend(self, emails: list, favorites) -> list:
+        """Returns the (email, rank, book_id, score) rows of the recommendations of users
+        with the given rows of the favorites matrix"""
+        import numpy as np
+        from scipy import sparse
+
+        model = self.model
+        counts = np.asarray(favorites.sum(axis=1)).ravel()
+        shares = sparse.diags(1 / np.maximum(counts, 1)) @ favorites  # Every user's favorites sum to 1
+        author_shares = shares @ model['book_authors']
+        category_shares = (shares @ model['book_categories']).toarray()
+
+        scores = (shares @ model['similarity']
+                  + AUTHOR_WEIGHT * (author_shares @ model['book_authors'].T)
+                  + CANDIDATE_WEIGHT * (sparse.csr_matrix(category_shares) @ model['popular'])).tocsr()
+        scores = scores - scores.multiply(favorites)  # Already favored
+        scores.eliminate_zeros()
+        scores = scores.tocoo()
+        scores.data += (CATEGORY_WEIGHT * category_shares[scores.row, model['categories'][scores.col]]
+                        + POPULARITY_WEIGHT * model['popularity'][scores.col])
+        best = top_per_row(scores, self.top_k)
+
+        rows = []
+        for user, email in enumerate(emails):
+            start, end = best.indptr[user], best.indptr[user + 1]
+            rows.extend(zip([email] * (end - start), range(1, end - start + 1),
+                            model['book_ids'][best.indices[start:end]].tolist(), best.data[start:end].tolist()))
+        return rows
+
+    def refresh(self) -> int:
+        """Recomputes the recommendations of the users whose favorites changed since the last build
+        or refresh, building the model first if there is none or it's out of date.
+        Returns the number of users recomputed"""
+        import numpy as np
+
+        with self._build_lock:
+            with self._lock:
+                changed, self._changed_users = self._changed_users, set()
+                stale = self._stale
+            if self.model is None or stale or len(changed) > REBUILD_FRACTION * self.model['users']:
+                return self.build()
+            if not changed:
+                return 0
+
+            with measure('recommend.refresh') as measurement:
+                emails = sorted(changed)
+                for start in range(0, len(emails), READ_CHUNK):
+                    chunk = emails[start:start + READ_CHUNK]
+                    index = {email: user for user, email in enumerate(chunk)}
+                    favorites = [row for rows in self.db_manager.iter_rows(
+                        'favorites', ['email', 'book_id'], {'email': chunk}, batch_size=10000) for row in rows]
+                    users = np.array([index[email] for email, _ in favorites], np.int64)
+                    matrix = self._favorites_matrix(self.model['book_ids'], users,
+                                                    [book_id for _, book_id in favorites], len(chunk))
+                    rows = self._recommend(chunk, matrix)
+                    with self.db_manager.connection():
+                        self.db_manager.delete_rows('recommendations', ['email'], [(email,) for email in chunk])
+                        self.db_manager.add_records('recommendations', rows)
+                    measurement.add_rows(len(rows))
+            return len(emails)
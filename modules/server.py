@@ -0,0 +1,425 @@
+"""A local HTTP/JSON API over the library database.
+
+Reads are served by several worker processes sharing one listening socket. Every worker has its own
+pool of read-only connections, so WAL lets them all read side by side. Favorites changes are sent to
+a single writer process, which applies whatever queued up in one transaction and replies once it
+committed, so a client reads its own writes on the next request. A change the writer doesn't answer
+within WRITE_TIMEOUT seconds gets a 503 reply.
+
+Routes:
+    GET    /health
+    GET    /books?category=&author=&cover_type=&min_pages=&max_pages=&sort=&desc=&limit=&cursor=
+    GET    /books/count?<the same filters>
+    GET    /search?q=&limit=&offset=
+    GET    /users/<email>/favorites?limit=&cursor=
+    POST   /users/<email>/favorites      {"book_ids": [...]}
+    DELETE /users/<email>/favorites      {"book_ids": [...]}
+
+Comma-separated filter values match any of them. Pages come with a next_cursor to pass back as
+cursor, null on the last page.
+
+Usage: python -m modules.server --db LIBRARY.db --port 8080 --workers 4
+"""
+import os
+import json
+import queue
+import base64
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import itertools
+import threading
+import multiprocessing
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+from concurrent.futures import ThreadPoolExecutor
+from modules.database import DatabaseManager
+from modules.services import LibraryService
+
+MAX_LIMIT = 500
+MAX_BODY = 1 << 20
+MAX_WRITE_BATCH = 256
+WRITE_TIMEOUT = 10.0  # Seconds a favorites change waits for the writer process before the request gets a 503
+FILTER_COLUMNS = ['category', 'author', 'cover_type']
+
+
+class HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str = None) -> None:
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def encode_cursor(after) -> str:
+    return base64.urlsafe_b64encode(json.dumps(after).encode()).decode()
+
+
+def is_id(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def decode_cursor(cursor: str, sort_by: str = 'book_id'):
+    """Returns the after argument of paginate from a cursor: a book_id, or a (sort value, book_id) pair
+    when sorting by another column. Raises ValueError for anything else"""
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if sort_by == 'book_id':
+        if not is_id(after):
+            raise ValueError("Invalid cursor")
+        return after
+    if not (isinstance(after, list) and len(after) == 2 and is_id(after[1])
+            and (after[0] is None or isinstance(after[0], (str, int, float)) and not isinstance(after[0], bool))):
+        raise ValueError("Invalid cursor")
+    return tuple(after)
+
+
+def int_param(params: dict, name: str, default=None, low: int = 0, high: int = None):
+    """Returns an integer query parameter clamped to [low, high], raising ValueError if it isn't one"""
+    if name not in params:
+        return default
+    try:
+        value = int(params[name])
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+    value = max(low, value)
+    return min(high, value) if high is not None else value
+
+
+def book_filters(params: dict) -> dict:
+    """Builds paginate filters from query parameters"""
+    filters = {}
+    for column in FILTER_COLUMNS:
+        if params.get(column):
+            filters[column] = params[column].split(',')
+    min_pages, max_pages = int_param(params, 'min_pages'), int_param(params, 'max_pages')
+    if min_pages is not None or max_pages is not None:
+        filters['num_pages'] = (min_pages, max_pages)
+    return filters
+
+
+def parse_book_ids(body: bytes) -> list:
+    try:
+        book_ids = json.loads(body or b'{}').get('book_ids')
+    except (ValueError, AttributeError):
+        raise ValueError("Body must be a JSON object")
+    if not isinstance(book_ids, list) or not all(map(is_id, book_ids)):  # JSON true and false aren't ids
+        raise ValueError("book_ids must be a list of integers")
+    return book_ids
+
+
+class WriteClient:
+    """Sends favorites changes of one worker process to the writer and resolves their futures"""
+
+    def __init__(self, index: int, write_queue, reply_queue, loop, timeout: float = WRITE_TIMEOUT) -> None:
+        self.index = index
+        self.write_queue = write_queue
+        self.reply_queue = reply_queue
+        self.loop = loop
+        self.timeout = timeout
+        self.pending = {}
+        self.request_ids = itertools.count()
+        threading.Thread(target=self._read_replies, name='write-replies', daemon=True).start()
+
+    async def submit(self, op: str, email: str, book_ids: list):
+        """Returns the result of a change once the writer committed it. Raises a 503 HttpError when the
+        writer doesn't reply within timeout, e.g. because it's stuck or gone; the change may still be applied"""
+        request_id = next(self.request_ids)
+        future = self.pending[request_id] = self.loop.create_future()
+        self.write_queue.put((self.index, request_id, op, email, book_ids))
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.pending.pop(request_id, None)
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "The writer didn't reply in time, try again later")
+
+    def _read_replies(self) -> None:
+        while True:
+            reply = self.reply_queue.get()
+            if reply is None:
+                return
+            self.loop.call_soon_threadsafe(self._resolve, *reply)
+
+    def _resolve(self, request_id: int, result, error) -> None:
+        future = self.pending.pop(request_id, None)
+        if future is None:  # Timed out, the request already got a 503
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+
+class Api:
+    """Routes requests of one worker process to the library service"""
+
+    def __init__(self, service: LibraryService, writes: WriteClient) -> None:
+        self.service = service
+        self.writes = writes
+        self.columns = service.db_manager.get_columns('books')
+
+    def rows_to_books(self, rows) -> list:
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    async def call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def handle(self, method: str, path: str, params: dict, body: bytes) -> dict:
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if len(parts) == 3 and parts[0] == 'users' and parts[2] == 'favorites':
+            return await self.favorites(method, parts[1], params, body)
+        if parts not in (['health'], ['books'], ['books', 'count'], ['search']):
+            raise HttpError(HTTPStatus.NOT_FOUND)
+        if method != 'GET':
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+        if parts == ['health']:
+            return {'status': 'ok', 'pid': os.getpid()}
+        if parts == ['books']:
+            return await self.books(params)
+        if parts == ['books', 'count']:
+            return {'count': await self.call(self.service.count_books, book_filters(params))}
+        return await self.search(params)
+
+    async def books(self, params: dict) -> dict:
+        limit = int_param(params, 'limit', 50, 1, MAX_LIMIT)
+        sort_by = params.get('sort') or 'book_id'
+        after = decode_cursor(params['cursor'], sort_by) if params.get('cursor') else None
+        rows = await self.call(self.service.list_books, after, limit, book_filters(params), sort_by,
+                               params.get('desc') in ('1', 'true'))
+
+        next_cursor = None
+        if len(rows) == limit:
+            last = dict(zip(self.columns, rows[-1]))
+            next_cursor = encode_cursor(last['book_id'] if sort_by == 'book_id' else [last[sort_by], last['book_id']])
+        return {'books': self.rows_to_books(rows), 'next_cursor': next_cursor}
+
+    async def search(self, params: dict) -> dict:
+        query = params.get('q', '').strip()
+        if not query:
+            raise ValueError("q is required")
+        limit = int_param(params, 'limit', 50, 1, MAX_LIMIT)
+        rows = await self.call(self.service.search, query, limit, int_param(params, 'offset', 0))
+        return {'books': self.rows_to_books(rows)}
+
+    async def favorites(self, method: str, email: str, params: dict, body: bytes) -> dict:
+        if method == 'GET':
+            limit = int_param(params, 'limit', 50, 1, MAX_LIMIT)
+            after = decode_cursor(params['cursor']) if params.get('cursor') else None
+            rows = await self.call(self.service.favorites_page, email, after, limit)
+            return {'books': self.rows_to_books(rows),
+                    'next_cursor': encode_cursor(rows[-1][0]) if len(rows) == limit else None}
+        if method == 'POST':
+            return {'added': await self.writes.submit('add', email, parse_book_ids(body))}
+        if method == 'DELETE':
+            return {'removed': await self.writes.submit('remove', email, parse_book_ids(body))}
+        raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED)
+
+
+async def read_request(reader: asyncio.StreamReader):
+    """Reads one HTTP/1.1 request, returning None once the client closed the connection"""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+
+    request_line, *header_lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    try:
+        method, target, version = request_line.split(' ')
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in header_lines:
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b''
+    keep_alive = headers.get('connection', '').lower() != 'close' if version == 'HTTP/1.1' \
+        else headers.get('connection', '').lower() == 'keep-alive'
+    return method, target, body, keep_alive
+
+
+def render_response(status: HTTPStatus, payload: dict, keep_alive: bool) -> bytes:
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+async def serve_connection(api: Api, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    """Answers the requests of one keep-alive connection in order"""
+    try:
+        while True:
+            keep_alive = False
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                url = urlsplit(target)
+                params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+                status, payload = HTTPStatus.OK, await api.handle(method, url.path, params, body)
+            except HttpError as e:
+                status, payload = e.status, {'error': str(e)}
+            except ValueError as e:
+                status, payload = HTTPStatus.BAD_REQUEST, {'error': str(e)}
+            except Exception:
+                logging.exception("Request failed")
+                status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal server error'}
+
+            writer.write(render_response(status, payload, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+def run_worker(index: int, sock: socket.socket, db_path: str, threads: int, write_queue, reply_queue) -> None:
+    """Entry point of a worker process: serves requests from the shared socket until terminated"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent stops the workers
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(threads, thread_name_prefix='db'))
+        db_manager = DatabaseManager(db_path, read_only=True, pool_size=threads)
+        api = Api(LibraryService(db_manager), WriteClient(index, write_queue, reply_queue, loop))
+        server = await asyncio.start_server(lambda reader, writer: serve_connection(api, reader, writer), sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def apply_writes(service: LibraryService, batch: list) -> list:
+    """Applies a batch of favorites changes in one transaction and returns their (result, error) pairs.
+    If the transaction fails, every change is retried on its own so only the failing ones report an error"""
+    operations = {'add': service.add_favorites, 'remove': service.remove_favorites}
+    try:
+        with service.db_manager.connection():
+            return [(operations[op](email, book_ids), None) for _, _, op, email, book_ids in batch]
+    except Exception:
+        logging.exception("Write batch of %d failed, applying the changes one by one", len(batch))
+
+    results = []
+    for _, _, op, email, book_ids in batch:
+        try:
+            results.append((operations[op](email, book_ids), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+def run_writer(db_path: str, write_queue, reply_queues: list) -> None:
+    """Entry point of the writer process: group-commits favorites changes until it gets None"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    service = LibraryService(DatabaseManager(db_path, pool_size=1))
+    running = True
+    while running:
+        batch = [write_queue.get()]
+        while len(batch) < MAX_WRITE_BATCH:  # Whatever queued up meanwhile shares the commit
+            try:
+                batch.append(write_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            running = False
+            batch = [item for item in batch if item is not None]
+
+        for (worker, request_id, *_), (result, error) in zip(batch, apply_writes(service, batch) if batch else []):
+            reply_queues[worker].put((request_id, result, error))
+
+    for reply_queue in reply_queues:
+        reply_queue.put(None)
+    service.db_manager.pool.close()
+
+
+class Server:
+    """Binds the socket and runs the worker and writer processes.
+
+    Processes are spawned rather than forked, so none of them inherits the parent's SQLite connections.
+    """
+
+    def __init__(self, db_path: str, host: str = '127.0.0.1', port: int = 8080, workers: int = None,
+                 threads: int = 4) -> None:
+        self.db_path = db_path
+        self.db_manager = DatabaseManager(db_path)
+        self.workers = workers or os.cpu_count() or 1
+        self.threads = threads
+        self.sock = socket.create_server((host, port), backlog=1024)
+        self.port = self.sock.getsockname()[1]
+        self.processes = []
+        self.writer = None
+        self.write_queue = None
+        self.reply_queues = []
+        self.context = multiprocessing.get_context('spawn')
+
+    def start(self) -> None:
+        # The parent keeps a connection open, so the WAL files exist before the read-only workers open the file
+        self.db_manager.create_tables()
+
+        self.write_queue = self.context.Queue()
+        # Kept referenced, spawned processes only open the queues once they're running
+        self.reply_queues = [self.context.Queue() for _ in range(self.workers)]
+        self.writer = self.context.Process(target=run_writer, name='library-writer',
+                                           args=(self.db_path, self.write_queue, self.reply_queues))
+        self.writer.start()
+        for index in range(self.workers):
+            process = self.context.Process(target=run_worker, name=f'library-worker-{index}',
+                                           args=(index, self.sock, self.db_path, self.threads,
+                                                 self.write_queue, self.reply_queues[index]))
+            process.start()
+            self.processes.append(process)
+
+    def stop(self) -> None:
+        """Stops the workers, then lets the writer apply the changes still queued"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes.clear()
+        if self.writer is not None:
+            self.write_queue.put(None)
+            self.writer.join()
+            self.writer = None
+        self.sock.close()
+        self.db_manager.pool.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Serve the library database over HTTP")
+    parser.add_argument('--db', default='LIBRARY.db', help="database file (default: LIBRARY.db)")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8080, help="port to listen on (default: 8080)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--threads', type=int, default=4,
+                        help="database threads and read connections per worker (default: 4)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    server = Server(args.db, args.host, args.port, args.workers, args.threads)
+    server.start()
+    logging.info("Serving %s on http://%s:%d with %d workers", args.db, args.host, server.port, server.workers)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.writer.join()  # Runs until interrupted
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # A second Ctrl+C mustn't cut the shutdown short
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import bisect
+from modules.database import DatabaseManager
+
+
+class LibraryService:
+    """Book and favorites operations of the library, independent of any window.
+
+    Used by the Library window and the HTTP server. Rows are books tuples in the column order of
+    the books table. With a CatalogCache, favorites are read from its cached id sets, otherwise
+    straight from the favorites table (e.g. in server workers, where writes happen in another process
+    and the cache would never hear about them).
+
+    With a FavoritesWriteQueue, favorites changes are queued instead of written right away, and
+    favorites are read with the queued changes applied.
+    """
+
+    def __init__(self, db_manager: DatabaseManager, catalog_cache=None, write_queue=None) -> None:
+        self.db_manager = db_manager
+        self.catalog_cache = catalog_cache
+        self.write_queue = write_queue
+
+    def list_books(self, after=None, limit: int = 50, filters=None, sort_by: str = None,
+                   descending: bool = False) -> list:
+        """Returns a page of books, see DatabaseManager.paginate for the keyset cursor in after"""
+        return self.db_manager.paginate('books', filters, sort_by, descending, after, limit)
+
+    def count_books(self, filters=None) -> int:
+        return self.db_manager.count_rows('books', filters)
+
+    def search(self, query: str, limit: int = 50, offset: int = 0) -> list:
+        """Returns books matching a free-text query, best matches first"""
+        return self.db_manager.search_books(query, limit, offset)
+
+    def count_search_results(self, query: str) -> int:
+        return self.db_manager.count_search_results(query)
+
+    def favorite_ids(self, email: str) -> tuple:
+        """Returns the sorted ids of a user's favorite books"""
+        # Queued changes are read first: if they are committed meanwhile, applying them again changes nothing
+        queued = self.write_queue.changes(email) if self.write_queue is not None else None
+        if self.catalog_cache is not None:
+            ids = self.catalog_cache.favorite_ids(email)
+        else:
+            ids = tuple(sorted(row[0] for row in self.db_manager.search('favorites', ['book_id'], {'email': email})))
+        if not queued:
+            return ids
+        ids = set(ids)
+        ids.update(book_id for book_id, add in queued.items() if add)
+        ids.difference_update(book_id for book_id, add in queued.items() if not add)
+        return tuple(sorted(ids))
+
+    def count_favorites(self, email: str) -> int:
+        return len(self.favorite_ids(email))
+
+    def favorites_page(self, email: str, after=None, limit: int = 50) -> list:
+        """Returns up to limit of a user's favorite books ordered by book_id, starting after the given book_id"""
+        ids = self.favorite_ids(email)
+        start = 0 if after is None else bisect.bisect_right(ids, after)
+        return self.db_manager.paginate('books', {'book_id': list(ids[start:start + limit])}, limit=limit)
+
+    def recommended_books(self, email: str, limit: int = 50, offset: int = 0) -> list:
+        """Returns books recommended to a user as stored by the Recommender, best first"""
+        return self.db_manager.load_recommendations(email, limit, offset)
+
+    def count_recommendations(self, email: str) -> int:
+        return self.db_manager.count_rows('recommendations', {'email': email})
+
+    def add_favorites(self, email: str, book_ids) -> int:
+        """Adds books to a user's favorites and returns how many weren't there already"""
+        if self.write_queue is not None:
+            book_ids = {int(book_id) for book_id in book_ids}
+            added = len(book_ids.difference(self.favorite_ids(email)))
+            self.write_queue.add(email, book_ids)
+            return added
+        return self.db_manager.add_records('favorites', [(email, int(book_id)) for book_id in book_ids])
+
+    def remove_favorites(self, email: str, book_ids) -> int:
+        """Removes books from a user's favorites and returns how many were removed"""
+        if self.write_queue is not None:
+            book_ids = {int(book_id) for book_id in book_ids}
+            removed = len(book_ids.intersection(self.favorite_ids(email)))
+            self.write_queue.remove(email, book_ids)
+            return removed
+        return self.db_manager.delete_rows('favorites', ['email', 'book_id'],
+                                           [(email, int(book_id)) for book_id in book_ids])
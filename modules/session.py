@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import logging
+import threading
+
+
+def config_dir() -> str:
+    """Per-user directory of the app's own files: LIBRARY_CONFIG_DIR if set, else the platform's config directory"""
+    if os.environ.get('LIBRARY_CONFIG_DIR'):
+        return os.environ['LIBRARY_CONFIG_DIR']
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Application Support')
+    else:
+        base = os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser('~/.config')
+    return os.path.join(base, 'virtual-library')
+
+
+class Session:
+    """In-memory state of logged-in users, shared by the windows instead of reading files on every click.
+
+    Several users can be logged in at the same time, each with their own current view. One of them is
+    the active user of the window. Nothing is written until flush(), which the app calls when it quits.
+    It saves the active user's email to a JSON file in the user's config directory (see config_dir),
+    which restore() reads back at the next start to fill in the login form. If a DatabaseManager is
+    given, the sessions table is used instead of the file.
+    """
+
+    def __init__(self, path: str = None, db_manager=None) -> None:
+        self.path = path or os.path.join(config_dir(), 'session.json')
+        self.db_manager = db_manager
+
+        self._views = {}  # Email of every logged-in user -> their current view
+        self._email = ''
+        self.last_email = ''  # Active user when the session was last saved, see restore()
+        self._lock = threading.Lock()
+
+    @property
+    def email(self) -> str:
+        """Email of the active user, empty if nobody is logged in"""
+        return self._email
+
+    @property
+    def users(self) -> list:
+        """Emails of all logged-in users"""
+        with self._lock:
+            return list(self._views)
+
+    @property
+    def current_view(self) -> str:
+        """Table the active user is looking at: 'all_books', 'favorite_books', 'search_results',
+        'recommended_books' or empty"""
+        with self._lock:
+            return self._views.get(self._email, '')
+
+    @current_view.setter
+    def current_view(self, view: str) -> None:
+        with self._lock:
+            if self._email:
+                self._views[self._email] = view
+
+    def login(self, email: str) -> None:
+        """Adds a user to the session and makes them the active one"""
+        with self._lock:
+            self._views.setdefault(email, '')
+            self._email = email
+
+    def switch(self, email: str) -> None:
+        """Makes another logged-in user the active one"""
+        with self._lock:
+            if email not in self._views:
+                raise KeyError(f"{email} is not logged in")
+            self._email = email
+
+    def logout(self, email: str = None) -> None:
+        """Removes a user (the active one by default) from the session"""
+        with self._lock:
+            email = self._email if email is None else email
+            self._views.pop(email, None)
+            if email == self._email:
+                self._email = ''
+
+    def flush(self) -> None:
+        """Saves the session to the sessions table or, without a database, to the JSON file"""
+        with self._lock:
+            views = dict(self._views)
+            email = self._email
+
+        if self.db_manager is not None:
+            with self.db_manager.connection() as conn:
+                conn.execute("DELETE FROM sessions")  # Drops sessions saved before
+                self.db_manager.add_records('sessions', [(user, view, int(user == email))
+                                                         for user, view in views.items()], 'REPLACE')
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        temporary = self.path + '.tmp'  # Replaced in one step, so a crash can't leave half a file
+        with open(temporary, 'w') as file:
+            json.dump({'email': email}, file, indent=4)
+        os.replace(temporary, self.path)
+
+    def restore(self) -> str:
+        """Reads the active user of the last saved session into last_email and returns it,
+        empty if there is none. Nobody is logged in by this, they still need their password"""
+        if self.db_manager is not None:
+            with self.db_manager.connection() as conn:
+                row = conn.execute("SELECT email FROM sessions WHERE active = 1").fetchone()
+            self.last_email = row[0] if row else ''
+            return self.last_email
+
+        try:
+            with open(self.path) as file:
+                self.last_email = str(json.load(file).get('email') or '')
+        except FileNotFoundError:
+            self.last_email = ''
+        except (OSError, ValueError, AttributeError):
+            logging.warning("Ignoring the unreadable session file %s", self.path, exc_info=True)
+            self.last_email = ''
+        return self.last_email
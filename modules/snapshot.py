@@ -0,0 +1,562 @@
+import re
+import bisect
+import operator
+import functools
+import itertools
+import threading
+from array import array
+from collections import deque
+
+TOKEN = re.compile(r'\w+')
+SET_BYTE = re.compile(b'\x01')
+COLUMNS = ['book_id', 'name', 'author', 'num_pages', 'cover_type', 'category']
+ORDERED_COLUMNS = COLUMNS[1:]  # Sort orders kept by the snapshot, book_id order is the row order itself
+PAGE_BUCKETS = 256  # Quantile buckets of page counts, one byte per book
+SMALL_SELECTION = 1 / 64  # Selections up to this share of the catalog are sorted directly
+REBUILD_FRACTION = 0.05  # refresh rebuilds the snapshot when more of the catalog changed
+READ_CHUNK = 500  # Books read by id per query during refresh
+
+
+def tokenize(text) -> set:
+    return set(TOKEN.findall(text.casefold())) if text else set()
+
+
+def null_first(value):
+    """Sort key placing None before any value, like SQLite does"""
+    return (value is not None, value if value is not None else '')
+
+
+def mask_of(positions, size: int) -> bytearray:
+    """Returns size bytes, 1 at the given positions and 0 elsewhere"""
+    mask = bytearray(size)
+    deque(map(mask.__setitem__, positions, itertools.repeat(1)), maxlen=0)
+    return mask
+
+
+def positions_of(mask) -> list:
+    """Returns the positions of the 1 bytes of a mask, scanned by the regex engine rather than byte by byte"""
+    return [match.start() for match in SET_BYTE.finditer(mask)]
+
+
+def mask_and(a, b) -> bytes:
+    """Intersects two masks of 0/1 bytes, as big integers so it runs at C speed"""
+    return (int.from_bytes(a, 'little') & int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+def mask_or(a, b) -> bytes:
+    return (int.from_bytes(a, 'little') | int.from_bytes(b, 'little')).to_bytes(len(a), 'little')
+
+
+def touched_ids(changes):
+    """Returns the book ids of changes from DatabaseManager.changes_since, or None if some change
+    doesn't say which books it touched (e.g. an update by name) or the changes aren't known"""
+    if changes is None:
+        return None
+    touched = set()
+    for change in changes:
+        for values in change or ():  # Inserts are None, refresh reads them as books after the last id
+            if values.get('book_id') is None:
+                return None
+            touched.add(values['book_id'])
+    return touched
+
+
+def value_ranks(values: list) -> list:
+    """Returns the rank of every value in sorted order, for values interned by code"""
+    nulls = [code for code, value in enumerate(values) if value is None]
+    ordered = nulls + sorted((code for code, value in enumerate(values) if value is not None), key=values.__getitem__)
+    ranks = [0] * len(values)
+    for rank, code in enumerate(ordered):
+        ranks[code] = rank
+    return ranks
+
+
+def code_table(codes) -> bytes:
+    """Returns a bytes.translate table mapping the given codes to 1 and every other byte to 0"""
+    codes = set(codes)
+    return bytes(int(code in codes) for code in range(256))
+
+
+class Interner:
+    """Assigns small integer codes to values, up to limit distinct values"""
+
+    def __init__(self, limit: int = None) -> None:
+        self.codes = {}
+        self.values = []
+        self.limit = limit
+
+    def code(self, value) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            if self.limit is not None and len(self.values) >= self.limit:
+                raise ValueError(f"More than {self.limit} distinct values")
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class StringTable:
+    """A list of strings stored back to back in one str, far smaller than as many str objects.
+
+    Strings appended or replaced after it was created are kept apart in a dict.
+    """
+
+    def __init__(self, strings: list) -> None:
+        self.nulls = {index for index, string in enumerate(strings) if string is None}
+        self.offsets = array('I', itertools.accumulate((len(string or '') for string in strings), initial=0))
+        self.text = ''.join(string or '' for string in strings)
+        self.changed = {}  # Index -> string set since
+        self.size = len(strings)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, index: int):
+        if index in self.changed:
+            return self.changed[index]
+        if index in self.nulls:
+            return None
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def __setitem__(self, index: int, value) -> None:
+        self.changed[index] = value
+
+    def append(self, value) -> int:
+        self.changed[self.size] = value
+        self.size += 1
+        return self.size - 1
+
+
+class CatalogSnapshot:
+    """A compact in-memory copy of the books table, for filtering and sorting without SQLite.
+
+    Books are stored by position in book_id order: ids and page counts in array('i'), categories and
+    cover types as one-byte interned codes, authors as codes of distinct authors, names and authors in
+    StringTables. An inverted index maps title and author tokens to positions, and a sort order per
+    column is kept.
+    Filters are combined as byte masks (one byte per book) with C-speed bytes and int operations.
+    A query word's mask is filled position by position from the postings of every token it prefixes,
+    so words of one or two letters, which prefix a large part of the index, cost most: 25 to 40 ms for
+    'ka' at 10^6 books, over a 16 ms frame. Sorting the matches costs little, it walks the kept orders.
+
+    refresh applies the books changes the DatabaseManager's change log recorded since the snapshot
+    was built. Writes made by other processes aren't in the log, call build to pick them up.
+    """
+
+    def __init__(self, db_manager) -> None:
+        self.db_manager = db_manager
+        self.counter = None  # The change_counter the snapshot is up to date with, None until built
+        self.version = 0  # Bumped whenever the snapshot changes, selections evaluated before are redone
+        self._lock = threading.RLock()
+
+    @property
+    def ready(self) -> bool:
+        return self.counter is not None
+
+    def __len__(self) -> int:
+        return self.alive.count(1) if self.ready else 0
+
+    def build(self) -> None:
+        """Reads the whole books table into the snapshot"""
+        with self._lock:
+            counter = self.db_manager.change_counter  # Writes racing the read are applied again by refresh
+            self.ids = array('i')
+            self.pages = array('i')  # -1 for unknown page counts
+            self.authors = array('i')
+            self.categories = bytearray()
+            self.covers = bytearray()
+            author_codes = Interner()  # Only while building, authors written later get new codes
+            self.category_codes = Interner(256)
+            self.cover_codes = Interner(256)
+            self.postings = {}  # Token -> ascending array('i') of positions
+            self._ranks = {}
+
+            # Columns are filled a batch at a time, only the tokens are indexed book by book
+            names = []
+            author_tokens = {}  # Author code -> tokens, most authors have several books
+            for rows in self.db_manager.iter_rows('books', COLUMNS, batch_size=10000, order_by='book_id'):
+                book_ids, batch_names, authors, pages, cover_types, categories = zip(*rows)
+                start = len(self.ids)
+                self.ids.extend(book_ids)
+                self.pages.extend([-1 if num_pages is None else num_pages for num_pages in pages])
+                authors = list(map(author_codes.code, authors))
+                self.authors.extend(authors)
+                self.categories.extend(map(self.category_codes.code, categories))
+                self.covers.extend(map(self.cover_codes.code, cover_types))
+                names.extend(batch_names)
+                for position, name, author in zip(itertools.count(start), batch_names, authors):
+                    tokens = author_tokens.get(author)
+                    if tokens is None:
+                        tokens = author_tokens[author] = tokenize(author_codes.values[author])
+                    self._add_tokens(position, tokenize(name) | tokens)
+            size = len(self.ids)
+            self.alive = bytearray(b'\x01') * size  # 0 for deleted books, which stay indexed until the next build
+            self.tokens = sorted(self.postings)
+
+            # Sorted by keys C code can look up, rather than calling sort_key for every book
+            author_ranks = value_ranks(author_codes.values)
+            self.orders = {
+                'name': array('i', sorted(range(size), key=names.__getitem__)),
+                'author': array('i', sorted(range(size),
+                                            key=[author_ranks[code] for code in self.authors].__getitem__)),
+                'num_pages': array('i', sorted(range(size), key=self.pages.__getitem__)),
+                'cover_type': array('i', sorted(range(size), key=self.covers.translate(
+                    bytes(value_ranks(self.cover_codes.values)).ljust(256, b'\0')).__getitem__)),
+                'category': array('i', sorted(range(size), key=self.categories.translate(
+                    bytes(value_ranks(self.category_codes.values)).ljust(256, b'\0')).__getitem__)),
+            }
+            self.names = StringTable(names)
+            self.author_values = StringTable(author_codes.values)
+            del names, author_codes, author_ranks
+
+            ordered_pages = [self.pages[position] for position in self.orders['num_pages']]
+            self.page_bounds = sorted({ordered_pages[i * size // PAGE_BUCKETS] for i in range(1, PAGE_BUCKETS)}) \
+                if size else []
+            self.page_codes = bytearray(bisect.bisect_right(self.page_bounds, pages) for pages in self.pages)
+            self.page_postings = [array('i') for _ in range(len(self.page_bounds) + 1)]
+            for position, code in enumerate(self.page_codes):
+                self.page_postings[code].append(position)
+
+            self.counter = counter
+            self.version += 1
+
+    def _append(self, row) -> int:
+        """Adds a book after the last one and indexes its tokens"""
+        book_id, name, author, num_pages, cover_type, category = row
+        position = len(self.ids)
+        self.ids.append(book_id)
+        self.pages.append(-1 if num_pages is None else num_pages)
+        self.names.append(name)
+        self.authors.append(self.author_values.append(author))
+        self.categories.append(self.category_codes.code(category))
+        self.covers.append(self.cover_codes.code(cover_type))
+        self.alive.append(1)
+        self._add_tokens(position, tokenize(name) | tokenize(author))
+        return position
+
+    def _add_tokens(self, position: int, tokens) -> None:
+        """Indexes the tokens of a book after the last one"""
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = array('i')
+            postings.append(position)
+
+    def name(self, position: int) -> str:
+        return self.names[position]
+
+    def author(self, position: int):
+        return self.author_values[self.authors[position]]
+
+    def row(self, position: int) -> tuple:
+        """Returns a book as a books table row"""
+        pages = self.pages[position]
+        return (self.ids[position], self.name(position), self.author(position),
+                None if pages < 0 else pages, self.cover_codes.values[self.covers[position]],
+                self.category_codes.values[self.categories[position]])
+
+    def sort_key(self, column: str):
+        """Returns a function of position giving the value books are sorted by"""
+        if column == 'book_id':
+            return self.ids.__getitem__
+        if column == 'name':
+            return self.name
+        if column == 'num_pages':
+            return self.pages.__getitem__
+        if column == 'author':
+            return lambda position: null_first(self.author(position))
+        codes, values = {'cover_type': (self.covers, self.cover_codes.values),
+                         'category': (self.categories, self.category_codes.values)}[column]
+        return lambda position: null_first(values[codes[position]])
+
+    def ranks(self, column: str) -> array:
+        """Returns every book's index in the sort order of a column, for sorting by C lookups.
+        Computed on first use after the snapshot changed"""
+        ranks = self._ranks.get(column)
+        if ranks is None:
+            order = self.orders[column]
+            ranks = self._ranks[column] = array('i', [0]) * len(order)
+            deque(map(ranks.__setitem__, order, range(len(order))), maxlen=0)
+        return ranks
+
+    def window(self, column: str, criteria: dict):
+        """Returns the (start, end) slice of a column's sort order that books matching the criteria
+        can be in, narrower than the whole order when they filter that column"""
+        order = self.orders[column]
+        key = self.sort_key(column)
+        if column == 'num_pages' and (criteria['min_pages'] is not None or criteria['max_pages'] is not None):
+            low = max(criteria['min_pages'] or 0, 0)
+            high = criteria['max_pages']
+        elif column in ('category', 'cover_type') and criteria[column] is not None:
+            values = criteria[column] if isinstance(criteria[column], (list, tuple, set, frozenset)) \
+                else [criteria[column]]
+            keys = [null_first(value) for value in values]
+            if not keys:
+                return 0, 0
+            low, high = min(keys), max(keys)
+        else:
+            return 0, len(order)
+
+        def first(test):  # Index of the first book in order for which test(key) is True
+            start, end = 0, len(order)
+            while start < end:
+                middle = (start + end) // 2
+                if test(key(order[middle])):
+                    end = middle
+                else:
+                    start = middle + 1
+            return start
+
+        return first(lambda value: value >= low), len(order) if high is None else first(lambda value: value > high)
+
+    def select(self, query: str = None, category=None, cover_type=None, min_pages: int = None,
+               max_pages: int = None, sort_by: str = 'book_id', descending: bool = False) -> 'Selection':
+        """Returns the books matching all given criteria, evaluated when first used.
+
+        Every word of query must prefix a word of the name, author or category, as in
+        DatabaseManager.search_books. category and cover_type take a value or a list of values.
+        """
+        if sort_by not in COLUMNS:
+            raise ValueError(f"Unknown column of books: {sort_by}")
+        criteria = {'query': query, 'category': category, 'cover_type': cover_type,
+                    'min_pages': min_pages, 'max_pages': max_pages}
+        return Selection(self, criteria, sort_by, descending)
+
+    def mask(self, query=None, category=None, cover_type=None, min_pages=None, max_pages=None) -> bytes:
+        """Returns the byte mask of the books matching the criteria of select"""
+        masks = [] if 0 not in self.alive else [self.alive]
+        if query is not None:
+            masks.append(self._query_mask(query))
+        if category is not None:
+            masks.append(self._code_mask(self.categories, self.category_codes, category))
+        if cover_type is not None:
+            masks.append(self._code_mask(self.covers, self.cover_codes, cover_type))
+        if min_pages is not None or max_pages is not None:
+            masks.append(self._pages_mask(min_pages, max_pages))
+        if len(masks) < 2:
+            return bytes(masks[0] if masks else self.alive)
+        # Intersected in one pass as big integers, converting every mask once
+        return functools.reduce(operator.and_, (int.from_bytes(mask, 'little') for mask in masks)).to_bytes(
+            len(self.alive), 'little')
+
+    @staticmethod
+    def _code_mask(codes: bytearray, interner: Interner, values) -> bytes:
+        values = values if isinstance(values, (list, tuple, set, frozenset)) else [values]
+        return codes.translate(code_table(interner.codes[value] for value in values if value in interner.codes))
+
+    def _pages_mask(self, low, high) -> bytearray:
+        # Whole buckets inside the range are matched by their code, the one or two buckets the bounds
+        # fall into are checked book by book (the last one matches whole without max_pages).
+        # Unknown page counts (-1) never match
+        low = max(low or 0, 0)
+        high_code = len(self.page_bounds) + 1 if high is None else bisect.bisect_right(self.page_bounds, high)
+        high = float('inf') if high is None else high
+        low_code = bisect.bisect_right(self.page_bounds, low)
+        mask = self.page_codes.translate(code_table(range(low_code + 1, high_code)))
+        pages = self.pages
+        for code in {low_code, high_code} & set(range(len(self.page_postings))):
+            for position in self.page_postings[code]:
+                mask[position] = low <= pages[position] <= high
+        return mask
+
+    def _query_mask(self, query: str) -> bytes:
+        size = len(self.ids)
+        mask = None
+        for token in tokenize(query):
+            start = bisect.bisect_left(self.tokens, token)
+            end = bisect.bisect_left(self.tokens, token + '\U0010ffff', start)
+            token_mask = mask_of(itertools.chain.from_iterable(
+                self.postings[self.tokens[i]] for i in range(start, end)), size)
+            categories = [code for code, category in enumerate(self.category_codes.values)
+                          if any(word.startswith(token) for word in tokenize(category))]
+            if categories:
+                token_mask = mask_or(token_mask, self.categories.translate(code_table(categories)))
+            mask = token_mask if mask is None else mask_and(mask, token_mask)
+        return bytes(size) if mask is None else mask  # A query without words matches nothing
+
+    def refresh(self) -> bool:
+        """Applies the books changes committed since the snapshot was built or refreshed, building it
+        if it wasn't yet. Rebuilds it when more than REBUILD_FRACTION of the books changed or the change
+        log can't tell which. Returns True if the snapshot changed"""
+        with self._lock:
+            if not self.ready:
+                self.build()
+                return True
+            counter = self.db_manager.change_counter
+            if counter == self.counter:
+                return False
+
+            changes = self.db_manager.changes_since(self.counter, 'books')
+            touched = touched_ids(changes)
+            if touched is None:
+                self.build()
+                return True
+            if not touched and None not in changes:  # No books written, e.g. only favorites
+                self.counter = counter  # Keeps version, so selections and sort ranks stay valid
+                return False
+            last_id = self.ids[-1] if self.ids else 0
+            appended = [row for rows in self.db_manager.iter_rows(
+                'books', COLUMNS, {'book_id': (last_id + 1, None)}, batch_size=10000, order_by='book_id')
+                for row in rows]
+            touched = {book_id for book_id in touched if book_id <= last_id}
+            if len(touched) + len(appended) > REBUILD_FRACTION * len(self.ids):
+                self.build()
+                return True
+
+            touched = sorted(touched)
+            current = {}
+            for start in range(0, len(touched), READ_CHUNK):
+                chunk = touched[start:start + READ_CHUNK]
+                current.update((row[0], row) for row in self.db_manager.paginate(
+                    'books', {'book_id': chunk}, limit=len(chunk)))
+            changed = []  # Positions of updated and appended books, indexed together
+            for book_id in touched:
+                position = bisect.bisect_left(self.ids, book_id)
+                if position == len(self.ids) or self.ids[position] != book_id:
+                    if book_id in current:  # Inserted between existing ids, positions would shift
+                        self.build()
+                        return True
+                elif book_id in current:
+                    self._update(position, current[book_id])
+                    changed.append(position)
+                else:
+                    self.alive[position] = 0
+            changed.extend(map(self._append, appended))
+            self._index(changed)
+            for token in self.postings.keys() - set(self.tokens):
+                bisect.insort(self.tokens, token)
+
+            self.counter = counter
+            self.version += 1
+            self._ranks = {}
+            if len(self) != self.db_manager.count_rows('books'):  # E.g. inserts below the last id
+                self.build()
+            return True
+
+    def _find(self, order: array, key, position: int) -> int:
+        """Returns the index of position in an order sorted by (key, position), or where it would go"""
+        target = (key(position), position)
+        low, high = 0, len(order)
+        while low < high:
+            middle = (low + high) // 2
+            if (key(order[middle]), order[middle]) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _index(self, positions: list) -> None:
+        """Adds books to the sort orders and page buckets. Each order is copied once with the books
+        merged in, rather than moving its tail for every insert"""
+        for column, order in self.orders.items():
+            key = self.sort_key(column)
+            inserts = sorted((self._find(order, key, position), key(position), position) for position in positions)
+            merged = array('i')
+            start = 0
+            for index, _, position in inserts:
+                merged += order[start:index]
+                merged.append(position)
+                start = index
+            merged += order[start:]
+            self.orders[column] = merged
+        for position in positions:
+            code = bisect.bisect_right(self.page_bounds, self.pages[position])
+            if position == len(self.page_codes):
+                self.page_codes.append(code)
+            else:
+                self.page_codes[position] = code
+            bisect.insort(self.page_postings[code], position)
+
+    def _unindex(self, position: int) -> None:
+        for column, order in self.orders.items():
+            del order[self._find(order, self.sort_key(column), position)]
+        postings = self.page_postings[self.page_codes[position]]
+        del postings[bisect.bisect_left(postings, position)]
+
+    def _update(self, position: int, row) -> None:
+        """Replaces a book's values with those of a row read from the table, leaving it to be indexed"""
+        self._unindex(position)
+        for token in tokenize(self.name(position)) | tokenize(self.author(position)):
+            postings = self.postings[token]
+            del postings[bisect.bisect_left(postings, position)]
+
+        _, name, author, num_pages, cover_type, category = row
+        self.names[position] = name
+        self.pages[position] = -1 if num_pages is None else num_pages
+        self.authors[position] = self.author_values.append(author)
+        self.categories[position] = self.category_codes.code(category)
+        self.covers[position] = self.cover_codes.code(cover_type)
+        self.alive[position] = 1
+        for token in tokenize(name) | tokenize(author):
+            bisect.insort(self.postings.setdefault(token, array('i')), position)
+
+
+class Selection:
+    """Books of a snapshot matching some criteria, in sort order.
+
+    Evaluated on first use, and again if the snapshot changed since. Small selections are sorted
+    up front, larger ones are read by walking the snapshot's sort order and skipping non-matching books.
+    """
+
+    def __init__(self, snapshot: CatalogSnapshot, criteria: dict, sort_by: str, descending: bool) -> None:
+        self.snapshot = snapshot
+        self.criteria = criteria
+        self.sort_by = sort_by
+        self.descending = descending
+        self._version = None
+        self._count = 0
+        self._mask = b''
+        self._positions = None  # Sorted positions of small selections
+        self._walk = None  # [offset, iterator] of the last page read from a large selection
+
+    def _evaluate(self) -> None:
+        snapshot = self.snapshot
+        snapshot.refresh()
+        if snapshot.version == self._version:
+            return
+        mask = snapshot.mask(**self.criteria)
+        self._mask = mask
+        self._count = mask.count(1)
+        self._walk = None
+        self._positions = None
+        if self._count <= len(mask) * SMALL_SELECTION:
+            positions = positions_of(mask)
+            if self.sort_by != 'book_id':
+                positions.sort(key=snapshot.ranks(self.sort_by).__getitem__)
+            if self.descending:
+                positions.reverse()
+            self._positions = positions
+        self._version = snapshot.version
+
+    def _iterate(self):
+        mask = self._mask
+        if self.sort_by == 'book_id':
+            order = range(len(mask))
+            if self.descending:
+                return itertools.compress(reversed(order), reversed(mask))
+            return itertools.compress(order, mask)
+        order = self.snapshot.orders[self.sort_by]
+        start, end = self.snapshot.window(self.sort_by, self.criteria)
+        if (start, end) != (0, len(order)):
+            order = order[start:end]
+        if self.descending:
+            return itertools.compress(reversed(order), map(mask.__getitem__, reversed(order)))
+        return itertools.compress(order, map(mask.__getitem__, order))
+
+    def count(self) -> int:
+        with self.snapshot._lock:
+            self._evaluate()
+            return self._count
+
+    def page(self, offset: int, limit: int) -> list:
+        """Returns up to limit books (as rows) following the first offset ones"""
+        with self.snapshot._lock:
+            self._evaluate()
+            if self._positions is not None:
+                positions = self._positions[offset:offset + limit]
+            else:
+                if self._walk is None or self._walk[0] != offset:  # Else continues where the last page ended
+                    self._walk = [offset, itertools.islice(self._iterate(), offset, None)]
+                positions = list(itertools.islice(self._walk[1], limit))
+                self._walk[0] = offset + len(positions)
+            return [self.snapshot.row(position) for position in positions]
@@ -1,44 +1,49 @@
+import logging
 import sqlite3
-import hashlib
-import json
-from modules.database import DatabaseManager
+from modules.forms import load_form
+from modules.metrics import timed
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
 from PyQt5.QtWidgets import QMainWindow
-from PyQt5.uic import loadUi
 
+logger = logging.getLogger(__name__)
 
-def hash_password(password) -> str:
-    """Returns encrypted password"""
-    return hashlib.sha256(password.encode()).hexdigest()
 
+class FutureWatcher(QObject):
+    """Calls back on the GUI thread when a concurrent.futures.Future finishes on a worker thread"""
 
-def check_password(entered_password, stored_password) -> bool:
-    """Returns Boolean value of password validity"""
-    return hash_password(entered_password) == stored_password
+    done = pyqtSignal(object, object)  # Future, callback
 
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self.done.connect(self._deliver)  # Queued, since the signal is emitted from the worker
 
-def read_users_table() -> dict:
-    """Opens and extracts data from users table"""
-    db_manager = DatabaseManager('LIBRARY.db')
-    rows = db_manager.load_data('users')
-    return {row[0]: row[1] for row in rows}
+    def watch(self, future, callback) -> None:
+        future.add_done_callback(lambda finished: self.done.emit(finished, callback))
+
+    @staticmethod
+    def _deliver(future, callback) -> None:
+        callback(future)
 
 
 class Register(QMainWindow):
     """A class to let user register in the system"""
 
-    def __init__(self, widget) -> None:
+    def __init__(self, widget, auth) -> None:
         super().__init__()
 
         # Set up the user interface from Designer
-        self.reg_ui = loadUi("ui/reg.ui", self)
+        self.reg_ui = load_form("reg", self)
         self.widget = widget
 
-        self.db_manager = DatabaseManager('LIBRARY.db')
+        self.auth = auth
+        self.watcher = FutureWatcher(self)
 
         # Connects buttons with screen switcher and registration methods
         self.reg_ui.pushButton_2.clicked.connect(self.switch_to_login)
         self.reg_ui.pushButton.clicked.connect(self.register)
 
+    @pyqtSlot()
+    @timed()
     def switch_to_login(self) -> None:
         """Allows a user to switch to login screen"""
         self.widget.setCurrentIndex(0)
@@ -47,22 +52,17 @@ class Register(QMainWindow):
         self.reg_ui.label_4.setStyleSheet("color: transparent; background-color:transparent")
         self.reg_ui.label_4.setText("")
 
+    @pyqtSlot()
+    @timed()
     def register(self) -> None:
         """Checks for user input and if validated, writes credentials to DB.
         """
-        email_rows = self.db_manager.search('users', ['email'])
-        emails_in_db = [row[0] for row in email_rows]
-
         # Reads user input
         email = self.reg_ui.lineEdit.text()
         password = self.reg_ui.lineEdit_2.text()
 
-        # Control flow depending on registration rules
-        if email in emails_in_db:
-            self.reg_ui.label_4.setStyleSheet("color: red; background-color:transparent")
-            self.reg_ui.label_4.setText("This email is already registered")
-
-        elif "@" not in email:
+        # Control flow depending on registration rules, taken emails are caught by the primary key
+        if "@" not in email:
             self.reg_ui.label_4.setStyleSheet("color: red; background-color:transparent")
             self.reg_ui.label_4.setText("Invalid email")
 
@@ -71,31 +71,49 @@ class Register(QMainWindow):
             self.reg_ui.label_4.setText("Password must be at least 4 characters")
 
         else:
-            try:  # Writing to DB can fail when it's used concurrently
-                hashed_password = hash_password(password)
-                self.db_manager.add_record('users', email, hashed_password)
-
+            # Hashing is slow on purpose, so it runs on the worker pool together with the write
+            self.reg_ui.pushButton.setEnabled(False)
+            self.watcher.watch(self.auth.register_async(email, password), self.show_registration)
+
+    @timed()
+    def show_registration(self, future) -> None:
+        """Shows the result of registration once credentials are written to DB"""
+        self.reg_ui.pushButton.setEnabled(True)
+        try:  # Writing to DB can fail when it's used concurrently, even after retrying
+            if future.result():
                 self.reg_ui.label_4.setStyleSheet("color: green; background-color:transparent")
                 self.reg_ui.label_4.setText("Registration successful!")
-
-            except sqlite3.OperationalError:
+            else:
                 self.reg_ui.label_4.setStyleSheet("color: red; background-color:transparent")
-                self.reg_ui.label_4.setText("Could not save to database. Close if it is open!")
+                self.reg_ui.label_4.setText("This email is already registered")
+
+        except sqlite3.OperationalError:
+            self.reg_ui.label_4.setStyleSheet("color: red; background-color:transparent")
+            self.reg_ui.label_4.setText("Could not save to database. Close if it is open!")
 
 
 class Login(QMainWindow):
     """A class to handle user login"""
 
-    def __init__(self, widget) -> None:
+    def __init__(self, widget, session, auth, show_library=None) -> None:
         super().__init__()
 
+        self.session = session
+        self.auth = auth
+        # Called to switch to the library after login, which lets main build that window lazily
+        self.show_library = show_library
+        self.watcher = FutureWatcher(self)
+
         # Set up the user interface from Designer
-        self.log_ui = loadUi("ui/login.ui", self)
+        self.log_ui = load_form("login", self)
+        self.log_ui.lineEdit.setText(session.last_email)
         self.widget = widget
 
         self.log_ui.pushButton_2.clicked.connect(self.switch_to_register)
         self.log_ui.pushButton.clicked.connect(self.login)
 
+    @pyqtSlot()
+    @timed()
     def switch_to_register(self) -> None:
         """Allows a user to switch to registration screen"""
         self.widget.setCurrentIndex(1)
@@ -104,6 +122,8 @@ class Login(QMainWindow):
         self.log_ui.label_4.setStyleSheet("color: transparent; background-color:transparent")
         self.log_ui.label_4.setText("")
 
+    @pyqtSlot()
+    @timed()
     def login(self) -> None:
         """Lets user login to system if registered"""
 
@@ -111,26 +131,57 @@ class Login(QMainWindow):
         email = self.log_ui.lineEdit.text()
         password = self.log_ui.lineEdit_2.text()
 
-        # Checks login rules and tries to login
-        if email not in read_users_table():
+        # The lookup and the password check (slow on purpose) run on the worker pool
+        self.log_ui.pushButton.setEnabled(False)
+        self.watcher.watch(self.auth.login_async(email, password),
+                           lambda future: self.finish_login(email, password, future))
+
+    @timed()
+    def finish_login(self, email: str, password: str, future) -> None:
+        """Logs the user in once the password is checked"""
+        self.log_ui.pushButton.setEnabled(True)
+        try:  # Reading the DB can fail when it's used concurrently, even after retrying
+            stored_password, is_valid = future.result()
+        except sqlite3.Error:
+            self.log_ui.label_4.setStyleSheet("color: red; background-color:transparent")
+            self.log_ui.label_4.setText("Could not read from database. Close if it is open!")
+            return
+
+        if stored_password is None:
             self.log_ui.label_4.setStyleSheet("color: red; background-color:transparent")
             self.log_ui.label_4.setText("No such email found!")
 
-        elif not check_password(password, read_users_table()[email]):
+        elif not is_valid:
             self.log_ui.label_4.setStyleSheet("color: red; background-color:transparent")
             self.log_ui.label_4.setText("Password is incorrect!")
 
         else:
+            # Legacy SHA-256 hashes and outdated costs are replaced now that the password is known
+            if self.auth.needs_rehash(stored_password):
+                self.watcher.watch(self.auth.update_password_async(email, password), self.upgrade_done)
+
             try:
-                # Writes logged-in user to json file to be read by Library class
-                with open('utils/current_user.json', 'w') as file:
-                    json.dump({'email': email}, file, indent=4)
+                # Makes the user active in the session shared with Library
+                self.session.login(email)
 
                 # Switches active widget to library
-                self.widget.setCurrentIndex(2)
+                if self.show_library is not None:
+                    self.show_library()
+                else:
+                    self.widget.setCurrentIndex(2)
                 # Clears the info label when switching window
                 self.log_ui.lineEdit.clear()
                 self.log_ui.lineEdit_2.clear()
 
-            except Exception as e:
-                print(e)
+            except Exception:
+                logger.exception("Opening the library failed")
+                self.log_ui.label_4.setStyleSheet("color: red; background-color:transparent")
+                self.log_ui.label_4.setText("Could not open the library!")
+
+    @staticmethod
+    def upgrade_done(future) -> None:
+        """Ignores a failed password upgrade, it's tried again on the next login"""
+        try:
+            future.result()
+        except sqlite3.OperationalError:
+            pass
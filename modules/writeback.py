@@ -0,0 +1,154 @@
+import logging
+import threading
+from modules.connection import is_lock_error, run_with_retry
+from modules.metrics import measure, increment
+
+
+class FavoritesWriteQueue:
+    """Write-behind queue of favorites changes, written to the database in batches.
+
+    add and remove only record the change: for every (email, book_id) the last change wins, so adding
+    and removing a book before the next flush writes nothing but the removal. A background thread flushes
+    everything queued in one transaction every flush_interval seconds, or as soon as max_pending changes
+    are queued. changes() returns what isn't written yet, for showing favorites as they will be.
+    A batch that fails on a locked database is queued again, other errors drop the changes that can't
+    be written (logged and counted as favorites.dropped). Call close() before the app quits to write the rest.
+    """
+
+    def __init__(self, db_manager, flush_interval: float = 0.5, max_pending: int = 500) -> None:
+        self.db_manager = db_manager
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}  # Email -> {book_id: True to add, False to remove}
+        self._flushing = {}  # Changes of the flush in progress, until they are committed
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()  # One flush at a time
+        self._thread = threading.Thread(target=self._run, name='favorites-writer', daemon=True)
+        self._thread.start()
+
+    def add(self, email: str, book_ids) -> None:
+        self._change(email, book_ids, True)
+
+    def remove(self, email: str, book_ids) -> None:
+        self._change(email, book_ids, False)
+
+    def _change(self, email: str, book_ids, add: bool) -> None:
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("The favorites write queue is closed")
+            was_empty = not self._size
+            changes = self._pending.setdefault(email, {})
+            size = len(changes)
+            book_ids = [int(book_id) for book_id in book_ids]
+            changes.update(dict.fromkeys(book_ids, add))
+            self._size += len(changes) - size
+            increment('favorites.coalesced', len(book_ids) - (len(changes) - size))
+            if was_empty or self._size >= self.max_pending:
+                self._condition.notify_all()  # Starts the flush timer, or flushes right away
+
+    def changes(self, email: str) -> dict:
+        """Returns {book_id: True if added, False if removed} of a user's changes not committed yet"""
+        with self._condition:
+            changes = dict(self._flushing.get(email, ()))
+            changes.update(self._pending.get(email, ()))
+            return changes
+
+    def __len__(self) -> int:
+        """Changes waiting for the next flush"""
+        with self._condition:
+            return self._size
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._size or self._closed)  # Idle until something is queued
+                self._condition.wait_for(lambda: self._closed or self._size >= self.max_pending, self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception:
+                logging.exception("Writing favorites failed, retrying with the next flush")
+
+    def flush(self) -> int:
+        """Writes the queued changes in one transaction and returns how many were written.
+        If the database is locked they are queued again, behind any change made to the same books meanwhile"""
+        with self._flush_lock:
+            with self._condition:
+                batch, self._flushing = self._pending, self._pending
+                self._pending, self._size = {}, 0
+            if not batch:
+                return 0
+
+            changes = [(email, book_id, add) for email, books in batch.items() for book_id, add in books.items()]
+            try:
+                with measure('favorites.flush') as measurement:
+                    written = self._write_batch(changes)
+                    measurement.add_rows(written)
+            except Exception:  # Only lock errors get here
+                with self._condition:
+                    for email, books in batch.items():
+                        pending = self._pending.setdefault(email, {})
+                        for book_id, add in books.items():
+                            if book_id not in pending:
+                                pending[book_id] = add
+                                self._size += 1
+                raise
+            finally:
+                with self._condition:
+                    self._flushing = {}
+            return written
+
+    def _write_batch(self, changes: list) -> int:
+        """Writes (email, book_id, add) changes in one transaction. If that fails for another reason than
+        a locked database, e.g. a constraint, writes them one at a time and drops the ones that still fail.
+        Returns the number written"""
+        try:
+            self._write(changes)
+            return len(changes)
+        except Exception as error:
+            if is_lock_error(error):
+                raise
+            logging.warning("Writing %d favorites changes failed (%s), writing them one by one", len(changes), error)
+
+        written = 0
+        for change in changes:
+            try:
+                self._write([change])
+                written += 1
+            except Exception as error:
+                if is_lock_error(error):
+                    raise
+                logging.error("Dropped favorites change %s of %s to book %s: %s",
+                              'add' if change[2] else 'remove', change[0], change[1], error)
+                increment('favorites.dropped')
+        return written
+
+    def _write(self, changes: list) -> None:
+        added = [(email, book_id) for email, book_id, add in changes if add]
+        removed = [(email, book_id) for email, book_id, add in changes if not add]
+        with self.db_manager.connection():
+            if added:
+                self.db_manager.add_records('favorites', added)
+            if removed:
+                self.db_manager.delete_rows('favorites', ['email', 'book_id'], removed)
+
+    def close(self) -> None:
+        """Stops the background flushes and writes what is still queued, retrying while the database
+        is locked. Errors are logged rather than raised, as it runs while the app quits. Changes made
+        afterwards raise RuntimeError"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        try:
+            written = run_with_retry(self.flush, retries=8)
+        except Exception:
+            logging.exception("%d favorites changes couldn't be written", len(self))
+            return
+        if written:
+            logging.info("Wrote %d queued favorites changes", written)
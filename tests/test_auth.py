@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from modules.auth import AuthService, check_password, hash_password
+from modules.database import DatabaseManager
+
+
+class LoginTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.auth = AuthService(self.db_manager, cost=4)
+        self.auth.prepare_async().result()
+        self.assertTrue(self.auth.register_async('ann@example.com', 'secret').result())
+
+    def tearDown(self):
+        self.auth.shutdown()
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def test_login(self):
+        stored_password, is_valid = self.auth.login_async('ann@example.com', 'secret').result()
+        self.assertTrue(stored_password.startswith('scrypt$'))
+        self.assertTrue(is_valid)
+        self.assertFalse(self.auth.login_async('ann@example.com', 'wrong').result()[1])
+        self.assertEqual(self.auth.login_async('bob@example.com', 'secret').result(), (None, False))
+
+    def test_lookup_errors_reach_the_future(self):
+        self.auth.cache.clear()
+        error = sqlite3.DatabaseError("file is not a database")
+        with mock.patch.object(self.db_manager, 'search', side_effect=error):
+            future = self.auth.login_async('ann@example.com', 'secret')
+            with self.assertRaises(sqlite3.DatabaseError):
+                future.result()
+
+    def test_malformed_hash_matches_no_password(self):
+        with self.db_manager.connection() as conn:
+            conn.execute("UPDATE users SET password = 'scrypt$x$8$1$00$00' WHERE email = 'ann@example.com'")
+        self.auth.cache.clear()
+        with self.assertLogs('modules.auth', 'ERROR'):
+            self.assertEqual(self.auth.login_async('ann@example.com', 'secret').result(),
+                             ('scrypt$x$8$1$00$00', False))
+
+
+class CheckPasswordTest(unittest.TestCase):
+    def test_malformed_hashes(self):
+        valid = hash_password('secret', cost=4)
+        self.assertTrue(check_password('secret', valid))
+        malformed = [
+            'scrypt$4$8',  # Missing fields
+            valid + '$extra',
+            valid.replace('$4$', '$four$', 1),  # Cost isn't a number
+            valid.replace('scrypt$4$8$1$', 'scrypt$4$8$1$zz', 1),  # Salt isn't hex
+            'not a sha256 hash: ünïcode',  # Legacy hash with non-ASCII characters
+        ]
+        for stored_password in malformed:
+            with self.subTest(stored_password), self.assertLogs('modules.auth', 'ERROR'):
+                self.assertFalse(check_password('secret', stored_password))
+
+
+if __name__ == '__main__':
+    unittest.main()
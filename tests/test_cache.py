@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from modules.cache import CatalogCache
+from modules.database import DatabaseManager
+
+
+class CatalogCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.db_manager.create_tables()
+        self.db_manager.add_records('users', [('ann@example.com', 'x'), ('bob@example.com', 'x')])
+        self.db_manager.add_records('books', [(1, 'Dune', 'Frank Herbert', 412, 'Paperback', 'scifi'),
+                                              (2, 'Dracula', 'Bram Stoker', 418, 'Hardback', 'horror'),
+                                              (3, 'Emma', 'Jane Austen', 474, 'Paperback', 'classics')])
+        self.db_manager.add_records('favorites', [('ann@example.com', 1)])
+        self.cache = CatalogCache(self.db_manager)
+
+    def tearDown(self):
+        self.cache.close()
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def load_while_writing(self, method: str, write):
+        """Patches a read of the DatabaseManager so that write() commits after the read, before the
+        loaded value reaches the cache, like a write on another thread during a load"""
+        read = getattr(self.db_manager, method)
+
+        def read_then_write(*args, **kwargs):
+            result = read(*args, **kwargs)
+            write()
+            return result
+
+        return mock.patch.object(self.db_manager, method, side_effect=read_then_write)
+
+    def test_writes_drop_the_entries_they_touch(self):
+        self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1,))
+        self.assertEqual(self.cache.favorite_ids('bob@example.com'), ())
+        self.assertEqual(self.cache.count('books', 'category', 'horror'), 1)
+
+        self.db_manager.add_records('favorites', [('ann@example.com', 3)])
+        self.assertNotIn(('ids', 'favorites', 'email', 'ann@example.com'), self.cache.cache)
+        self.assertIn(('ids', 'favorites', 'email', 'bob@example.com'), self.cache.cache)
+        self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1, 3))
+
+        # An update by book_id doesn't say the old category, so every category count is dropped
+        self.db_manager.update('books', {'category': 'horror'}, {'book_id': 1})
+        self.assertEqual(len(self.cache.cache), 2)
+        self.assertEqual(self.cache.count('books', 'category', 'horror'), 2)
+
+    def test_add_records_during_a_load_is_not_cached(self):
+        with self.load_while_writing('search', lambda: self.db_manager.add_records('favorites',
+                                                                                   [('ann@example.com', 2)])):
+            self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1,))  # Read before the write
+        self.assertEqual(len(self.cache.cache), 0)
+        self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1, 2))
+
+    def test_update_during_a_load_is_not_cached(self):
+        with self.load_while_writing('count_rows', lambda: self.db_manager.update('books', {'category': 'scifi'},
+                                                                                  {'book_id': 2})):
+            self.assertEqual(self.cache.count('books', 'category', 'scifi'), 1)
+        self.assertEqual(len(self.cache.cache), 0)
+        self.assertEqual(self.cache.count('books', 'category', 'scifi'), 2)
+        self.assertEqual(self.cache.count('books', 'category', 'scifi'), 2)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_closed_cache_stops_listening(self):
+        self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1,))
+        self.cache.close()
+        self.db_manager.add_records('favorites', [('ann@example.com', 2)])
+        self.assertEqual(self.cache.favorite_ids('ann@example.com'), (1,))
+        self.cache = CatalogCache(self.db_manager)
+
+
+if __name__ == '__main__':
+    unittest.main()
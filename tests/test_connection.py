@@ -0,0 +1,74 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from modules.connection import ConnectionPool
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pool = ConnectionPool(os.path.join(self.tmp.name, 'library.db'), pool_size=2, timeout=0.1)
+        with self.pool.connection() as conn:
+            conn.execute("CREATE TABLE books (book_id INTEGER PRIMARY KEY, name TEXT)")
+
+    def tearDown(self):
+        self.pool.close()
+        self.tmp.cleanup()
+
+    def names(self) -> list:
+        with self.pool.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT name FROM books ORDER BY book_id")]
+
+    def test_nested_use_reuses_the_connection_of_the_thread(self):
+        with self.pool.connection() as outer:
+            with self.pool.connection() as inner:
+                self.assertIs(inner, outer)
+            other = []
+            thread = threading.Thread(target=lambda: other.append(self.pool.acquire()))
+            thread.start()
+            thread.join()
+            self.assertIsNot(other[0], outer)  # Another thread gets a connection of its own
+            self.pool.release(other[0])
+        with self.pool.connection() as conn:
+            self.assertIs(conn, outer)  # The most recently released one
+        self.assertEqual(len(self.pool._all), 2)
+
+    def test_after_commit_waits_for_the_outermost_block(self):
+        calls = []
+        with self.pool.connection() as conn:
+            conn.execute("INSERT INTO books VALUES (1, 'Dune')")
+            with self.pool.connection():
+                self.pool.after_commit(lambda: calls.append(self.names()))
+            self.assertEqual(calls, [])  # The inner block doesn't commit
+        self.assertEqual(calls, [['Dune']])  # Called after the commit, on a released connection
+
+        self.pool.after_commit(lambda: calls.append('now'))  # Outside a block
+        self.assertEqual(calls, [['Dune'], 'now'])
+
+    def test_rollback_skips_after_commit(self):
+        calls = []
+        with self.assertRaises(ValueError):
+            with self.pool.connection():
+                with self.pool.connection() as inner:
+                    inner.execute("INSERT INTO books VALUES (1, 'Dune')")
+                    self.pool.after_commit(lambda: calls.append('committed'))
+                raise ValueError("Rolls back the outer block")
+        self.assertEqual(calls, [])
+        self.assertEqual(self.names(), [])
+
+        with self.pool.connection():  # Callbacks of the rolled back block don't leak into the next one
+            pass
+        self.assertEqual(calls, [])
+
+    def test_waits_for_a_free_connection(self):
+        held = [self.pool.acquire(), self.pool.acquire()]
+        with self.assertRaises(sqlite3.OperationalError):
+            self.pool.acquire()
+        self.pool.release(held.pop())
+        self.assertIsNotNone(self.pool.acquire())
+
+
+if __name__ == '__main__':
+    unittest.main()
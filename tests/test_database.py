@@ -0,0 +1,156 @@
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from modules.database import DatabaseManager
+
+
+class PaginateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.db_manager.create_tables()
+        rng = random.Random(0)
+        rows = [(book_id, f'Book {book_id}', rng.choice([None, 'Ann', 'Bob', 'Cid']),
+                 rng.choice([None, 100, 200, 300]), 'Paperback', rng.choice(['fantasy', 'horror']))
+                for book_id in range(1, 201)]
+        self.db_manager.add_records('books', rows)
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def pages(self, sort_by: str, descending: bool, filters=None, limit: int = 7) -> list:
+        """Reads every page, passing the last row as the cursor like the HTTP API does"""
+        columns = ['book_id', 'name', 'author', 'num_pages', 'cover_type', 'category']
+        rows, after = [], None
+        while True:
+            page = self.db_manager.paginate('books', filters, sort_by, descending, after, limit)
+            rows.extend(page)
+            if len(page) < limit:
+                return rows
+            last = dict(zip(columns, page[-1]))
+            after = last['book_id'] if sort_by == 'book_id' else (last[sort_by], last['book_id'])
+
+    def test_pages_through_null_sort_values(self):
+        all_rows = self.db_manager.load_data('books')
+        for sort_by in ('author', 'num_pages', 'book_id'):
+            column = ['book_id', 'name', 'author', 'num_pages', 'cover_type', 'category'].index(sort_by)
+            for descending in (False, True):
+                with self.subTest(sort_by=sort_by, descending=descending):
+                    # SQLite sorts NULLs first ascending, last descending
+                    expected = sorted(all_rows, key=lambda row: (row[column] is not None, row[column] or 0, row[0]),
+                                      reverse=descending)
+                    self.assertEqual(self.pages(sort_by, descending), expected)
+
+    def test_pages_through_null_sort_values_with_filters(self):
+        rows = self.pages('author', False, {'category': 'horror'})
+        self.assertEqual(len(rows), self.db_manager.count_rows('books', {'category': 'horror'}))
+        self.assertTrue(all(row[5] == 'horror' for row in rows))
+        self.assertEqual(len({row[0] for row in rows}), len(rows))
+
+
+class BatchWriteTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.db_manager.create_tables()
+        self.db_manager.add_records('users', [('ann@example.com', 'hash'), ('bob@example.com', 'hash')])
+        self.db_manager.add_records('books', [(book_id, f'Book {book_id}', 'Ann', 100, 'Paperback', 'fantasy')
+                                              for book_id in range(1, 11)])
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def favorites(self) -> list:
+        return sorted(self.db_manager.load_data('favorites'))
+
+    def test_ignore_counts_only_new_rows(self):
+        self.assertEqual(self.db_manager.add_records('favorites', [('ann@example.com', 1), ('ann@example.com', 2)]), 2)
+        added = self.db_manager.add_records('favorites', [('ann@example.com', 2), ('ann@example.com', 3),
+                                                          ('ann@example.com', 3), ('bob@example.com', 2)])
+        self.assertEqual(added, 2)  # (ann, 2) was there, the second (ann, 3) is a duplicate of the batch
+        self.assertEqual(len(self.favorites()), 4)
+        self.assertEqual(self.db_manager.add_records('favorites', []), 0)
+
+    def test_replace_counts_every_row(self):
+        replaced = self.db_manager.add_records('books', [(1, 'Renamed', 'Bob', 200, 'Hardback', 'horror'),
+                                                         (11, 'Book 11', 'Ann', 100, 'Paperback', 'fantasy')],
+                                               'REPLACE')
+        self.assertEqual(replaced, 2)
+        self.assertEqual(self.db_manager.search('books', ['name'], {'book_id': 1}), [('Renamed',)])
+        self.assertEqual(self.db_manager.count_rows('books'), 11)
+
+    def test_abort_rolls_back_the_whole_batch(self):
+        self.db_manager.add_records('favorites', [('ann@example.com', 1)])
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.db_manager.add_records('favorites', [('ann@example.com', 5), ('ann@example.com', 1),
+                                                      ('ann@example.com', 6)], 'ABORT')
+        self.assertEqual(self.favorites(), [('ann@example.com', 1)])
+
+    def test_unknown_conflict_resolution(self):
+        with self.assertRaises(ValueError):
+            self.db_manager.add_records('favorites', [('ann@example.com', 1)], 'FAIL; DROP TABLE books')
+
+    def test_delete_counts_rows_deleted_by_every_key(self):
+        self.db_manager.add_records('favorites', [(email, book_id) for email in ('ann@example.com', 'bob@example.com')
+                                                  for book_id in range(1, 6)])
+        deleted = self.db_manager.delete_rows('favorites', ['email', 'book_id'],
+                                              [('ann@example.com', 1), ('ann@example.com', 2), ('bob@example.com', 2),
+                                               ('ann@example.com', 9), ('ann@example.com', 1)])
+        self.assertEqual(deleted, 3)  # (ann, 9) doesn't exist and (ann, 1) is gone by the second time
+        self.assertEqual(len(self.favorites()), 7)
+        self.assertEqual(self.db_manager.delete_rows('favorites', ['book_id'], [(3,), (4,)]), 4)
+        self.assertEqual(self.db_manager.delete_rows('favorites', ['book_id'], []), 0)
+
+
+class QueryPlanTest(unittest.TestCase):
+    """The queries behind the book table, search and favorites must read indexes, not scan tables"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'), debug=True)
+        self.db_manager.create_tables()
+        self.db_manager.add_records('users', [('ann@example.com', 'hash')])
+        self.db_manager.add_records('books', [(book_id, f'Book {book_id}', 'Ann', 100 + book_id, 'Paperback',
+                                               'fantasy' if book_id % 2 else 'horror') for book_id in range(1, 51)])
+        self.db_manager.add_records('favorites', [('ann@example.com', book_id) for book_id in range(1, 51, 5)])
+        self.db_manager.full_scans.clear()
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def test_paginate(self):
+        self.db_manager.paginate('books', limit=10)
+        self.db_manager.paginate('books', after=10, limit=10)
+        self.db_manager.paginate('books', descending=True, after=10, limit=10)
+        self.db_manager.paginate('books', {'category': 'fantasy'}, after=10, limit=10)
+        for sort_by in ('name', 'author', 'num_pages'):
+            for descending in (False, True):
+                self.db_manager.paginate('books', sort_by=sort_by, descending=descending, limit=10)
+                self.db_manager.paginate('books', sort_by=sort_by, descending=descending, after=(None, 5), limit=10)
+                self.db_manager.paginate('books', sort_by=sort_by, descending=descending, after=('Ann', 5), limit=10)
+        self.assertEqual(self.db_manager.full_scans, [])
+
+    def test_reports_full_scans(self):
+        self.db_manager.search('books', ['book_id'], {'cover_type': 'Paperback'})
+        self.db_manager.paginate('books', sort_by='cover_type', limit=10)
+        self.assertEqual([detail for _, detail in self.db_manager.full_scans], ['SCAN books', 'SCAN books'])
+
+    def test_search(self):
+        self.assertTrue(self.db_manager.search_books('book'))
+        self.assertEqual(self.db_manager.count_search_results('book'), 50)
+        self.assertEqual(self.db_manager.full_scans, [])
+
+    def test_favorites(self):
+        self.assertEqual(len(self.db_manager.load_favorites_page('ann@example.com', None, 5)), 5)
+        self.db_manager.load_favorites_page('ann@example.com', 21, 5)
+        self.assertEqual(len(self.db_manager.search('favorites', ['book_id'], {'email': 'ann@example.com'})), 10)
+        self.assertEqual(self.db_manager.full_scans, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
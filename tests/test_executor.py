@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+import importlib.util
+from modules.connection import interrupt_thread
+from modules.database import DatabaseManager
+
+SLOW_QUERY = """
+    WITH RECURSIVE numbers(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM numbers WHERE x < 1000000000)
+    SELECT COUNT(*) FROM numbers
+    """
+
+
+class SlowQueryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def slow_count(self):
+        with self.db_manager.connection() as conn:
+            return conn.execute(SLOW_QUERY).fetchone()[0]
+
+
+class InterruptTest(SlowQueryTestCase):
+    def test_interrupts_the_statement_of_a_thread(self):
+        errors = []
+        started = threading.Event()
+
+        def run():
+            started.set()
+            try:
+                self.slow_count()
+            except sqlite3.OperationalError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        started.wait()
+        deadline = time.monotonic() + 5
+        while not interrupt_thread(thread.ident) and time.monotonic() < deadline:
+            time.sleep(0.01)  # Until the thread holds its connection
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertEqual([str(e) for e in errors], ['interrupted'])
+        self.assertEqual(interrupt_thread(thread.ident), 0)  # The connection went back to the pool
+
+    def test_idle_thread(self):
+        self.assertEqual(interrupt_thread(threading.get_ident()), 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec('PyQt5'), "needs PyQt5")
+class QueryExecutorCancelTest(SlowQueryTestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+
+        cls.app = QApplication.instance() or QApplication([])
+
+    def run_cancelled(self, interruptible: bool, delay: float):
+        """Cancels a slow count after delay seconds, returns the seconds until the pool is idle and the
+        results delivered"""
+        from modules.executor import QueryExecutor
+
+        executor = QueryExecutor()
+        delivered = []
+        started = threading.Event()
+
+        def count():
+            started.set()
+            return self.slow_count()
+
+        task = executor.submit('count', count, on_result=delivered.append, on_error=delivered.append,
+                               interruptible=interruptible)
+        started.wait()
+        time.sleep(delay)
+        start = time.perf_counter()
+        task.cancel()
+        executor.pool.waitForDone()
+        self.app.processEvents()
+        return time.perf_counter() - start, delivered
+
+    def test_cancel_interrupts_an_interruptible_task(self):
+        elapsed, delivered = self.run_cancelled(interruptible=True, delay=0.2)
+        self.assertLess(elapsed, 1)
+        self.assertEqual(delivered, [])  # Neither the result nor the interruption error
+
+    def test_cancel_only_drops_the_result_of_other_tasks(self):
+        from modules.executor import QueryExecutor
+
+        executor = QueryExecutor()
+        delivered = []
+        task = executor.submit('count', lambda: self.db_manager.count_rows('sqlite_master'),
+                               on_result=delivered.append)
+        task.cancel()
+        executor.pool.waitForDone()
+        self.app.processEvents()
+        self.assertFalse(task.interruptible)
+        self.assertEqual(delivered, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
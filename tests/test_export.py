@@ -0,0 +1,92 @@
+import os
+import csv
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+from benchmarks.bench_export import MAX_GROWTH_MB, rss_mb
+from benchmarks.synthetic import build_catalog
+from modules.export import export_table, main
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = build_catalog(os.path.join(self.tmp.name, 'library.db'), 30)
+        # The first batch has no authors and no page counts at all
+        with self.db_manager.connection() as conn:
+            conn.execute("UPDATE books SET author = NULL, num_pages = NULL WHERE book_id <= 10")
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def test_csv(self):
+        path = os.path.join(self.tmp.name, 'books.csv')
+        self.assertEqual(export_table(self.db_manager, 'books', path, batch_size=10), 30)
+        with open(path, newline='', encoding='utf-8') as file:
+            rows = list(csv.reader(file))
+        self.assertEqual(rows[0], self.db_manager.get_columns('books'))
+        self.assertEqual(len(rows), 31)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "needs pyarrow")
+    def test_parquet_schema_follows_the_column_types(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        path = os.path.join(self.tmp.name, 'books.parquet')
+        self.assertEqual(export_table(self.db_manager, 'books', path, batch_size=10), 30)
+        table = pq.read_table(path)
+        self.assertEqual(table.schema.field('author').type, pa.string())
+        self.assertEqual(table.schema.field('num_pages').type, pa.int64())
+        self.assertEqual(table.schema.field('book_id').type, pa.int64())
+        authors = table.column('author').to_pylist()
+        self.assertEqual(authors[:10], [None] * 10)
+        self.assertTrue(all(authors[10:]))
+
+    def test_parquet_without_pyarrow_is_refused_up_front(self):
+        path = os.path.join(self.tmp.name, 'books.parquet')
+        csv_path = os.path.join(self.tmp.name, 'favorites.csv')
+        with mock.patch('importlib.util.find_spec', return_value=None):
+            with self.assertRaisesRegex(ValueError, 'pip install pyarrow'):
+                export_table(self.db_manager, 'books', path)
+            with self.assertRaises(SystemExit), mock.patch('sys.stderr'):
+                main(['favorites=' + csv_path, 'books=' + path, '--db', os.path.join(self.tmp.name, 'library.db')])
+        self.assertFalse(os.path.exists(csv_path))  # Refused before the first export started
+        self.assertFalse(os.path.exists(path))
+
+
+@unittest.skipUnless(os.environ.get('LIBRARY_SLOW_TESTS'), "slow, set LIBRARY_SLOW_TESTS=1 to run")
+class StreamingMemoryTest(unittest.TestCase):
+    """Exports of a table stay within a few batches of memory, see benchmarks/bench_export.py"""
+
+    BOOKS = 300000  # Takes about 30 s to build, load_data of it grows the RSS by about 125 MB
+    MAX_DRIFT_MB = 32  # After the first batch, which also pays for one-time setup such as pyarrow's allocator
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db_manager = build_catalog(os.path.join(cls.tmp.name, 'library.db'), cls.BOOKS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db_manager.pool.close()
+        cls.tmp.cleanup()
+
+    def test_peak_rss_is_bounded(self):
+        extensions = ['csv', 'jsonl']
+        if importlib.util.find_spec('pyarrow'):
+            extensions.append('parquet')
+        for extension in extensions:
+            with self.subTest(extension):
+                before = rss_mb()
+                samples = []
+                written = export_table(self.db_manager, 'books', os.path.join(self.tmp.name, f'books.{extension}'),
+                                       batch_size=10000, progress=lambda count: samples.append(rss_mb()))
+                self.assertEqual(written, self.BOOKS)
+                self.assertLess(max(samples) - before, MAX_GROWTH_MB)
+                self.assertLess(max(samples) - samples[0], self.MAX_DRIFT_MB)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import random
+import tempfile
+import unittest
+import importlib.util
+from modules.database import DatabaseManager
+from modules.importer import (CatalogImporter, CsvReader, ImportStats, JsonLinesReader, normalize_record,
+                              parse_record, transform_listing)
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+class CatalogImporterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.csv = CsvReader(os.path.join(FIXTURES, 'catalog.csv'))
+        self.jsonl = JsonLinesReader(os.path.join(FIXTURES, 'catalog.jsonl'), category='classics')
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def books(self) -> dict:
+        return {row[1]: row[2:] for row in self.db_manager.load_data('books')}
+
+    def test_csv(self):
+        stats = CatalogImporter(self.db_manager, seed=0).run(self.csv)
+        # 'the  hobbit' by 'j. r. r. TOLKIEN' is a duplicate, the row without a name is dropped
+        self.assertEqual(stats, ImportStats(self.csv.source_id, 7, 5, 2))
+        books = self.books()
+        self.assertEqual(sorted(books), ['Dracula', 'Dune', 'Neuromancer', 'Stand by Me', 'The Hobbit'])
+        self.assertEqual(books['The Hobbit'], ('J. R. R. Tolkien', 310, 'Hardback', 'fantasy'))
+        self.assertEqual(books['Stand by Me'][0], None)
+        self.assertTrue(300 <= books['Dracula'][1] <= 900)  # Missing page count and cover are filled in
+        self.assertIn(books['Dracula'][2], ['Hardback', 'Paperback', 'Softcover'])
+        self.assertEqual(CatalogImporter(self.db_manager).checkpoint(self.csv), 7)
+
+    def test_jsonl_skips_books_already_imported(self):
+        importer = CatalogImporter(self.db_manager, seed=0)
+        importer.run(self.csv)
+        stats = importer.run(self.jsonl)
+        # Dune (extra whitespace) and the Neuromancer listing title are already in the library
+        self.assertEqual(stats, ImportStats(self.jsonl.source_id, 4, 2, 2))
+        books = self.books()
+        self.assertEqual((books['The Shining'][0], books['The Shining'][3]), ('Stephen King', 'horror'))
+        self.assertEqual(books['Frankenstein'][0], 'Mary Shelley')
+        self.assertEqual(len(books), 7)
+
+    def test_resumes_after_a_stop(self):
+        def stop_after_first_chunk(stats):
+            importer.stop()
+
+        importer = CatalogImporter(self.db_manager, batch_size=3, progress=stop_after_first_chunk, seed=0)
+        stats = importer.run(self.csv)
+        self.assertEqual(stats, ImportStats(self.csv.source_id, 3, 2, 1))
+        self.assertEqual(importer.checkpoint(self.csv), 3)
+        self.assertEqual(self.db_manager.search('import_checkpoints', ['source', 'position']),
+                         [(self.csv.source_id, 3)])
+
+        resumed = CatalogImporter(self.db_manager, batch_size=3, seed=0)
+        stats = resumed.run(self.csv)
+        self.assertEqual(stats, ImportStats(self.csv.source_id, 4, 3, 1))  # Only the records after the checkpoint
+        self.assertEqual(resumed.checkpoint(self.csv), 7)
+        self.assertEqual(len(self.books()), 5)
+
+    def test_reset_reads_the_source_again(self):
+        importer = CatalogImporter(self.db_manager, seed=0)
+        importer.run(self.csv)
+        # Nothing after the checkpoint
+        self.assertEqual(importer.run(self.csv), ImportStats(self.csv.source_id, 0, 0, 0))
+
+        importer.reset(self.csv)
+        self.assertEqual(importer.checkpoint(self.csv), 0)
+        self.assertEqual(importer.run(self.csv), ImportStats(self.csv.source_id, 7, 0, 7))  # All known by dedupe_key
+        self.assertEqual(len(self.books()), 5)
+
+
+@unittest.skipUnless(importlib.util.find_spec('pandas'), "needs pandas")
+class TransformListingTest(unittest.TestCase):
+    titles = [
+        'The Way of Kings (The Stormlight Archive, #1) by Brandon  Sanderson 4.65 avg rating — 123,456 ratings',
+        'Stand by Me by Ann\tAuthor 4.1 avg rating — 1,000 ratings',
+        'the way of kings (the stormlight archive, #1) by brandon sanderson 4.6 avg rating — 99 ratings',
+        'No Author Here 3.2 avg rating — 10 ratings',
+        ' by Orphan 4.0 avg rating — 5 ratings',
+        '  Multi\nline   by Writer 2.5 avg rating — 7 ratings',
+        '',
+    ]
+
+    def test_matches_per_record_parsing(self):
+        import numpy as np
+        import pandas as pd
+
+        books = transform_listing(pd.DataFrame({'title': self.titles}), 'fantasy', np.random.default_rng(0))
+
+        rng = random.Random(0)
+        expected = [normalize_record(parse_record({'title': title}), 'fantasy', rng) for title in self.titles]
+        self.assertEqual(books.index.tolist(), [0, 1, 3, 4, 5])  # 2 duplicates 0 ignoring case, 6 has no name
+        self.assertEqual(books[['name', 'author']].values.tolist(),
+                         [list(expected[i][:2]) for i in books.index])
+        self.assertEqual(books['author'].tolist()[:2], ['Brandon Sanderson', 'Ann Author'])
+        self.assertIsNone(books.loc[3, 'author'])
+        self.assertTrue(books['num_pages'].between(300, 900).all())
+        self.assertEqual(set(books['category']), {'fantasy'})
+
+    def test_rows_are_database_ready(self):
+        import pandas as pd
+
+        books = transform_listing(pd.DataFrame({'title': ['Dune by Frank Herbert 4.3', 'Untitled 1.0']}))
+        rows = list(books.itertuples(index=False, name=None))
+        self.assertEqual([row[:2] for row in rows], [('Dune', 'Frank Herbert'), ('Untitled 1.0', None)])
+        self.assertIsInstance(rows[0][0], str)
+        self.assertIsInstance(rows[0][2], int)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import unittest
+import importlib.util
+
+HAS_QT = importlib.util.find_spec('PyQt5') is not None
+
+
+class PendingExecutor:
+    """Takes page fetches and never runs them, so their rows stay placeholders"""
+
+    class Task:
+        def cancel(self):
+            pass
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, operation, func, *args, on_result=None, on_error=None, channel=None, interruptible=False):
+        self.submitted.append((operation, args))
+        return self.Task()
+
+
+@unittest.skipUnless(HAS_QT, "needs PyQt5")
+class RowKeysTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        self.books = [(book_id, f'Book {book_id}') for book_id in range(1, 101)]
+        self.fetches = []
+
+    def fetch_page(self, after, offset, limit):
+        self.fetches.append(after)
+        start = 0 if after is None else next(i for i, row in enumerate(self.books) if row[0] == after) + 1
+        return self.books[start:start + limit]
+
+    def model(self, executor=None):
+        from modules.models import BookTableModel
+
+        model = BookTableModel(self.fetch_page, len(self.books), page_size=10, max_cached_pages=2,
+                               executor=executor)
+        while model.canFetchMore():
+            model.fetchMore()
+        return model
+
+    def test_selection_wider_than_the_cache(self):
+        model = self.model()
+        self.assertEqual(model.rowCount(), 100)
+        self.assertEqual(len(model._pages), 2)  # Only the last two pages are still cached
+
+        self.fetches.clear()
+        keys = model.row_keys(list(range(100)))
+        self.assertEqual(self.fetches, [])  # Nothing is fetched until the function is called
+        self.assertEqual(keys(), [book[0] for book in self.books])
+        self.assertEqual(len(self.fetches), 8)  # One fetch per evicted page
+
+    def test_rows_still_loading(self):
+        executor = PendingExecutor()
+        model = self.model(executor)
+        self.assertEqual(model.rowCount(), 10)  # Placeholders of the first page, its fetch never returns
+        self.assertIsNone(model.row_data(3))
+        self.assertEqual(model.row_keys([3, 7])(), [4, 8])
+
+    def test_rows_gone_from_the_source(self):
+        model = self.model()
+        keys = model.row_keys([0, 55, 99])
+        del self.books[50:]
+        self.assertEqual(keys(), [1, 100])  # Row 55 is gone, 99 was still cached as shown
+
+    def test_selected_keys_of_a_table(self):
+        from PyQt5.QtCore import QItemSelection, QItemSelectionModel
+        from PyQt5.QtWidgets import QTableView
+        from modules.library import get_selected_keys
+
+        view = QTableView()
+        self.assertIsNone(get_selected_keys(view))
+        model = self.model()
+        view.setModel(model)
+        self.assertIsNone(get_selected_keys(view))
+
+        selection = QItemSelection(model.index(5, 0), model.index(94, 0))
+        view.selectionModel().select(selection, QItemSelectionModel.Select | QItemSelectionModel.Rows)
+        self.assertEqual(get_selected_keys(view)(), list(range(6, 96)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+import importlib.util
+from unittest import mock
+from modules.database import DatabaseManager
+
+HAS_SCIPY = importlib.util.find_spec('numpy') is not None and importlib.util.find_spec('scipy') is not None
+
+
+@unittest.skipUnless(HAS_SCIPY, "needs numpy and scipy")
+class RecommenderTest(unittest.TestCase):
+    def setUp(self):
+        from modules.recommend import Recommender
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        self.db_manager.create_tables()
+        self.db_manager.add_records('users', [(f'{name}@example.com', 'x') for name in ('ann', 'bob', 'cat', 'dan')])
+        self.db_manager.add_records('books', [(1, 'Dune', 'Frank Herbert', 412, 'Paperback', 'scifi'),
+                                              (2, 'Dune Messiah', 'Frank Herbert', 256, 'Paperback', 'scifi'),
+                                              (3, 'Neuromancer', 'William Gibson', 271, 'Paperback', 'scifi'),
+                                              (4, 'Dracula', 'Bram Stoker', 418, 'Hardback', 'horror'),
+                                              (5, 'Carrie', 'Stephen King', 199, 'Paperback', 'horror'),
+                                              (6, 'Emma', 'Jane Austen', 474, 'Hardback', 'classics')])
+        self.add_favorites([('ann', 1), ('ann', 3), ('bob', 1), ('bob', 3), ('bob', 4), ('cat', 4), ('cat', 5),
+                            ('dan', 1)])
+        self.recommender = Recommender(self.db_manager)
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def add_favorites(self, favorites: list) -> None:
+        self.db_manager.add_records('favorites', [(f'{name}@example.com', book_id) for name, book_id in favorites])
+
+    def recommendations(self) -> dict:
+        """Returns the recommended book ids of every user, best first, as stored in the recommendations table"""
+        recommended = {}
+        with self.db_manager.connection() as conn:
+            rows = conn.execute("SELECT email, rank, book_id FROM recommendations ORDER BY email, rank")
+            for email, rank, book_id in rows:
+                books = recommended.setdefault(email.split('@')[0], [])
+                self.assertEqual(rank, len(books) + 1)
+                books.append(book_id)
+        return recommended
+
+    def test_build(self):
+        self.assertEqual(self.recommender.build(), 4)
+        self.assertEqual(self.recommendations(), {
+            'ann': [4, 2],  # Favored with Dune and Neuromancer by bob, and another book by Frank Herbert
+            'bob': [5, 2],
+            'cat': [1, 3],
+            'dan': [3, 4, 2],  # Neuromancer is favored with Dune by two users
+        })
+        scores = self.db_manager.search('recommendations', ['score'], {'email': 'dan@example.com'})
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_refresh_recomputes_users_whose_favorites_changed(self):
+        self.recommender.build()
+        model = self.recommender.model
+        self.assertEqual(self.recommender.refresh(), 0)
+
+        self.add_favorites([('dan', 3)])
+        with mock.patch('modules.recommend.REBUILD_FRACTION', 0.5):  # One user of four doesn't rebuild
+            self.assertEqual(self.recommender.refresh(), 1)
+        self.assertIs(self.recommender.model, model)
+        recommended = self.recommendations()
+        self.assertEqual(recommended['dan'], [4, 2])  # Neuromancer is a favorite now
+        self.assertEqual(recommended['ann'], [4, 2])
+
+        self.db_manager.delete_rows('favorites', ['email', 'book_id'], [('dan@example.com', 1)])
+        self.assertEqual(self.recommender.refresh(), 4)  # One user of four is over REBUILD_FRACTION
+        self.assertIsNot(self.recommender.model, model)
+
+    def test_book_changes_rebuild(self):
+        self.recommender.build()
+        self.db_manager.update('books', {'author': 'Frank Herbert'}, {'book_id': 3})
+        self.assertEqual(self.recommender.refresh(), 4)
+        self.assertEqual(self.recommendations()['cat'], [1, 3])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import os
+import json
+import queue
+import asyncio
+import base64
+import tempfile
+import threading
+import unittest
+from benchmarks.synthetic import build_catalog
+from modules.server import Api, WriteClient, apply_writes, encode_cursor, parse_book_ids, serve_connection
+from modules.services import LibraryService
+
+
+def raw_cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+
+class ApiTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = build_catalog(os.path.join(self.tmp.name, 'library.db'), 30)
+        self.db_manager.add_records('users', [('ann@example.com', 'x')])
+        self.db_manager.add_records('favorites', [('ann@example.com', book_id) for book_id in range(1, 11)])
+        self.api = Api(LibraryService(self.db_manager), writes=None)  # Only reads are requested
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def get(self, target: str) -> tuple:
+        """Returns the status and JSON body of a GET request answered by serve_connection"""
+        return self.request('GET', target)
+
+    def request(self, method: str, target: str, payload=None, writer_process=None) -> tuple:
+        """Returns the status and JSON body of a request answered by serve_connection. With writer_process,
+        favorites changes go through a WriteClient to writer_process(write_queue, reply_queue) on a thread"""
+        body = b'' if payload is None else json.dumps(payload).encode()
+
+        async def request():
+            write_queue, reply_queue = queue.Queue(), queue.Queue()
+            if writer_process is not None:
+                self.api.writes = WriteClient(0, write_queue, reply_queue, asyncio.get_running_loop(), timeout=0.2)
+                threading.Thread(target=writer_process, args=(write_queue, reply_queue), daemon=True).start()
+            server = await asyncio.start_server(lambda reader, writer: serve_connection(self.api, reader, writer),
+                                                '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            response = await reader.read()
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            write_queue.put(None)
+            reply_queue.put(None)  # Stops the WriteClient's reply thread
+            return response
+
+        head, _, body = asyncio.run(request()).partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(body)
+
+    def apply_writes(self, write_queue, reply_queue) -> None:
+        """Stands in for the writer process, applying one change at a time"""
+        for change in iter(write_queue.get, None):
+            (result, error), = apply_writes(self.api.service, [change])
+            reply_queue.put((change[1], result, error))
+
+    def test_pages_with_cursors(self):
+        status, page = self.get('/books?sort=author&limit=20')
+        self.assertEqual(status, 200)
+        status, rest = self.get(f"/books?sort=author&limit=20&cursor={page['next_cursor']}")
+        self.assertEqual(status, 200)
+        self.assertEqual(len(page['books']) + len(rest['books']), 30)
+
+        status, favorites = self.get(f"/users/ann@example.com/favorites?limit=5&cursor={encode_cursor(5)}")
+        self.assertEqual([book['book_id'] for book in favorites['books']], [6, 7, 8, 9, 10])
+
+    def test_invalid_cursors_are_bad_requests(self):
+        for target in ('/books?cursor=%25%25', f"/books?cursor={raw_cursor('7')}",
+                       f"/books?cursor={raw_cursor([1, 2])}", f"/books?sort=author&cursor={raw_cursor(7)}",
+                       f"/books?sort=author&cursor={raw_cursor(['Ann'])}",
+                       f"/books?sort=author&cursor={raw_cursor(['Ann', 'x'])}",
+                       f"/books?sort=author&cursor={raw_cursor([['Ann'], 3])}",
+                       f"/books?sort=author&cursor={raw_cursor({'a': 1})}",
+                       f"/users/ann@example.com/favorites?cursor={raw_cursor('5')}",
+                       f"/users/ann@example.com/favorites?cursor={raw_cursor([5])}",
+                       f"/users/ann@example.com/favorites?cursor={raw_cursor(True)}"):
+            with self.subTest(target=target):
+                status, body = self.get(target)
+                self.assertEqual(status, 400)
+                self.assertEqual(body['error'], "Invalid cursor")
+
+    def test_favorites_changes_go_through_the_writer(self):
+        status, body = self.request('POST', '/users/ann@example.com/favorites', {'book_ids': [10, 11, 12]},
+                                    self.apply_writes)
+        self.assertEqual((status, body), (200, {'added': 2}))
+        status, body = self.request('DELETE', '/users/ann@example.com/favorites', {'book_ids': [1, 2]},
+                                    self.apply_writes)
+        self.assertEqual((status, body), (200, {'removed': 2}))
+
+    def test_writer_not_replying_is_unavailable(self):
+        status, body = self.request('POST', '/users/ann@example.com/favorites', {'book_ids': [11]},
+                                    lambda write_queue, reply_queue: None)
+        self.assertEqual(status, 503)
+        self.assertIn("writer", body['error'])
+
+    def test_book_ids_must_be_integers(self):
+        self.assertEqual(parse_book_ids(b'{"book_ids": [1, 2]}'), [1, 2])
+        for body in (b'{"book_ids": [true]}', b'{"book_ids": [1, false]}', b'{"book_ids": [1.5]}',
+                     b'{"book_ids": "1"}', b'{}', b'[1]', b'not json'):
+            with self.subTest(body=body), self.assertRaises(ValueError):
+                parse_book_ids(body)
+        status, body = self.request('POST', '/users/ann@example.com/favorites', {'book_ids': [True]},
+                                    self.apply_writes)
+        self.assertEqual((status, body), (400, {'error': "book_ids must be a list of integers"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
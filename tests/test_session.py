@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from modules.database import DatabaseManager
+from modules.session import Session, config_dir
+
+
+class SessionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'config', 'session.json')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_restores_the_last_active_user(self):
+        session = Session(self.path)
+        session.login('ann@example.com')
+        session.current_view = 'favorite_books'
+        session.login('bob@example.com')
+        session.flush()
+
+        restored = Session(self.path)
+        self.assertEqual(restored.restore(), 'bob@example.com')
+        self.assertEqual(restored.last_email, 'bob@example.com')
+        self.assertEqual(restored.users, [])  # Restoring doesn't log anyone in
+        self.assertEqual(restored.email, '')
+
+    def test_restore_without_a_saved_session(self):
+        self.assertEqual(Session(self.path).restore(), '')
+
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'w') as file:
+            file.write('not json')
+        with self.assertLogs(level='WARNING'):
+            self.assertEqual(Session(self.path).restore(), '')
+
+    def test_saves_to_the_config_directory(self):
+        with mock.patch.dict(os.environ, {'LIBRARY_CONFIG_DIR': self.tmp.name}):
+            self.assertEqual(config_dir(), self.tmp.name)
+            session = Session()
+            session.login('ann@example.com')
+            session.flush()
+        self.assertEqual(session.path, os.path.join(self.tmp.name, 'session.json'))
+        self.assertTrue(os.path.exists(session.path))
+
+    def test_restores_from_the_sessions_table(self):
+        db_manager = DatabaseManager(os.path.join(self.tmp.name, 'library.db'))
+        db_manager.create_tables()
+        db_manager.add_records('users', [('ann@example.com', 'x'), ('bob@example.com', 'x')])
+        session = Session(db_manager=db_manager)
+        session.login('bob@example.com')
+        session.login('ann@example.com')
+        session.flush()
+        self.assertEqual(Session(db_manager=db_manager).restore(), 'ann@example.com')
+        db_manager.pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
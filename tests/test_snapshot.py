@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks.synthetic import build_catalog
+from modules.snapshot import CatalogSnapshot
+
+
+class RefreshTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = build_catalog(os.path.join(self.tmp.name, 'library.db'), 500)
+        self.db_manager.add_records('users', [('ann@example.com', 'x')])
+        self.snapshot = CatalogSnapshot(self.db_manager)
+        self.snapshot.build()
+
+    def tearDown(self):
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def test_writes_to_other_tables_keep_the_snapshot(self):
+        ranks = self.snapshot.ranks('author')
+        version = self.snapshot.version
+        self.db_manager.add_records('favorites', [('ann@example.com', 1), ('ann@example.com', 2)])
+
+        with mock.patch.object(self.db_manager, 'count_rows') as count_rows, \
+                mock.patch.object(self.db_manager, 'iter_rows') as iter_rows:
+            self.assertFalse(self.snapshot.refresh())
+        count_rows.assert_not_called()
+        iter_rows.assert_not_called()
+        self.assertEqual(self.snapshot.version, version)
+        self.assertEqual(self.snapshot.counter, self.db_manager.change_counter)
+        self.assertIs(self.snapshot.ranks('author'), ranks)
+
+    def test_books_writes_change_the_snapshot(self):
+        version = self.snapshot.version
+        self.db_manager.update('books', {'author': 'Ann Other'}, {'book_id': 3})
+        self.assertTrue(self.snapshot.refresh())
+        self.assertGreater(self.snapshot.version, version)
+        self.assertEqual(self.snapshot.author(self.snapshot.ids.index(3)), 'Ann Other')
+
+        self.db_manager.add_records('books', [(501, 'New Book', 'New Author', 100, 'Paperback', 'poetry')])
+        self.assertTrue(self.snapshot.refresh())
+        self.assertEqual(len(self.snapshot), 501)
+
+
+if __name__ == '__main__':
+    unittest.main()
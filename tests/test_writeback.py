@@ -0,0 +1,64 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+from benchmarks.synthetic import build_catalog
+from modules import metrics
+from modules.writeback import FavoritesWriteQueue
+
+
+class FlushTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_manager = build_catalog(os.path.join(self.tmp.name, 'library.db'), 100)
+        self.db_manager.add_records('users', [('ann@example.com', 'x'), ('bob@example.com', 'x')])
+        self.queue = FavoritesWriteQueue(self.db_manager, flush_interval=60)  # Flushed by the tests only
+
+    def tearDown(self):
+        self.queue.close()
+        self.db_manager.pool.close()
+        self.tmp.cleanup()
+
+    def favorites(self) -> list:
+        return sorted(self.db_manager.load_data('favorites'))
+
+    def test_locked_database_queues_the_changes_again(self):
+        self.queue.add('ann@example.com', [1, 2])
+        locked = sqlite3.OperationalError("database is locked")
+        with mock.patch.object(self.db_manager, 'add_records', side_effect=locked):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.queue.flush()
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.changes('ann@example.com'), {1: True, 2: True})
+
+        self.queue.remove('ann@example.com', [2])  # Made meanwhile, wins over the queued add
+        self.assertEqual(self.queue.flush(), 2)
+        self.assertEqual(self.favorites(), [('ann@example.com', 1)])
+
+    def test_failing_changes_are_dropped(self):
+        add_records = self.db_manager.add_records
+
+        def reject_book_99(table_name, rows, on_conflict='IGNORE'):
+            rows = list(rows)
+            if any(book_id == 99 for _, book_id in rows):
+                raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+            return add_records(table_name, rows, on_conflict)
+
+        metrics.REGISTRY.reset()
+        self.queue.add('ann@example.com', [1, 99])
+        self.queue.add('bob@example.com', [3])
+        with mock.patch.object(metrics.REGISTRY, 'enabled', True), \
+                mock.patch.object(self.db_manager, 'add_records', side_effect=reject_book_99), \
+                self.assertLogs(level='ERROR') as logs:
+            self.assertEqual(self.queue.flush(), 2)
+        self.assertIn('book 99', logs.output[0])
+        self.assertEqual(metrics.REGISTRY.counters.get('favorites.dropped'), 1)
+        self.assertEqual(len(self.queue), 0)
+        self.assertEqual(self.queue.changes('ann@example.com'), {})
+        self.assertEqual(self.favorites(), [('ann@example.com', 1), ('bob@example.com', 3)])
+        self.assertEqual(self.queue.flush(), 0)  # Not retried
+
+
+if __name__ == '__main__':
+    unittest.main()